@@ -35,7 +35,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'restaurants.tracing.TracingMiddleware',
+    'restaurants.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'restaurants.middleware.AdmissionControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -107,7 +110,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'restaurants.tracing.TracedJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -125,5 +128,139 @@ CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only in development
 # Custom SQLAlchemy integration - PostGIS Support
 SQLALCHEMY_DATABASE_URL = f"postgresql+psycopg2://{os.getenv('DB_USER', 'postgres')}:{os.getenv('DB_PASSWORD', '')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'restaurant_search_app')}"
 
+# Read replicas for search traffic (comma separated SQLAlchemy URLs)
+SQLALCHEMY_READ_REPLICA_URLS = [url.strip() for url in os.getenv('DB_READ_REPLICA_URLS', '').split(',') if url.strip()]
+READ_REPLICA_STRATEGY = os.getenv('DB_READ_REPLICA_STRATEGY', 'round_robin')  # round_robin / least_connections
+READ_REPLICA_RETRY_SECONDS = float(os.getenv('DB_READ_REPLICA_RETRY_SECONDS', '30'))
+
+# Search payload mode: 'live' (ORM + to_dict) / 'materialized' (restaurant_search_payloads)
+SEARCH_PAYLOAD_MODE = os.getenv('SEARCH_PAYLOAD_MODE', 'live')
+SEARCH_PAYLOAD_REFRESH_OVERLAP_SECONDS = int(os.getenv('SEARCH_PAYLOAD_REFRESH_OVERLAP_SECONDS', '300'))
+
+# LISTEN/NOTIFY change listener for in-process caches (database/change_notifications.sql)
+CHANGE_LISTENER_ENABLED = os.getenv('CHANGE_LISTENER_ENABLED', 'False').lower() == 'true'
+
+# Memory-mapped spatial index snapshot (python manage.py build_spatial_snapshot)
+SPATIAL_SNAPSHOT_PATH = os.getenv('SPATIAL_SNAPSHOT_PATH', '')
+SPATIAL_SNAPSHOT_RELOAD_CHECK_SECONDS = float(os.getenv('SPATIAL_SNAPSHOT_RELOAD_CHECK_SECONDS', '5'))
+# 変更通知を受信していない場合に、構築済みスナップショットを使う最大秒数（超えたらDBで応答）
+SPATIAL_SNAPSHOT_MAX_AGE = int(os.getenv('SPATIAL_SNAPSHOT_MAX_AGE', '300'))
+
+# Single-flight coalescing of identical concurrent spatial lookups
+COALESCING_ENABLED = os.getenv('COALESCING_ENABLED', 'True').lower() == 'true'
+COALESCE_COORDINATE_PRECISION = int(os.getenv('COALESCE_COORDINATE_PRECISION', '6'))  # 小数6桁 ≒ 0.1m
+
+# Admission control / load shedding per URL name (restaurants.middleware.AdmissionControlMiddleware)
+ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'True').lower() == 'true'
+ADMISSION_CONTROL_RETRY_AFTER = int(os.getenv('ADMISSION_CONTROL_RETRY_AFTER', '1'))  # seconds
+
+_SEARCH_LIMITS = {
+    'max_concurrent': int(os.getenv('ADMISSION_MAX_CONCURRENT', '16')),
+    'max_queue': int(os.getenv('ADMISSION_MAX_QUEUE', '32')),
+    'queue_timeout': float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '0.5')),  # seconds
+}
+ADMISSION_CONTROL_LIMITS = {
+    'search_building_by_location': _SEARCH_LIMITS,
+    'search_buildings_near_location': {**_SEARCH_LIMITS, 'max_concurrent': max(1, _SEARCH_LIMITS['max_concurrent'] // 2)},
+    'search_buildings_with_restaurants': _SEARCH_LIMITS,
+    'search_restaurant': _SEARCH_LIMITS,
+    'search_by_location': {**_SEARCH_LIMITS, 'max_concurrent': max(1, _SEARCH_LIMITS['max_concurrent'] // 2)},
+    'search_restaurant_clusters': _SEARCH_LIMITS,
+    'search_tap': _SEARCH_LIMITS,
+    'search_viewport': _SEARCH_LIMITS,
+    'search_restaurants_along_route': {**_SEARCH_LIMITS, 'max_concurrent': max(1, _SEARCH_LIMITS['max_concurrent'] // 2)},
+}
+
+# osm_buildings partitioned by region cell (database/osm_buildings_partitioning.sql)
+OSM_BUILDINGS_PARTITIONED = os.getenv('OSM_BUILDINGS_PARTITIONED', 'False').lower() == 'true'
+OSM_REGION_CELL_MARGIN = float(os.getenv('OSM_REGION_CELL_MARGIN', '0.01'))  # degrees, 建物の代表点からの最大距離
+OSM_REGION_CELL_MAX_PER_QUERY = int(os.getenv('OSM_REGION_CELL_MAX_PER_QUERY', '16'))
+
+# Request tracing (OpenTelemetry)
+# 有効時は view → Service → Repository → SQL の各層のスパンを出力する
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'False').lower() == 'true'
+TRACING_SERVICE_NAME = os.getenv('TRACING_SERVICE_NAME', 'restaurant-search')
+# 'console'（標準出力）または 'file'
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'console')
+TRACING_FILE_PATH = os.getenv('TRACING_FILE_PATH', str(BASE_DIR / 'traces.jsonl'))
+# ルートスパンのサンプリング率（0.0～1.0）
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', '1.0'))
+
+# On-demand request profiling
+# 署名付きヘッダー（restaurants.profiling.make_profile_token() で発行）またはサンプリング率で対象リクエストを選ぶ
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILING_HEADER = os.getenv('PROFILING_HEADER', 'X-Profile-Token')
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', '86400'))
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.0'))
+PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', '0.005'))
+PROFILING_TRACEMALLOC_FRAMES = int(os.getenv('PROFILING_TRACEMALLOC_FRAMES', '1'))
+PROFILING_TOP_ALLOCATIONS = int(os.getenv('PROFILING_TOP_ALLOCATIONS', '20'))
+PROFILING_OUTPUT_DIR = os.getenv('PROFILING_OUTPUT_DIR', str(BASE_DIR / 'profiles'))
+
+# Server-side prepared statements for hot repository queries
+# PgBouncer のトランザクションプーリング等、コネクションを共有するプロキシ経由では無効にする
+PREPARED_STATEMENTS_ENABLED = os.getenv('PREPARED_STATEMENTS_ENABLED', 'True').lower() == 'true'
+
+# Nearest restaurant lookup mode
+# 'scan'（既定）: 距離順の検索 / 'voronoi': database/restaurant_voronoi_cells.sql のセルで点包含判定（未構築時は scan）
+NEAREST_RESTAURANT_MODE = os.getenv('NEAREST_RESTAURANT_MODE', 'scan')
+
+# Combined tap search (POST /api/search/tap/)
+# サブクエリを並行実行するスレッド数（1タップで最大2接続を同時に使うため、DBプールの大きさと合わせて調整する）
+# 受付制御で同時実行できるタップ数 × 2 を下回るとサブクエリがプールの空き待ちになるため、それ以上にする
+TAP_SEARCH_MAX_WORKERS = max(
+    int(os.getenv('TAP_SEARCH_MAX_WORKERS', '0')),
+    2 * ADMISSION_CONTROL_LIMITS['search_tap']['max_concurrent']
+)
+
+# SQLAlchemy connection pool (engine ごと・ワーカープロセスごと)
+# タップ検索のサブクエリ（TAP_SEARCH_MAX_WORKERS）と受付済みリクエストのセッションが同時に接続を持てる大きさを下限とし、
+# 足りない分は max_overflow で補う（PostgreSQL の max_connections はワーカー数 × (pool_size + max_overflow) を見込む）
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = max(
+    int(os.getenv('DB_MAX_OVERFLOW', '10')),
+    TAP_SEARCH_MAX_WORKERS + _SEARCH_LIMITS['max_concurrent'] - DB_POOL_SIZE
+)
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # seconds
+
+# Viewport diff (POST /api/search/viewport/)
+VIEWPORT_MAX_SPAN_DEGREES = float(os.getenv('VIEWPORT_MAX_SPAN_DEGREES', '0.2'))
+VIEWPORT_TOKEN_MAX_AGE = int(os.getenv('VIEWPORT_TOKEN_MAX_AGE', '3600'))  # seconds
+# トークンの時刻からこの秒数だけ遡って更新を確認（取得中にコミットされた更新の取りこぼし防止）
+VIEWPORT_UPDATE_OVERLAP_SECONDS = int(os.getenv('VIEWPORT_UPDATE_OVERLAP_SECONDS', '60'))
+
+# Route corridor search (POST /api/search/route/, database/restaurant_route_index.sql)
+ROUTE_MAX_POINTS = int(os.getenv('ROUTE_MAX_POINTS', '500'))
+ROUTE_SEARCH_MAX_RESULTS = int(os.getenv('ROUTE_SEARCH_MAX_RESULTS', '200'))
+
+# Negative cache for building lookups (restaurants/building_coverage.py)
+# 建物bboxが重ならない細かいグリッドセルへのタップはDBに問い合わせずに「建物なし」を返す
+BUILDING_COVERAGE_ENABLED = os.getenv('BUILDING_COVERAGE_ENABLED', 'False').lower() == 'true'
+# セル一辺 360/2^20 ≒ 0.00034度（約35m）。建物1件がおおむね1〜4セルに重なり、1セルあたり約75バイト（dictの1エントリ）を
+# 各ワーカーが保持する（100万棟で約150〜300MB）。1つ上げるとセル数・メモリはおよそ2〜4倍になる
+BUILDING_COVERAGE_LEVEL = int(os.getenv('BUILDING_COVERAGE_LEVEL', '20'))
+# 変更通知を受信していない場合に、構築済みカバレッジを使う最大秒数（超えたら再構築）
+BUILDING_COVERAGE_MAX_AGE = int(os.getenv('BUILDING_COVERAGE_MAX_AGE', '300'))
+
+# Per-endpoint query deadlines (restaurants/query_deadlines.py)
+# URL名ごとの statement_timeout（ミリ秒）。超過時は直近の同条件の結果を stale 付きで返し、なければ 503
+QUERY_DEADLINES_ENABLED = os.getenv('QUERY_DEADLINES_ENABLED', 'True').lower() == 'true'
+QUERY_DEADLINES_MS = {
+    'search_by_location': int(os.getenv('QUERY_DEADLINE_LOCATION_MS', '800')),
+    'search_buildings_near_location': int(os.getenv('QUERY_DEADLINE_NEARBY_MS', '800')),
+    'search_restaurants_along_route': int(os.getenv('QUERY_DEADLINE_ROUTE_MS', '1500')),
+}
+QUERY_DEADLINE_RETRY_AFTER = int(os.getenv('QUERY_DEADLINE_RETRY_AFTER', '2'))  # seconds
+QUERY_DEADLINE_STALE_CACHE_SIZE = int(os.getenv('QUERY_DEADLINE_STALE_CACHE_SIZE', '1024'))
+QUERY_DEADLINE_STALE_MAX_AGE = int(os.getenv('QUERY_DEADLINE_STALE_MAX_AGE', '600'))  # seconds
+
+# Precomputed service-area coverage (python manage.py build_service_area)
+# データのあるグリッドセル（一辺 360/2^SERVICE_AREA_LEVEL 度、既定で約0.088度）の外の座標はDBに問い合わせない
+SERVICE_AREA_PATH = os.getenv('SERVICE_AREA_PATH', '')
+SERVICE_AREA_LEVEL = int(os.getenv('SERVICE_AREA_LEVEL', '12'))
+SERVICE_AREA_RELOAD_CHECK_SECONDS = float(os.getenv('SERVICE_AREA_RELOAD_CHECK_SECONDS', '5'))
+# 変更通知を受信していない場合に、構築済みの範囲データで判定する最大秒数（超えたら判定しない＝全座標をDBへ）
+SERVICE_AREA_MAX_AGE = int(os.getenv('SERVICE_AREA_MAX_AGE', '3600'))
+
 # Backup MySQL connection for migration
 SQLALCHEMY_MYSQL_URL = f"mysql+pymysql://{os.getenv('MYSQL_DB_USER', 'root')}:{os.getenv('MYSQL_DB_PASSWORD', '')}@{os.getenv('MYSQL_DB_HOST', 'localhost')}:{os.getenv('MYSQL_DB_PORT', '3306')}/{os.getenv('MYSQL_DB_NAME', 'restaurant_search_app')}?charset=utf8mb4"
\ No newline at end of file
@@ -1,6 +1,18 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
 class RestaurantsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'restaurants'
\ No newline at end of file
+    name = 'restaurants'
+    
+    def ready(self):
+        from .tracing import configure_tracing
+        configure_tracing()
+        
+        # 各ワーカーでインメモリキャッシュ・インデックスへの変更通知受信を開始（管理コマンドでは起動しない）
+        from .change_listener import is_serving_process, start_change_listener
+        if is_serving_process(sys.argv, os.environ):
+            start_change_listener()
@@ -0,0 +1,187 @@
+"""
+Negative cache for building lookups
+建物のbboxが1つも重ならない細かいグリッドセル（geo_cells のレベル BUILDING_COVERAGE_LEVEL）を
+「建物なし」と判定し、道路・公園などへのタップをDBに問い合わせずに返す
+
+セルごとに重なる建物数を保持し、変更通知（change_listener）の建物bboxで差分更新する。
+bboxは建物形状を必ず含むため、「建物なし」の判定は保守的（誤って建物を見落とさない）。
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from sqlalchemy import text
+
+from .change_listener import RESYNC, ChangeEvent, get_change_listener, register_change_handler
+from .geo_cells import cell_for_point
+
+logger = logging.getLogger(__name__)
+
+BUILDING_BBOX_QUERY = text("""
+    SELECT ST_YMin(geometry), ST_XMin(geometry), ST_YMax(geometry), ST_XMax(geometry)
+    FROM osm_buildings
+""")
+
+
+class BuildingCoverage:
+    """
+    セル → 重なる建物数
+    構築中に届いた変更は構築完了後に適用する
+    """
+    
+    def __init__(self, level: int):
+        self.level = level
+        self.counts: Dict[int, int] = {}
+        self.built_at: Optional[float] = None
+        self.building = False
+        self.hits = 0
+        self.misses = 0
+        self._pending: List[Tuple[Tuple[float, float, float, float], int]] = []
+        self._lock = threading.Lock()
+    
+    def _key(self, cell_x: int, cell_y: int) -> int:
+        return (cell_y << 32) | cell_x
+    
+    def _cells(self, bbox: Tuple[float, float, float, float]) -> Iterable[int]:
+        south, west, north, east = bbox
+        x_min, y_min = cell_for_point(south, west, self.level)
+        x_max, y_max = cell_for_point(north, east, self.level)
+        for cell_y in range(y_min, y_max + 1):
+            for cell_x in range(x_min, x_max + 1):
+                yield self._key(cell_x, cell_y)
+    
+    def _apply(self, counts: Dict[int, int], bbox: Tuple[float, float, float, float], delta: int) -> None:
+        for key in self._cells(bbox):
+            count = counts.get(key, 0) + delta
+            if count > 0:
+                counts[key] = count
+            else:
+                counts.pop(key, None)
+    
+    def is_usable(self) -> bool:
+        """
+        判定に使えるか
+        変更通知を受信中なら常に最新、受信していない場合は構築から BUILDING_COVERAGE_MAX_AGE 秒以内のみ
+        """
+        if self.built_at is None:
+            return False
+        
+        listener = get_change_listener()
+        if listener is not None and listener.connected:
+            return True
+        return time.time() - self.built_at < settings.BUILDING_COVERAGE_MAX_AGE
+    
+    def is_empty(self, lat: float, lng: float) -> bool:
+        """座標のセルに建物が1つも重ならない（= 建物なし確定）"""
+        cell_x, cell_y = cell_for_point(lat, lng, self.level)
+        empty = self._key(cell_x, cell_y) not in self.counts
+        if empty:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return empty
+    
+    def rebuild(self, db) -> int:
+        """
+        全建物のbboxから再構築
+        構築中に届いた変更は追加分のみ反映する（走査結果に既に含まれる削除を二重に引くと
+        建物のあるセルを「建物なし」と誤判定し得るため。追加の二重計上は保守側に倒れるだけ）
+        """
+        counts: Dict[int, int] = {}
+        result = db.execute(BUILDING_BBOX_QUERY, execution_options={'yield_per': 10000})
+        for south, west, north, east in result:
+            self._apply(counts, (south, west, north, east), 1)
+        
+        with self._lock:
+            for bbox, delta in self._pending:
+                if delta > 0:
+                    self._apply(counts, bbox, delta)
+            self._pending = []
+            self.counts = counts
+            self.built_at = time.time()
+        
+        return len(counts)
+    
+    def on_building_change(self, event: ChangeEvent) -> None:
+        if event.op == RESYNC:
+            # 取りこぼしの可能性があるため作り直す
+            schedule_rebuild(force=True)
+            return
+        
+        with self._lock:
+            for values, delta in ((event.old, -1), (event.new, 1)):
+                if not values or not values.get('bbox'):
+                    continue
+                bbox = tuple(values['bbox'])
+                if self.building:
+                    self._pending.append((bbox, delta))
+                if self.built_at is not None:
+                    self._apply(self.counts, bbox, delta)
+    
+    def status(self) -> Dict[str, Any]:
+        """ヘルスチェック用"""
+        return {
+            'level': self.level,
+            'occupiedCells': len(self.counts),
+            'builtAt': self.built_at,
+            'usable': self.is_usable(),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+_coverage = BuildingCoverage(settings.BUILDING_COVERAGE_LEVEL)
+register_change_handler('osm_buildings', _coverage.on_building_change)
+
+
+def _rebuild_in_background() -> None:
+    # リードレプリカの遅延分を取りこぼさないよう、構築はプライマリから読む
+    from .models import get_primary_db_session
+    
+    db = next(get_primary_db_session())
+    try:
+        started = time.perf_counter()
+        cells = _coverage.rebuild(db)
+        logger.info(f"Building coverage built: {cells} occupied cells in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        logger.error(f"Building coverage build error: {str(e)}")
+    finally:
+        db.close()
+        with _coverage._lock:
+            _coverage.building = False
+
+
+def schedule_rebuild(force: bool = False) -> None:
+    """バックグラウンドで（再）構築（構築中は何もしない）"""
+    with _coverage._lock:
+        if _coverage.building:
+            return
+        if not force and _coverage.built_at is not None and _coverage.is_usable():
+            return
+        _coverage.building = True
+        _coverage._pending = []
+    
+    threading.Thread(target=_rebuild_in_background, name='building-coverage', daemon=True).start()
+
+
+def get_building_coverage() -> Optional[BuildingCoverage]:
+    """
+    判定に使えるカバレッジ（BUILDING_COVERAGE_ENABLED 無効時・構築中・期限切れの場合はNone）
+    未構築・期限切れの場合はバックグラウンドで構築を開始する
+    """
+    if not settings.BUILDING_COVERAGE_ENABLED:
+        return None
+    
+    if _coverage.is_usable():
+        return _coverage
+    
+    schedule_rebuild()
+    return None
+
+
+def get_building_coverage_status() -> Optional[Dict[str, Any]]:
+    if not settings.BUILDING_COVERAGE_ENABLED:
+        return None
+    return _coverage.status()
@@ -0,0 +1,240 @@
+"""
+LISTEN/NOTIFY-driven change propagation for in-process caches and indexes
+restaurants / osm_buildings の変更通知（database/change_notifications.sql）を
+各ワーカーのバックグラウンドスレッドで受信し、登録済みハンドラーへ差分として配送する
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+from django.conf import settings
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'restaurant_search_changes'
+
+# 通知を取りこぼした可能性がある場合（再接続時）に配送される操作種別
+RESYNC = 'RESYNC'
+
+
+class ChangeEvent:
+    """
+    1行分の変更通知
+    op: INSERT / UPDATE / DELETE / RESYNC
+    old / new: 変更前後の値（INSERT時のold、DELETE時のnewはNone）
+    """
+    
+    __slots__ = ('table', 'op', 'key', 'old', 'new')
+    
+    def __init__(self, table: str, op: str, key: Optional[str] = None,
+                 old: Optional[Dict[str, Any]] = None, new: Optional[Dict[str, Any]] = None):
+        self.table = table
+        self.op = op
+        self.key = key
+        self.old = old
+        self.new = new
+    
+    @classmethod
+    def from_payload(cls, payload: str) -> 'ChangeEvent':
+        data = json.loads(payload)
+        return cls(data['table'], data['op'], data.get('key'), data.get('old'), data.get('new'))
+    
+    def __repr__(self):
+        return f"<ChangeEvent(table='{self.table}', op='{self.op}', key='{self.key}')>"
+
+
+ChangeHandler = Callable[[ChangeEvent], None]
+
+_handlers: Dict[str, List[ChangeHandler]] = {'restaurants': [], 'osm_buildings': []}
+_handlers_lock = threading.Lock()
+
+
+def register_change_handler(table: str, handler: ChangeHandler) -> None:
+    """
+    テーブルの変更ハンドラーを登録
+    ハンドラーは受信スレッドから呼ばれるため、キャッシュ側でスレッドセーフに差分適用すること
+    """
+    if table not in _handlers:
+        raise ValueError(f"Unknown table for change notifications: {table}")
+    
+    with _handlers_lock:
+        _handlers[table].append(handler)
+
+
+def _handler_table(table: str) -> str:
+    """
+    通知のテーブル名を登録先のテーブル名に読み替える
+    トリガーに親テーブル名を渡していない旧定義では、パーティションの変更がパーティション名
+    （osm_buildings_r<cell>、osm_buildings_p_default）で届くため、親テーブルのハンドラーへ配送する
+    """
+    if table in _handlers:
+        return table
+    for root in _handlers:
+        if table.startswith(f"{root}_"):
+            return root
+    return table
+
+
+def dispatch(event: ChangeEvent) -> None:
+    """登録済みハンドラーへ変更を配送（1つのハンドラーの失敗は他に影響させない）"""
+    with _handlers_lock:
+        handlers = list(_handlers.get(_handler_table(event.table), []))
+    
+    for handler in handlers:
+        try:
+            handler(event)
+        except Exception as e:
+            logger.error(f"Change handler error ({event!r}): {str(e)}")
+
+
+def _connection_params() -> Dict[str, Any]:
+    """SQLAlchemy URL から psycopg2 の接続パラメータを生成（通知はプライマリでのみ受信可能）"""
+    url = make_url(settings.SQLALCHEMY_DATABASE_URL)
+    return url.translate_connect_args(username='user', database='dbname')
+
+
+class ChangeListener(threading.Thread):
+    """
+    LISTEN専用接続を持つデーモンスレッド
+    切断時は再接続し、取りこぼしの可能性を RESYNC イベントで各ハンドラーへ通知する
+    """
+    
+    def __init__(self, poll_timeout: float = 1.0, reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0):
+        super().__init__(name='restaurant-change-listener', daemon=True)
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connected = False
+        self.events_received = 0
+        self.last_event_at: Optional[float] = None
+        self._stop_event = threading.Event()
+    
+    def stop(self) -> None:
+        self._stop_event.set()
+    
+    def run(self) -> None:
+        delay = self.reconnect_delay
+        first_connect = True
+        
+        while not self._stop_event.is_set():
+            try:
+                conn = psycopg2.connect(**_connection_params())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL};')
+                
+                self.connected = True
+                delay = self.reconnect_delay
+                logger.info(f"Listening for changes on channel '{CHANNEL}'")
+                
+                if not first_connect:
+                    # 切断中の通知は失われるため再同期を要求
+                    for table in _handlers:
+                        dispatch(ChangeEvent(table, RESYNC))
+                first_connect = False
+                
+                try:
+                    self._listen(conn)
+                finally:
+                    self.connected = False
+                    conn.close()
+                    
+            except Exception as e:
+                logger.error(f"Change listener error: {str(e)}")
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+    
+    def _listen(self, conn) -> None:
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([conn], [], [], self.poll_timeout)
+            if not readable:
+                continue
+            
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    event = ChangeEvent.from_payload(notify.payload)
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Invalid change notification: {str(e)}")
+                    continue
+                
+                self.events_received += 1
+                self.last_event_at = time.time()
+                dispatch(event)
+    
+    def status(self) -> Dict[str, Any]:
+        """ヘルスチェック用の受信状態"""
+        return {
+            'connected': self.connected,
+            'eventsReceived': self.events_received,
+            'lastEventAt': self.last_event_at
+        }
+
+
+_listener: Optional[ChangeListener] = None
+_listener_pid: Optional[int] = None
+_listener_lock = threading.Lock()
+
+
+def is_serving_process(argv: List[str], environ: Dict[str, str]) -> bool:
+    """
+    リクエストを処理するプロセスか（受信スレッドを起動するか）
+    manage.py の管理コマンド（migrate, loadtest, build_* など）と runserver の自動リロード監視側の親プロセスは対象外
+    """
+    if not argv or not os.path.basename(argv[0]).startswith(('manage.py', 'django-admin')):
+        # gunicorn / uWSGI などのWSGIサーバー
+        return True
+    
+    if len(argv) < 2 or argv[1] != 'runserver':
+        return False
+    
+    return environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+
+
+def start_change_listener() -> Optional[ChangeListener]:
+    """
+    現在のプロセスで受信スレッドを起動（プロセスごとに1つ）
+    CHANGE_LISTENER_ENABLED が無効の場合は何もしない
+    """
+    global _listener, _listener_pid
+    
+    if not settings.CHANGE_LISTENER_ENABLED:
+        return None
+    
+    with _listener_lock:
+        if _listener is not None and _listener_pid == os.getpid() and _listener.is_alive():
+            return _listener
+        
+        _listener = ChangeListener()
+        _listener_pid = os.getpid()
+        _listener.start()
+        return _listener
+
+
+def get_change_listener() -> Optional[ChangeListener]:
+    """現在のプロセスの受信スレッド（未起動時はNone）"""
+    if _listener is not None and _listener_pid == os.getpid():
+        return _listener
+    return None
+
+
+def _restart_after_fork() -> None:
+    """gunicorn --preload 等でfork後のワーカーにはスレッドが引き継がれないため再起動する"""
+    global _listener, _listener_pid, _listener_lock
+    
+    _listener_lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        _listener_pid = None
+        start_change_listener()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,88 @@
+"""
+Single-flight coalescing of identical concurrent lookups
+同じキー（量子化した座標セル）の検索が同時に実行中であれば、DB実行を1回に束ねて結果を共有する
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from django.conf import settings
+
+
+class _Call:
+    """実行中の1回分の呼び出し"""
+    
+    __slots__ = ('event', 'result', 'error')
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    キーごとに実行中の呼び出しを1つに制限し、後続の呼び出しは先行の結果を待って共有する
+    結果オブジェクトは共有されるため、呼び出し側で変更しないこと
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.shared = 0
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """同じキーの実行中呼び出しがあればその結果を待つ"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+        
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+    
+    def status(self) -> Dict[str, int]:
+        """ヘルスチェック用の統計（executions: 実DB実行, shared: 共有で省略できた呼び出し）"""
+        return {
+            'executions': self.executions,
+            'shared': self.shared,
+            'inFlight': len(self._calls)
+        }
+
+
+# 空間検索サービス共通のインスタンス
+spatial_flight = SingleFlight()
+
+
+def coordinate_key(kind: str, lat: float, lng: float) -> Tuple[str, float, float]:
+    """座標を COALESCE_COORDINATE_PRECISION 桁（既定6桁 ≒ 0.1m）に量子化したキー"""
+    precision = settings.COALESCE_COORDINATE_PRECISION
+    return kind, round(lat, precision), round(lng, precision)
+
+
+def coalesce(kind: str, lat: float, lng: float, fn: Callable[[], Any]) -> Any:
+    """同一セルの同時検索を1回のDB実行に束ねる（COALESCING_ENABLED が無効なら直接実行）"""
+    if not settings.COALESCING_ENABLED:
+        return fn()
+    return spatial_flight.do(coordinate_key(kind, lat, lng), fn)
+
@@ -0,0 +1,122 @@
+"""
+Read-replica routing for SQLAlchemy sessions
+読み取りはリードレプリカへ、書き込み・read-your-writesはプライマリへ振り分ける
+"""
+import itertools
+import logging
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Session.info のキー
+USE_PRIMARY = 'use_primary'
+PINNED_ENGINE = 'pinned_engine'
+
+
+class ReplicaRouter:
+    """
+    リードレプリカ選択（round_robin / least_connections）とヘルスベースのフォールバック
+    接続エラーを起こしたレプリカは retry_seconds の間は選択対象から外す
+    """
+    
+    STRATEGIES = ('round_robin', 'least_connections')
+    
+    def __init__(self, engines: List[Engine], strategy: str = 'round_robin', retry_seconds: float = 30.0):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.retry_seconds = retry_seconds
+        self._down_until = {}
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(range(len(self.engines))) if self.engines else None
+        
+        for replica in self.engines:
+            event.listen(replica, 'handle_error', self._on_error)
+    
+    def _on_error(self, context) -> None:
+        """切断・接続失敗を検知したレプリカをダウン扱いにする"""
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(context.engine)
+    
+    def mark_down(self, replica: Engine) -> None:
+        with self._lock:
+            self._down_until[replica] = time.monotonic() + self.retry_seconds
+        logger.warning(f"Read replica marked down for {self.retry_seconds}s: {replica.url.host}")
+    
+    def is_healthy(self, replica: Engine) -> bool:
+        return self._down_until.get(replica, 0.0) <= time.monotonic()
+    
+    def choose(self) -> Optional[Engine]:
+        """
+        利用可能なレプリカを1つ選択
+        Returns: Engine or None（レプリカ未設定・全滅時はプライマリを使う）
+        """
+        healthy = [replica for replica in self.engines if self.is_healthy(replica)]
+        if not healthy:
+            return None
+        
+        if self.strategy == 'least_connections':
+            return min(healthy, key=lambda replica: replica.pool.checkedout())
+        
+        with self._lock:
+            for _ in range(len(self.engines)):
+                candidate = self.engines[next(self._cycle)]
+                if candidate in healthy:
+                    return candidate
+        return healthy[0]
+    
+    def status(self) -> List[dict]:
+        """ヘルスチェック用のレプリカ状態"""
+        return [
+            {
+                'host': replica.url.host,
+                'healthy': self.is_healthy(replica),
+                'checkedOut': replica.pool.checkedout(),
+            }
+            for replica in self.engines
+        ]
+
+
+class RoutingSession(Session):
+    """
+    ステートメント単位でバインド先を決めるセッション
+    - flush中・DML・use_primary指定時はプライマリ
+    - それ以外の読み取りはセッション内で固定した1台のレプリカ（同一リクエスト内の一貫性のため）
+    """
+    
+    def __init__(self, *args, primary_engine: Engine = None, replica_router: Optional[ReplicaRouter] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.primary_engine = primary_engine
+        self.replica_router = replica_router
+    
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or self.info.get(USE_PRIMARY) or getattr(clause, 'is_dml', False):
+            return self.primary_engine
+        
+        if self.replica_router is None:
+            return self.primary_engine
+        
+        pinned = self.info.get(PINNED_ENGINE)
+        if pinned is not None and self.replica_router.is_healthy(pinned):
+            return pinned
+        
+        replica = self.replica_router.choose()
+        if replica is None:
+            return self.primary_engine
+        
+        self.info[PINNED_ENGINE] = replica
+        return replica
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stick_to_primary_after_write(session, flush_context):
+    """書き込み後の読み取りはプライマリへ（read-your-writes）"""
+    session.info[USE_PRIMARY] = True
@@ -0,0 +1,72 @@
+"""
+Read-only row DTOs for bulk list/search endpoints
+ORMエンティティ（identity map・属性計装）を経由せず、必要な列だけを SQL で型変換済みのタプルとして受け取り
+そのままレスポンス形式に変換する
+"""
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .models import OSMBuilding
+from .tracing import traced
+
+
+class RestaurantRow(NamedTuple):
+    """レストラン一覧用の行（rating / lat / lng はSQLで float8 に変換済み）"""
+    id: str
+    name: str
+    address: str
+    opening_hours: str
+    rating: float
+    lat: float
+    lng: float
+    osm_building_id: Optional[str]
+    
+    @traced('serialize')
+    def to_dict(self) -> Dict[str, Any]:
+        """Restaurant.to_dict と同じ形式"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'address': self.address,
+            'openingHours': self.opening_hours,
+            'rating': self.rating,
+            'lat': self.lat,
+            'lng': self.lng,
+            'osmBuildingId': self.osm_building_id
+        }
+
+
+class BuildingRow(NamedTuple):
+    """建物一覧用の行（coordinates はSQLで GeoJSON から取り出し済み）"""
+    osm_id: str
+    name: Optional[str]
+    building_type: Optional[str]
+    building_levels: Optional[int]
+    building_material: Optional[str]
+    building_use: Optional[str]
+    coordinates: Optional[List[List[List[float]]]]
+    
+    @traced('serialize')
+    def to_dict(self) -> Dict[str, Any]:
+        """OSMBuilding.to_dict と同じ形式"""
+        return {
+            'osm_id': self.osm_id,
+            'name': self.name,
+            'building_type': self.building_type,
+            'building_levels': self.building_levels,
+            'building_material': self.building_material,
+            'building_use': self.building_use,
+            'geometry_coordinates': self.coordinates or []
+        }
+    
+    @traced('serialize')
+    def to_geojson_feature(self) -> Dict[str, Any]:
+        """OSMBuilding.to_geojson_feature と同じ形式"""
+        return OSMBuilding.build_geojson_feature(
+            osm_id=self.osm_id,
+            name=self.name,
+            building_type=self.building_type,
+            building_levels=self.building_levels,
+            building_material=self.building_material,
+            building_use=self.building_use,
+            coordinates=self.coordinates
+        )
@@ -0,0 +1,76 @@
+"""
+Grid cell helpers for spatial aggregation
+経度・緯度を 360 / 2^level 度の正方グリッドに分割したセルを扱う
+（SQL側の関数 database/restaurant_cluster_cells.sql と同じ定義）
+"""
+import math
+from typing import List, Tuple
+
+# クラスタ集計を保持するレベル範囲（SQL側のループ範囲と一致させること）
+CLUSTER_MIN_LEVEL = 2
+CLUSTER_MAX_LEVEL = 18
+
+# 地図ズームレベルとグリッドレベルの差（1タイル幅あたり約4セル）
+ZOOM_LEVEL_OFFSET = 2
+
+# osm_buildings パーティション用の地域セルレベル（一辺 ≒ 0.70度、SQL関数 osm_region_cell と一致させること）
+REGION_CELL_LEVEL = 9
+
+# 1度あたりの距離の下限（メートル、緯度方向は赤道付近の 110574m が最小）
+# メートルから度数への換算を大きめにして、換算したbboxが必ず半径を含むようにする
+MIN_METERS_PER_DEGREE = 110000.0
+
+
+def degrees_for_meters(lat: float, meters: float) -> Tuple[float, float]:
+    """座標付近で meters を必ず含む (緯度方向の度数, 経度方向の度数)（経度は cos(lat) で補正）"""
+    lat_degrees = meters / MIN_METERS_PER_DEGREE
+    lng_degrees = meters / (MIN_METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat_degrees, lng_degrees
+
+
+def cell_size_degrees(level: int) -> float:
+    """セルの一辺（度）"""
+    return 360.0 / (2 ** level)
+
+
+def cell_for_point(lat: float, lng: float, level: int) -> Tuple[int, int]:
+    """座標を含むセルのインデックス (cell_x, cell_y)"""
+    size = cell_size_degrees(level)
+    return math.floor((lng + 180.0) / size), math.floor((lat + 90.0) / size)
+
+
+def cell_bounds(cell_x: int, cell_y: int, level: int) -> Tuple[float, float, float, float]:
+    """セルの範囲 (south, west, north, east)"""
+    size = cell_size_degrees(level)
+    west = cell_x * size - 180.0
+    south = cell_y * size - 90.0
+    return south, west, south + size, west + size
+
+
+def cell_range_for_bbox(south: float, west: float, north: float, east: float,
+                        level: int) -> Tuple[int, int, int, int]:
+    """bboxと交差するセルの範囲 (x_min, x_max, y_min, y_max)"""
+    x_min, y_min = cell_for_point(south, west, level)
+    x_max, y_max = cell_for_point(north, east, level)
+    return x_min, x_max, y_min, y_max
+
+
+def level_for_zoom(zoom: int) -> int:
+    """地図ズームレベルに対応するクラスタ集計レベル"""
+    return max(CLUSTER_MIN_LEVEL, min(CLUSTER_MAX_LEVEL, int(zoom) + ZOOM_LEVEL_OFFSET))
+
+
+def region_cell_for_point(lat: float, lng: float) -> int:
+    """座標が属する地域セル番号（database/osm_buildings_partitioning.sql の osm_region_cell と同じ）"""
+    cell_x, cell_y = cell_for_point(lat, lng, REGION_CELL_LEVEL)
+    return cell_y * (2 ** REGION_CELL_LEVEL) + cell_x
+
+
+def region_cells_for_bbox(south: float, west: float, north: float, east: float) -> List[int]:
+    """bboxと交差する地域セル番号の一覧"""
+    x_min, x_max, y_min, y_max = cell_range_for_bbox(south, west, north, east, REGION_CELL_LEVEL)
+    return [
+        cell_y * (2 ** REGION_CELL_LEVEL) + cell_x
+        for cell_y in range(y_min, y_max + 1)
+        for cell_x in range(x_min, x_max + 1)
+    ]
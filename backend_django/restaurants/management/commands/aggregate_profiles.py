@@ -0,0 +1,55 @@
+"""
+リクエストプロファイルの集計（flame graph 用 collapsed-stack 形式）
+python manage.py aggregate_profiles [--input DIR] [--output FILE] [--url-name NAME] [--min-duration-ms MS]
+"""
+import json
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'PROFILING_OUTPUT_DIR のプロファイルを collapsed-stack 形式（"frame;frame;... count"）に集計します'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--input', default=str(settings.PROFILING_OUTPUT_DIR),
+                            help='プロファイルのディレクトリ（既定: PROFILING_OUTPUT_DIR）')
+        parser.add_argument('--output', help='出力先（省略時は標準出力）')
+        parser.add_argument('--url-name', help='対象エンドポイントのURL名で絞り込み')
+        parser.add_argument('--min-duration-ms', type=float, default=0.0,
+                            help='処理時間がこの値以上のリクエストのみ集計')
+    
+    def handle(self, *args, **options):
+        input_dir = Path(options['input'])
+        if not input_dir.is_dir():
+            raise CommandError(f"Profile directory not found: {input_dir}")
+        
+        stacks: Counter = Counter()
+        profiles = 0
+        
+        for path in sorted(input_dir.glob('*.json')):
+            try:
+                profile = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Skipping {path.name}: {str(e)}")
+                continue
+            
+            if options['url_name'] and profile.get('urlName') != options['url_name']:
+                continue
+            if profile.get('durationMs', 0.0) < options['min_duration_ms']:
+                continue
+            
+            stacks.update(profile.get('samples', {}))
+            profiles += 1
+        
+        lines = [f"{stack} {count}" for stack, count in sorted(stacks.items())]
+        
+        if options['output']:
+            Path(options['output']).write_text('\n'.join(lines) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(
+                f"Aggregated {profiles} profiles ({len(lines)} stacks) into {options['output']}"
+            ))
+        else:
+            self.stdout.write('\n'.join(lines))
@@ -0,0 +1,38 @@
+"""
+サービス提供範囲（データのあるグリッドセル）の構築
+python manage.py build_service_area [--output PATH] [--level LEVEL]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from restaurants.models import get_primary_db_session
+from restaurants.service_area import build_service_area
+
+
+class Command(BaseCommand):
+    help = 'restaurants / osm_buildings からデータのあるグリッドセルを集計し、サービス提供範囲ファイルを構築します'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.SERVICE_AREA_PATH,
+                            help='出力先（既定: SERVICE_AREA_PATH）')
+        parser.add_argument('--level', type=int, default=settings.SERVICE_AREA_LEVEL,
+                            help='グリッドレベル（既定: SERVICE_AREA_LEVEL）')
+    
+    def handle(self, *args, **options):
+        output = options['output']
+        if not output:
+            raise CommandError('--output または SERVICE_AREA_PATH を指定してください')
+        
+        # 構築後の追加は built_at より後の変更通知で補うため、レプリカの遅延分を取りこぼさないようプライマリから読む
+        db = next(get_primary_db_session())
+        
+        try:
+            summary = build_service_area(db, output, options['level'])
+        except Exception as e:
+            raise CommandError(f"Service area build failed: {str(e)}")
+        finally:
+            db.close()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Service area written to {output}: {summary['cells']} cells "
+            f"from {summary['restaurants']} restaurants, {summary['buildings']} buildings"
+        ))
@@ -0,0 +1,36 @@
+"""
+共有空間インデックススナップショットの構築
+python manage.py build_spatial_snapshot [--output PATH]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from restaurants.models import get_primary_db_session
+from restaurants.spatial_snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'restaurants / osm_buildings から mmap 用の空間インデックススナップショットを構築します'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.SPATIAL_SNAPSHOT_PATH,
+                            help='出力先（既定: SPATIAL_SNAPSHOT_PATH）')
+    
+    def handle(self, *args, **options):
+        output = options['output']
+        if not output:
+            raise CommandError('--output または SPATIAL_SNAPSHOT_PATH を指定してください')
+        
+        # レプリカの遅延分を取りこぼすと、その変更通知より built_at が新しくなり検知できないためプライマリから読む
+        db = next(get_primary_db_session())
+        
+        try:
+            summary = build_snapshot(db, output)
+        except Exception as e:
+            raise CommandError(f"Spatial snapshot build failed: {str(e)}")
+        finally:
+            db.close()
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Spatial snapshot written to {output}: "
+            f"{summary['restaurants']} restaurants, {summary['buildings']} buildings, {summary['vertices']} vertices"
+        ))
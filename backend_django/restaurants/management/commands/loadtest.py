@@ -0,0 +1,329 @@
+"""
+地図タップの負荷試験（ローカル開発サーバー + ローカルPostGIS 向け）
+フロントエンド ApiService と同じ順序でAPIを呼び出すタップを、指定の到着率・同時実行数で再生し
+エンドポイントごとのスループット・p50/p95/p99レイテンシ・エラー率をJSONで出力する
+
+python manage.py loadtest --base-url http://localhost:8000/api --rate 50 --concurrency 32 --duration 60
+python manage.py loadtest --trace taps.jsonl --respect-trace-timing --output report.json
+"""
+import csv
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+# 初台駅周辺（フロントエンドの初期表示範囲）
+DEFAULT_BBOX = (35.676, 139.680, 35.690, 139.694)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """最近傍順位法によるパーセンタイル"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(samples)
+    return {
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'mean': round(sum(values) / len(values), 3) if values else None,
+        'max': values[-1] if values else None
+    }
+
+
+def load_trace(path: str) -> List[Dict[str, float]]:
+    """
+    記録済みタップの読み込み
+    - JSON Lines: {"lat": 35.68, "lng": 139.68, "t": 0.25}（t は開始からの秒数、省略可）
+    - CSV: lat,lng[,t]
+    """
+    taps = []
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            for row in csv.reader(f):
+                if not row or row[0].strip().lower() == 'lat':
+                    continue
+                tap = {'lat': float(row[0]), 'lng': float(row[1])}
+                if len(row) > 2 and row[2].strip():
+                    tap['t'] = float(row[2])
+                taps.append(tap)
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    tap = {'lat': float(record['lat']), 'lng': float(record['lng'])}
+                    if 't' in record:
+                        tap['t'] = float(record['t'])
+                    taps.append(tap)
+    return taps
+
+
+class Recorder:
+    """エンドポイントごとの計測値"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.status_codes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+    
+    def record(self, endpoint: str, latency_ms: float, status: Optional[int], error: bool) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(round(latency_ms, 3))
+            self.status_codes[endpoint][str(status) if status is not None else 'exception'] += 1
+            if error:
+                self.errors[endpoint] += 1
+    
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            count = len(samples)
+            endpoints[endpoint] = {
+                'requests': count,
+                'throughput': round(count / elapsed, 3) if elapsed else None,
+                'errors': self.errors[endpoint],
+                'errorRate': round(self.errors[endpoint] / count, 4) if count else 0.0,
+                'statusCodes': dict(self.status_codes[endpoint]),
+                'latencyMs': latency_summary(samples)
+            }
+        return endpoints
+
+
+class TapClient:
+    """
+    1タップ分のAPI呼び出し（src/services/api.service.ts / map.service.ts と同じ流れ）
+    search/spatial/ → 見つからなければ search/optimized/ → buildings/<osm_id>/（クライアント側キャッシュ）
+    一定割合で search/spatial/nearby/ も呼び出す
+    """
+    
+    def __init__(self, base_url: str, timeout: float, recorder: Recorder, nearby_ratio: float,
+                 nearby_radius: float, building_cache: bool):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.recorder = recorder
+        self.nearby_ratio = nearby_ratio
+        self.nearby_radius = nearby_radius
+        self.building_cache = building_cache
+        self._cached_buildings = set()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+    
+    def _connection(self) -> http.client.HTTPConnection:
+        # スレッドごとに keep-alive 接続を使い回す
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(self.netloc, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+    
+    def request(self, endpoint: str, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[Optional[int], Any]:
+        headers = {'Accept': 'application/json'}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        
+        started = time.perf_counter()
+        try:
+            connection = self._connection()
+            connection.request(method, f'{self.prefix}/{path}', body=payload, headers=headers)
+            response = connection.getresponse()
+            raw = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            self.recorder.record(endpoint, (time.perf_counter() - started) * 1000, None, True)
+            return None, None
+        
+        self.recorder.record(endpoint, (time.perf_counter() - started) * 1000, status, status >= 500)
+        try:
+            return status, json.loads(raw) if raw else None
+        except ValueError:
+            return status, None
+    
+    def fetch_building(self, osm_id: Optional[str]) -> None:
+        if not osm_id:
+            return
+        
+        if self.building_cache:
+            with self._cache_lock:
+                if osm_id in self._cached_buildings:
+                    return
+        
+        status, _ = self.request('buildings/<osm_id>/', 'GET', f'buildings/{osm_id}/')
+        if status == 200 and self.building_cache:
+            with self._cache_lock:
+                self._cached_buildings.add(osm_id)
+    
+    def tap(self, lat: float, lng: float) -> None:
+        coordinates = {'lat': lat, 'lng': lng}
+        
+        if random.random() < self.nearby_ratio:
+            self.request('search/spatial/nearby/', 'POST', 'search/spatial/nearby/',
+                         {**coordinates, 'radius': self.nearby_radius})
+        
+        status, data = self.request('search/spatial/', 'POST', 'search/spatial/', coordinates)
+        if status == 200 and data:
+            self.fetch_building(data.get('osmId'))
+            return
+        
+        # 建物が見つからない・エラーの場合は最寄りレストラン検索へフォールバック
+        status, data = self.request('search/optimized/', 'POST', 'search/optimized/', coordinates)
+        if status == 200 and data:
+            self.fetch_building(data.get('osmBuildingId'))
+
+
+class Command(BaseCommand):
+    help = 'ApiService と同じ呼び出し順の地図タップを再生し、エンドポイント別のスループット・レイテンシ・エラー率を計測します'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000/api', help='APIのベースURL')
+        parser.add_argument('--duration', type=float, default=60.0, help='タップを発生させる秒数')
+        parser.add_argument('--rate', type=float, default=20.0,
+                            help='平均到着率（タップ/秒、ポアソン到着）。0 の場合は各ワーカーが連続実行（closed loop）')
+        parser.add_argument('--concurrency', type=int, default=16, help='同時実行数（ワーカースレッド数）')
+        parser.add_argument('--trace', help='記録済みタップ（.jsonl / .csv）。省略時は --bbox 内の一様乱数')
+        parser.add_argument('--respect-trace-timing', action='store_true',
+                            help='トレースの t（開始からの秒数）どおりにタップを発生させる')
+        parser.add_argument('--bbox', default=','.join(str(v) for v in DEFAULT_BBOX),
+                            help='合成タップの範囲 south,west,north,east')
+        parser.add_argument('--nearby-ratio', type=float, default=0.1,
+                            help='search/spatial/nearby/ も呼び出すタップの割合')
+        parser.add_argument('--nearby-radius', type=float, default=100.0, help='周辺建物検索の半径（メートル）')
+        parser.add_argument('--no-building-cache', action='store_true',
+                            help='建物ポリゴンのクライアント側キャッシュを無効化（毎回 buildings/<osm_id>/ を取得）')
+        parser.add_argument('--timeout', type=float, default=10.0, help='リクエストタイムアウト（秒）')
+        parser.add_argument('--seed', type=int, help='乱数シード')
+        parser.add_argument('--output', help='レポートの出力先（省略時は標準出力）')
+    
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency は1以上を指定してください')
+        
+        if options['rate'] < 0:
+            raise CommandError('--rate は0以上を指定してください')
+        
+        trace = load_trace(options['trace']) if options['trace'] else None
+        if trace is not None and not trace:
+            raise CommandError(f"Trace is empty: {options['trace']}")
+        
+        if options['respect_trace_timing']:
+            if trace is None:
+                raise CommandError('--respect-trace-timing には --trace の指定が必要です')
+            # t のないタップはポアソン到着で補うため、到着率が必要
+            if options['rate'] <= 0 and any('t' not in tap for tap in trace):
+                raise CommandError('t のないタップを含むトレースを --respect-trace-timing で再生する場合は --rate に正の値を指定してください')
+        
+        try:
+            bbox = tuple(float(v) for v in options['bbox'].split(','))
+            south, west, north, east = bbox
+        except ValueError:
+            raise CommandError('--bbox は south,west,north,east の形式で指定してください')
+        
+        recorder = Recorder()
+        client = TapClient(
+            options['base_url'], options['timeout'], recorder,
+            options['nearby_ratio'], options['nearby_radius'], not options['no_building_cache']
+        )
+        
+        taps = iter(trace) if trace is not None else None
+        taps_lock = threading.Lock()
+        
+        def next_tap() -> Optional[Dict[str, float]]:
+            if taps is None:
+                return {'lat': random.uniform(south, north), 'lng': random.uniform(west, east)}
+            with taps_lock:
+                return next(taps, None)
+        
+        def run_tap(tap: Dict[str, float], scheduled: float) -> None:
+            client.tap(tap['lat'], tap['lng'])
+            # 予定到着時刻から計測（キュー待ちを含め、coordinated omission を避ける）
+            recorder.record('tap', (time.perf_counter() - scheduled) * 1000, None, False)
+        
+        started = time.perf_counter()
+        deadline = started + options['duration']
+        
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            if options['rate'] <= 0 and not options['respect_trace_timing']:
+                # closed loop: 各ワーカーが応答を待ってすぐ次のタップ
+                def worker() -> None:
+                    while time.perf_counter() < deadline:
+                        tap = next_tap()
+                        if tap is None:
+                            return
+                        run_tap(tap, time.perf_counter())
+                
+                for _ in range(options['concurrency']):
+                    executor.submit(worker)
+            else:
+                # open loop: 応答を待たずに到着スケジュールどおり投入
+                scheduled = started
+                while True:
+                    tap = next_tap()
+                    if tap is None:
+                        break
+                    
+                    if options['respect_trace_timing'] and 't' in tap:
+                        scheduled = started + tap['t']
+                    else:
+                        scheduled += random.expovariate(options['rate'])
+                    
+                    if scheduled >= deadline:
+                        break
+                    
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    executor.submit(run_tap, tap, scheduled)
+        
+        elapsed = time.perf_counter() - started
+        endpoints = recorder.report(elapsed)
+        tap_summary = endpoints.pop('tap', {'requests': 0, 'throughput': 0.0, 'latencyMs': latency_summary([])})
+        
+        report = {
+            'config': {
+                'baseUrl': options['base_url'],
+                'duration': options['duration'],
+                'rate': options['rate'],
+                'concurrency': options['concurrency'],
+                'trace': options['trace'],
+                'nearbyRatio': options['nearby_ratio'],
+                'buildingCache': not options['no_building_cache']
+            },
+            'elapsedSeconds': round(elapsed, 3),
+            'taps': {
+                'count': tap_summary['requests'],
+                'throughput': tap_summary['throughput'],
+                'latencyMs': tap_summary['latencyMs']
+            },
+            'endpoints': endpoints
+        }
+        
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f"{report['taps']['count']} taps in {report['elapsedSeconds']}s, report written to {options['output']}"
+            ))
+        else:
+            self.stdout.write(output)
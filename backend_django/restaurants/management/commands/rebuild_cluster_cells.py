@@ -0,0 +1,23 @@
+"""
+マーカークラスタ集計セルの全件再構築
+python manage.py rebuild_cluster_cells
+"""
+from django.core.management.base import BaseCommand, CommandError
+from restaurants.models import get_primary_db_session
+from restaurants.repositories import RestaurantClusterRepository
+
+
+class Command(BaseCommand):
+    help = 'restaurant_cluster_cells を restaurants から全件再構築します（通常はトリガーで差分更新）'
+    
+    def handle(self, *args, **options):
+        db = next(get_primary_db_session())
+        
+        try:
+            cell_total = RestaurantClusterRepository(db).rebuild()
+        except Exception as e:
+            raise CommandError(f"Cluster cell rebuild failed: {str(e)}")
+        finally:
+            db.close()
+        
+        self.stdout.write(self.style.SUCCESS(f'{cell_total} cluster cells rebuilt'))
@@ -0,0 +1,23 @@
+"""
+最寄りレストラン検索用ボロノイセルの全件再構築
+python manage.py rebuild_voronoi_cells
+"""
+from django.core.management.base import BaseCommand, CommandError
+from restaurants.models import get_primary_db_session
+from restaurants.repositories import RestaurantRepository
+
+
+class Command(BaseCommand):
+    help = 'restaurant_voronoi_cells を restaurants から全件再構築します（通常はトリガーで差分更新）'
+    
+    def handle(self, *args, **options):
+        db = next(get_primary_db_session())
+        
+        try:
+            cell_total = RestaurantRepository(db).rebuild_voronoi_cells()
+        except Exception as e:
+            raise CommandError(f"Voronoi cell rebuild failed: {str(e)}")
+        finally:
+            db.close()
+        
+        self.stdout.write(self.style.SUCCESS(f'{cell_total} voronoi cells rebuilt'))
@@ -0,0 +1,30 @@
+"""
+事前構築済み検索ペイロードの差分更新
+python manage.py refresh_search_payloads [--full]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from restaurants.models import get_primary_db_session
+from restaurants.repositories import RestaurantSearchPayloadRepository
+
+
+class Command(BaseCommand):
+    help = 'restaurant_search_payloads を updated_at をキーに差分更新します'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='全件再構築する')
+    
+    def handle(self, *args, **options):
+        db = next(get_primary_db_session())
+        
+        try:
+            refreshed = RestaurantSearchPayloadRepository(db).refresh(
+                full=options['full'],
+                overlap_seconds=settings.SEARCH_PAYLOAD_REFRESH_OVERLAP_SECONDS
+            )
+        except Exception as e:
+            raise CommandError(f"Search payload refresh failed: {str(e)}")
+        finally:
+            db.close()
+        
+        self.stdout.write(self.style.SUCCESS(f'{refreshed} search payloads refreshed'))
@@ -0,0 +1,146 @@
+"""
+Middleware for Restaurant Search API
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimiter:
+    """
+    同時実行数の上限 + 上限付き待ち行列
+    待ち行列が満杯、または待ち時間が queue_timeout を超えた場合は受け付けない
+    """
+    
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._condition = threading.Condition()
+    
+    def acquire(self) -> bool:
+        """実行枠を確保（確保できなければFalse）"""
+        with self._condition:
+            if self.active < self.max_concurrent and self.waiting == 0:
+                self.active += 1
+                return True
+            
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._condition.wait(remaining)
+                
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+    
+    def release(self) -> None:
+        with self._condition:
+            self.active -= 1
+            # 通知を受けた待機者がちょうど待ち時間切れで抜けても、残りの待機者が空き枠を取れるよう全員を起こす
+            self._condition.notify_all()
+    
+    @property
+    def is_saturated(self) -> bool:
+        """全実行枠が使用中で待ちが発生している"""
+        return self.active >= self.max_concurrent and self.waiting > 0
+    
+    def status(self) -> Dict[str, object]:
+        """ヘルスチェック用の状態"""
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'maxConcurrent': self.max_concurrent,
+            'maxQueue': self.max_queue,
+            'rejected': self.rejected,
+            'timedOut': self.timed_out,
+            'saturated': self.is_saturated
+        }
+
+
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(url_name: str) -> Optional[ConcurrencyLimiter]:
+    """URL名に対応するリミッター（ADMISSION_CONTROL_LIMITS に設定がなければNone）"""
+    limiter = _limiters.get(url_name)
+    if limiter is not None:
+        return limiter
+    
+    limits = settings.ADMISSION_CONTROL_LIMITS.get(url_name)
+    if limits is None:
+        return None
+    
+    with _limiters_lock:
+        if url_name not in _limiters:
+            _limiters[url_name] = ConcurrencyLimiter(
+                url_name,
+                max_concurrent=limits['max_concurrent'],
+                max_queue=limits['max_queue'],
+                queue_timeout=limits['queue_timeout']
+            )
+        return _limiters[url_name]
+
+
+def get_admission_status() -> Dict[str, Dict[str, object]]:
+    """全リミッターの状態（一度でも使われたもの）"""
+    return {name: limiter.status() for name, limiter in _limiters.items()}
+
+
+class AdmissionControlMiddleware:
+    """
+    検索エンドポイントの流入制御
+    上限超過時はDBで待たせずに 503 + Retry-After を即時返す
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return self.get_response(request)
+        
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return self.get_response(request)
+        
+        limiter = get_limiter(url_name)
+        if limiter is None:
+            return self.get_response(request)
+        
+        if not limiter.acquire():
+            logger.warning(f"Request shed by admission control: {url_name}")
+            response = JsonResponse({
+                'error': 'サーバーが混雑しています。しばらくしてから再度お試しください'
+            }, status=503)
+            response['Retry-After'] = str(settings.ADMISSION_CONTROL_RETRY_AFTER)
+            return response
+        
+        try:
+            return self.get_response(request)
+        finally:
+            limiter.release()
@@ -1,18 +1,44 @@
 """
 SQLAlchemy models for Restaurant Search App with PostGIS Support
 """
-from sqlalchemy import create_engine, Column, String, Numeric, Integer, Text, DateTime, func
+from sqlalchemy import create_engine, Column, String, Numeric, Integer, Float, Text, DateTime, JSON, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, deferred
 from geoalchemy2 import Geometry
 from geoalchemy2.functions import ST_AsGeoJSON, ST_GeomFromText, ST_Contains, ST_Point
 from django.conf import settings
+from .db_routing import ReplicaRouter, RoutingSession, USE_PRIMARY
+from .query_deadlines import STATEMENT_TIMEOUT_MS
+from .tracing import traced
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 # SQLAlchemy setup with PostGIS
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URL, echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# プールはタップ検索の並行サブクエリ分を含めて settings で算出した大きさにする
+ENGINE_OPTIONS = {
+    'echo': settings.DEBUG,
+    'pool_size': settings.DB_POOL_SIZE,
+    'max_overflow': settings.DB_MAX_OVERFLOW,
+    'pool_timeout': settings.DB_POOL_TIMEOUT,
+}
+engine = create_engine(settings.SQLALCHEMY_DATABASE_URL, **ENGINE_OPTIONS)
+
+# Read replicas - 読み取り専用クエリはレプリカへ振り分け（未設定時はプライマリのみ）
+replica_engines = [create_engine(url, **ENGINE_OPTIONS) for url in settings.SQLALCHEMY_READ_REPLICA_URLS]
+replica_router = ReplicaRouter(
+    replica_engines,
+    strategy=settings.READ_REPLICA_STRATEGY,
+    retry_seconds=settings.READ_REPLICA_RETRY_SECONDS
+) if replica_engines else None
+
+SessionLocal = sessionmaker(
+    class_=RoutingSession,
+    autocommit=False,
+    autoflush=False,
+    primary_engine=engine,
+    replica_router=replica_router
+)
 Base = declarative_base()
 
 
@@ -33,6 +59,7 @@ class Restaurant(Base):
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
+    @traced('serialize')
     def to_dict(self) -> Dict[str, Any]:
         """モデルを辞書形式に変換"""
         return {
@@ -66,7 +93,10 @@ class OSMBuilding(Base):
     geometry_coordinates = Column(Text)  # Keep for backward compatibility
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    # 地域セル（パーティションキー、database/osm_buildings_partitioning.sql 適用時のみ存在するため遅延ロード）
+    region_cell = deferred(Column(Integer))
     
+    @traced('serialize')
     def to_dict(self) -> Dict[str, Any]:
         """モデルを辞書形式に変換"""
         return {
@@ -99,23 +129,37 @@ class OSMBuilding(Base):
         
         return []
     
+    @traced('serialize')
     def to_geojson_feature(self) -> Dict[str, Any]:
         """GeoJSON Feature形式に変換"""
-        coordinates = self.get_geometry_coordinates()
-        
+        return self.build_geojson_feature(
+            osm_id=self.osm_id,
+            name=self.name,
+            building_type=self.building_type,
+            building_levels=self.building_levels,
+            building_material=self.building_material,
+            building_use=self.building_use,
+            coordinates=self.get_geometry_coordinates()
+        )
+    
+    @staticmethod
+    def build_geojson_feature(osm_id: str, name: Optional[str], building_type: Optional[str],
+                              building_levels: Optional[int], building_material: Optional[str],
+                              building_use: Optional[str], coordinates: List[List[List[float]]]) -> Dict[str, Any]:
+        """列の値からGeoJSON Featureを構築（ORMインスタンスを経由しない集約クエリ用）"""
         return {
             'type': 'Feature',
             'properties': {
-                'building': self.building_type or 'yes',
-                'osm_id': self.osm_id,
-                'name': self.name,
-                'building:levels': str(self.building_levels) if self.building_levels else None,
-                'building:material': self.building_material,
-                'building:use': self.building_use
+                'building': building_type or 'yes',
+                'osm_id': osm_id,
+                'name': name,
+                'building:levels': str(building_levels) if building_levels else None,
+                'building:material': building_material,
+                'building:use': building_use
             },
             'geometry': {
                 'type': 'Polygon',
-                'coordinates': coordinates
+                'coordinates': coordinates or []
             }
         }
     
@@ -131,11 +175,94 @@ class OSMBuilding(Base):
         return f"<OSMBuilding(osm_id='{self.osm_id}', name='{self.name}')>"
 
 
+class RestaurantClusterCell(Base):
+    """
+    ズームレベル別マーカークラスタの事前集計セル
+    restaurants への書き込み時にトリガーで差分更新される（database/restaurant_cluster_cells.sql）
+    """
+    __tablename__ = "restaurant_cluster_cells"
+    
+    level = Column(Integer, primary_key=True)
+    cell_x = Column(Integer, primary_key=True)
+    cell_y = Column(Integer, primary_key=True)
+    restaurant_count = Column(Integer, nullable=False)
+    lat_sum = Column(Float, nullable=False)
+    lng_sum = Column(Float, nullable=False)
+    top_restaurants = Column(JSONB, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    @traced('serialize')
+    def to_dict(self) -> Dict[str, Any]:
+        """モデルを辞書形式に変換（重心座標付き）"""
+        return {
+            'lat': self.lat_sum / self.restaurant_count,
+            'lng': self.lng_sum / self.restaurant_count,
+            'count': self.restaurant_count,
+            'topRestaurants': self.top_restaurants,
+            'cell': {
+                'level': self.level,
+                'x': self.cell_x,
+                'y': self.cell_y
+            }
+        }
+    
+    def __repr__(self):
+        return f"<RestaurantClusterCell(level={self.level}, x={self.cell_x}, y={self.cell_y}, count={self.restaurant_count})>"
+
+
+class RestaurantVoronoiCell(Base):
+    """
+    最寄りレストラン検索用のボロノイセル（セルを含む座標の最寄りレストラン = restaurant_id）
+    restaurants への書き込み時にトリガーで局所的に更新される（database/restaurant_voronoi_cells.sql）
+    """
+    __tablename__ = "restaurant_voronoi_cells"
+    
+    restaurant_id = Column(String(50), primary_key=True)
+    lat = Column(Float, nullable=False)
+    lng = Column(Float, nullable=False)
+    cell = Column(Geometry('GEOMETRY', srid=4326), nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<RestaurantVoronoiCell(restaurant_id='{self.restaurant_id}')>"
+
+
+class RestaurantSearchPayload(Base):
+    """
+    検索・詳細APIレスポンスの事前構築済みJSON（レストラン + 建物ポリゴン）
+    python manage.py refresh_search_payloads で updated_at をキーに差分更新される
+    """
+    __tablename__ = "restaurant_search_payloads"
+    
+    restaurant_id = Column(String(50), primary_key=True)
+    osm_building_id = Column(String(50), index=True)
+    payload = Column(JSON, nullable=False)
+    restaurant_updated_at = Column(DateTime)
+    building_updated_at = Column(DateTime)
+    refreshed_at = Column(DateTime, default=func.now())
+    
+    def __repr__(self):
+        return f"<RestaurantSearchPayload(restaurant_id='{self.restaurant_id}', refreshed_at={self.refreshed_at})>"
+
+
 # データベースセッション管理
-def get_db_session():
-    """データベースセッションを取得"""
+def get_db_session(use_primary: bool = False, statement_timeout_ms: Optional[int] = None):
+    """
+    データベースセッションを取得
+    読み取りはリードレプリカへ振り分け、use_primary=True で常にプライマリを使用（read-your-writes）
+    statement_timeout_ms 指定時はトランザクションごとに SET LOCAL statement_timeout を実行
+    """
     db = SessionLocal()
+    if use_primary:
+        db.info[USE_PRIMARY] = True
+    if statement_timeout_ms:
+        db.info[STATEMENT_TIMEOUT_MS] = statement_timeout_ms
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_primary_db_session():
+    """書き込み・read-your-writes用にプライマリ固定のセッションを取得"""
+    return get_db_session(use_primary=True)
\ No newline at end of file
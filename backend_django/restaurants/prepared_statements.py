@@ -0,0 +1,165 @@
+"""
+Hot-path statement caching
+- SQLAlchemy: lambda_stmt でクエリ構築・SQLコンパイル結果をキャッシュ（context.cache_hit で計測）
+- PostgreSQL: コネクションごとのサーバー側プリペアドステートメント（PREPARE / EXECUTE）でプランを再利用
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from geoalchemy2 import Geometry
+from sqlalchemy import event, inspect as sa_inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .models import Restaurant, OSMBuilding
+
+# Session.execute の execution_options に付ける計測用の名前
+STATEMENT_NAME = 'statement_name'
+
+# DBAPIコネクションの info に保持する PREPARE 済みの名前
+PREPARED_KEY = 'prepared_statements'
+
+
+def _select_list(entity) -> str:
+    """エンティティの（遅延ロード以外の）全カラム。geometry はORMと同じくEWKBで取得"""
+    columns = []
+    for column in _loaded_columns(entity):
+        if isinstance(column.type, Geometry):
+            columns.append(f'ST_AsEWKB({column.name}) AS {column.name}')
+        else:
+            columns.append(column.name)
+    return ', '.join(columns)
+
+
+def _loaded_columns(entity) -> List[Any]:
+    return [prop.columns[0] for prop in sa_inspect(entity).column_attrs if not prop.deferred]
+
+
+# 名前 → (エンティティ, 引数名, 引数型, SQL)
+PREPARED_STATEMENTS: Dict[str, Tuple[Any, Tuple[str, ...], str, str]] = {
+    'rs_nearest_restaurant': (
+        Restaurant, ('lat', 'lng'), 'float8, float8',
+        f"""
+        SELECT {_select_list(Restaurant)}
+        FROM restaurants
+        ORDER BY sqrt(pow(lat - $1, 2) + pow(lng - $2, 2))
+        LIMIT 1
+        """
+    ),
+    'rs_building_by_point': (
+        OSMBuilding, ('lat', 'lng'), 'float8, float8',
+        f"""
+        SELECT {_select_list(OSMBuilding)}
+        FROM osm_buildings
+        WHERE ST_Contains(geometry, ST_SetSRID(ST_Point($2, $1), 4326))
+        LIMIT 1
+        """
+    ),
+    # パーティション化時（地域セルでプルーニング）
+    'rs_building_by_point_in_cells': (
+        OSMBuilding, ('lat', 'lng', 'region_cells'), 'float8, float8, int[]',
+        f"""
+        SELECT {_select_list(OSMBuilding)}
+        FROM osm_buildings
+        WHERE ST_Contains(geometry, ST_SetSRID(ST_Point($2, $1), 4326))
+          AND region_cell = ANY($3)
+        LIMIT 1
+        """
+    ),
+    'rs_building_by_osm_id': (
+        OSMBuilding, ('osm_id',), 'varchar',
+        f"""
+        SELECT {_select_list(OSMBuilding)}
+        FROM osm_buildings
+        WHERE osm_id = $1
+        LIMIT 1
+        """
+    ),
+}
+
+# EXECUTE 文をORMエンティティとして読み込むステートメント（構築は1回のみ）
+_EXECUTE_STATEMENTS = {
+    name: select(entity).from_statement(
+        text(f"EXECUTE {name}({', '.join(':' + arg for arg in arg_names)})").columns(*_loaded_columns(entity))
+    )
+    for name, (entity, arg_names, _, _) in PREPARED_STATEMENTS.items()
+}
+
+
+class StatementCacheStats:
+    """SQLコンパイルキャッシュ・プリペアドステートメントのヒット率"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compiled: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.prepared: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    
+    def record_compiled(self, name: str, outcome: str) -> None:
+        with self._lock:
+            self.compiled[name][outcome] += 1
+    
+    def record_prepared(self, name: str, hit: bool) -> None:
+        with self._lock:
+            self.prepared[name]['hits' if hit else 'misses'] += 1
+    
+    def status(self) -> Dict[str, Any]:
+        """ヘルスチェック用（名前ごとの件数とヒット率）"""
+        with self._lock:
+            compiled = {
+                name: {**counts, 'hitRate': _rate(counts.get('CACHE_HIT', 0), sum(counts.values()))}
+                for name, counts in self.compiled.items()
+            }
+            prepared = {
+                name: {**counts, 'hitRate': _rate(counts.get('hits', 0), sum(counts.values()))}
+                for name, counts in self.prepared.items()
+            }
+        return {
+            'preparedStatementsEnabled': settings.PREPARED_STATEMENTS_ENABLED,
+            'compiled': compiled,
+            'prepared': prepared
+        }
+
+
+def _rate(hits: int, total: int) -> float:
+    return round(hits / total, 4) if total else 0.0
+
+
+statement_stats = StatementCacheStats()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_compiled_cache(conn, cursor, statement, parameters, context, executemany) -> None:
+    name = context.execution_options.get(STATEMENT_NAME) if context is not None else None
+    if name is None:
+        return
+    
+    cache_hit = getattr(context, 'cache_hit', None)
+    statement_stats.record_compiled(name, getattr(cache_hit, 'name', str(cache_hit)))
+
+
+def execute_prepared(db: Session, name: str, **params: Any) -> Any:
+    """
+    サーバー側プリペアドステートメントを実行し、先頭行をORMエンティティとして返す
+    未PREPAREのコネクションでは初回に PREPARE する（プリペアドステートメントはトランザクション外でも保持される）
+    """
+    entity = PREPARED_STATEMENTS[name][0]
+    bind_arguments = {'mapper': sa_inspect(entity)}
+    connection = db.connection(bind_arguments=bind_arguments)
+    
+    prepared = connection.info.setdefault(PREPARED_KEY, set())
+    if name in prepared:
+        statement_stats.record_prepared(name, hit=True)
+    else:
+        _, _, arg_types, sql = PREPARED_STATEMENTS[name]
+        connection.exec_driver_sql(f'PREPARE {name}({arg_types}) AS {sql}')
+        prepared.add(name)
+        statement_stats.record_prepared(name, hit=False)
+    
+    return db.execute(
+        _EXECUTE_STATEMENTS[name],
+        params,
+        bind_arguments=bind_arguments,
+        execution_options={STATEMENT_NAME: name}
+    ).scalars().first()
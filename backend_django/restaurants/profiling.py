@@ -0,0 +1,200 @@
+"""
+On-demand request profiling
+署名付きヘッダー、または PROFILING_SAMPLE_RATE のサンプリングで選ばれたDRFビューのリクエストについて
+統計的スタックサンプラー + tracemalloc でプロファイルを取り、リクエスト情報とともにJSONファイルへ書き出す
+集計は python manage.py aggregate_profiles（collapsed-stack 形式）
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core import signing
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'restaurants.profiling'
+
+# tracemalloc はプロセス全体で1つのため、同時にプロファイルするリクエストは1件まで
+_profile_lock = threading.Lock()
+
+
+def make_profile_token() -> str:
+    """プロファイル要求ヘッダー（PROFILING_HEADER）に設定する署名付きトークンを発行"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def _valid_token(token: str) -> bool:
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        filename = filename[len(base_dir) + 1:]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """
+    対象スレッドのコールスタックを一定間隔で採取する統計的プロファイラ
+    スタックはルート→リーフの順に ';' で連結して回数を数える
+    """
+    
+    def __init__(self, target_thread_id: int, interval: float):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+    
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+    
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+class RequestProfile:
+    """1リクエスト分のプロファイル（スタックサンプル + メモリ割り当て）"""
+    
+    def __init__(self, request, url_name: str, trigger: str):
+        self.request = request
+        self.url_name = url_name
+        self.trigger = trigger
+        self.sampler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+        self.started_tracemalloc = False
+        self.snapshot_before = None
+        self.started_at = 0.0
+    
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.PROFILING_TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.snapshot_before = tracemalloc.take_snapshot()
+        self.started_at = time.perf_counter()
+        self.sampler.start()
+    
+    def finish(self, response) -> Optional[Path]:
+        duration = time.perf_counter() - self.started_at
+        self.sampler.stop()
+        
+        try:
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot_after = tracemalloc.take_snapshot()
+            top_allocations = [
+                {
+                    'location': str(stat.traceback[0]),
+                    'sizeDiff': stat.size_diff,
+                    'countDiff': stat.count_diff
+                }
+                for stat in snapshot_after.compare_to(self.snapshot_before, 'lineno')[:settings.PROFILING_TOP_ALLOCATIONS]
+            ]
+        finally:
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+        
+        profile: Dict[str, Any] = {
+            'timestamp': time.time(),
+            'method': self.request.method,
+            'path': self.request.path_info,
+            'query': self.request.META.get('QUERY_STRING', ''),
+            'urlName': self.url_name,
+            'trigger': self.trigger,
+            'status': response.status_code,
+            'durationMs': round(duration * 1000, 3),
+            'pid': os.getpid(),
+            'sampleIntervalMs': settings.PROFILING_SAMPLE_INTERVAL * 1000,
+            'samples': dict(self.sampler.samples),
+            'memory': {
+                'peakBytes': peak,
+                'topAllocations': top_allocations
+            }
+        }
+        
+        output_dir = Path(settings.PROFILING_OUTPUT_DIR)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path = output_dir / f"{int(profile['timestamp'])}_{self.url_name}_{uuid.uuid4().hex[:8]}.json"
+        path.write_text(json.dumps(profile, ensure_ascii=False), encoding='utf-8')
+        return path
+
+
+class ProfilingMiddleware:
+    """
+    DRFビューへのリクエストを選択的にプロファイルする
+    - PROFILING_HEADER に make_profile_token() の署名付きトークンがある
+    - または PROFILING_SAMPLE_RATE の確率で抽選
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+        
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        
+        # DRFの @api_view / APIView のみ対象
+        if not hasattr(match.func, 'cls'):
+            return self.get_response(request)
+        
+        if not _profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        
+        try:
+            profile = RequestProfile(request, match.url_name or request.path_info, trigger)
+            profile.start()
+            response = self.get_response(request)
+            try:
+                path = profile.finish(response)
+                logger.info(f"Request profile written: {path}")
+            except Exception as e:
+                logger.error(f"Request profiling failed: {str(e)}")
+            return response
+        finally:
+            _profile_lock.release()
+    
+    def _trigger(self, request) -> Optional[str]:
+        token = request.headers.get(settings.PROFILING_HEADER)
+        if token and _valid_token(token):
+            return 'header'
+        
+        if settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return 'sample'
+        
+        return None
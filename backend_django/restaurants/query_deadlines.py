@@ -0,0 +1,139 @@
+"""
+Per-endpoint query deadlines
+エンドポイントごとの statement_timeout をセッション単位で設定し、タイムアウト時は
+直近の成功結果（stale）を返すか、なければ即座に 503 を返す
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from django.conf import settings
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from .db_routing import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+# Session.info のキー
+STATEMENT_TIMEOUT_MS = 'statement_timeout_ms'
+
+# PostgreSQL の query_canceled（statement_timeout 超過時）
+QUERY_CANCELED = '57014'
+
+
+def deadline_for(url_name: str) -> Optional[int]:
+    """URL名に対応する statement_timeout（ミリ秒、QUERY_DEADLINES_MS に設定がなければNone）"""
+    if not settings.QUERY_DEADLINES_ENABLED:
+        return None
+    return settings.QUERY_DEADLINES_MS.get(url_name)
+
+
+@event.listens_for(RoutingSession, 'after_begin')
+def _apply_statement_timeout(session, transaction, connection):
+    """トランザクション開始時に SET LOCAL で statement_timeout を設定（コミット・ロールバックで元に戻る）"""
+    timeout_ms = session.info.get(STATEMENT_TIMEOUT_MS)
+    if timeout_ms:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+
+def is_query_canceled(error: BaseException) -> bool:
+    """statement_timeout によるクエリキャンセルか"""
+    if not isinstance(error, OperationalError):
+        return False
+    return getattr(error.orig, 'pgcode', None) == QUERY_CANCELED
+
+
+def stale_key(lat: float, lng: float, *params: Hashable) -> Tuple[Hashable, ...]:
+    """
+    stale 結果のキー（座標 + 検索条件）
+    別の地点の結果を返さないよう、同時リクエストの集約と同じ COALESCE_COORDINATE_PRECISION 桁（既定6桁 ≒ 0.1m）で丸める
+    """
+    precision = settings.COALESCE_COORDINATE_PRECISION
+    return (round(lat, precision), round(lng, precision)) + params
+
+
+class StaleResultCache:
+    """
+    エンドポイント・パラメータごとの直近の成功結果（LRU、max_age 秒まで）
+    タイムアウト時のフォールバック専用で、通常のリクエストはキャッシュを参照しない
+    """
+    
+    def __init__(self, max_entries: int, max_age: float):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: 'OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def put(self, url_name: str, key: Hashable, result: Any) -> None:
+        with self._lock:
+            self._entries[(url_name, key)] = (time.monotonic(), result)
+            self._entries.move_to_end((url_name, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def get(self, url_name: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """
+        Returns: (結果, 経過秒数) or None
+        """
+        with self._lock:
+            entry = self._entries.get((url_name, key))
+        if entry is None:
+            return None
+        
+        stored_at, result = entry
+        age = time.monotonic() - stored_at
+        if age > self.max_age:
+            return None
+        return result, age
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DeadlineStats:
+    """ヘルスチェック用のエンドポイント別タイムアウト件数"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+    
+    def record(self, url_name: str, outcome: str) -> None:
+        """outcome: 'stale'（キャッシュで応答）/ 'unavailable'（503）"""
+        with self._lock:
+            counts = self._counts.setdefault(url_name, {'timeouts': 0, 'stale': 0, 'unavailable': 0})
+            counts['timeouts'] += 1
+            counts[outcome] += 1
+    
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            endpoints = {name: dict(counts) for name, counts in self._counts.items()}
+        return {
+            'enabled': settings.QUERY_DEADLINES_ENABLED,
+            'deadlinesMs': settings.QUERY_DEADLINES_MS,
+            'staleEntries': len(stale_results),
+            'endpoints': endpoints
+        }
+
+
+stale_results = StaleResultCache(settings.QUERY_DEADLINE_STALE_CACHE_SIZE, settings.QUERY_DEADLINE_STALE_MAX_AGE)
+deadline_stats = DeadlineStats()
+
+
+def resolve_timeout(url_name: str, key: Hashable) -> Optional[Dict[str, Any]]:
+    """
+    タイムアウト時の応答内容を決めてメトリクスを記録
+    Returns: stale を付けた直近の結果 or None（503 を返す）
+    """
+    cached = stale_results.get(url_name, key)
+    if cached is None:
+        deadline_stats.record(url_name, 'unavailable')
+        logger.warning(f"Query deadline exceeded without stale result: {url_name}")
+        return None
+    
+    result, age = cached
+    deadline_stats.record(url_name, 'stale')
+    logger.warning(f"Query deadline exceeded, serving stale result ({age:.1f}s old): {url_name}")
+    return {**result, 'stale': True, 'staleAgeSeconds': round(age, 1)}
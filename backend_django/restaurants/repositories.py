@@ -1,14 +1,46 @@
 """
 Repository layer for data access operations with PostGIS Support
 """
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text
-from geoalchemy2.functions import ST_Contains, ST_Point, ST_Distance, ST_DWithin
-from .models import Restaurant, OSMBuilding
+from sqlalchemy import func, text, select, lambda_stmt, cast, Float, and_, not_
+from sqlalchemy.dialects.postgresql import JSON
+from geoalchemy2 import Geography
+from geoalchemy2.functions import ST_Contains, ST_Intersects, ST_Point, ST_Distance, ST_DWithin
+from django.conf import settings
+from .geo_cells import degrees_for_meters, region_cells_for_bbox
+from .models import Restaurant, OSMBuilding, RestaurantClusterCell, RestaurantSearchPayload, RestaurantVoronoiCell
+from .tracing import trace_methods
+from .prepared_statements import STATEMENT_NAME, execute_prepared
+from .dto import RestaurantRow, BuildingRow
 import math
+from datetime import datetime, timedelta
 
 
+# 一覧・検索用の軽量読み取り経路で取得する列（数値はSQLで float8 に変換）
+RESTAURANT_ROW_COLUMNS = (
+    Restaurant.id,
+    Restaurant.name,
+    Restaurant.address,
+    Restaurant.opening_hours,
+    cast(Restaurant.rating, Float),
+    cast(Restaurant.lat, Float),
+    cast(Restaurant.lng, Float),
+    Restaurant.osm_building_id
+)
+
+BUILDING_ROW_COLUMNS = (
+    OSMBuilding.osm_id,
+    OSMBuilding.name,
+    OSMBuilding.building_type,
+    OSMBuilding.building_levels,
+    OSMBuilding.building_material,
+    OSMBuilding.building_use,
+    cast(func.ST_AsGeoJSON(OSMBuilding.geometry), JSON)['coordinates']
+)
+
+
+@trace_methods('repository')
 class RestaurantRepository:
     """
     レストランデータアクセス用リポジトリ
@@ -17,82 +49,155 @@ class RestaurantRepository:
     def __init__(self, db: Session):
         self.db = db
     
-    def get_all(self) -> List[Restaurant]:
-        """全レストランを取得"""
-        return self.db.query(Restaurant).order_by(Restaurant.rating.desc()).all()
-    
     def get_by_id(self, restaurant_id: str) -> Optional[Restaurant]:
         """IDでレストランを取得"""
         return self.db.query(Restaurant).filter(Restaurant.id == restaurant_id).first()
     
     def find_nearest_restaurant(self, lat: float, lng: float) -> Optional[Tuple[Restaurant, float]]:
         """
-        指定座標に最も近いレストランを検索
+        指定座標に最も近いレストランを検索（ホットパス: プリペアドステートメント / lambda_stmt）
         Returns: (Restaurant, distance) or None
         """
+        if settings.NEAREST_RESTAURANT_MODE == 'voronoi':
+            # ボロノイセルの点包含判定1回（セル未構築・範囲外の場合は通常の検索）
+            result = self._find_nearest_by_voronoi(lat, lng)
+            if result is not None:
+                return result
+        
+        if settings.PREPARED_STATEMENTS_ENABLED:
+            restaurant = execute_prepared(self.db, 'rs_nearest_restaurant', lat=lat, lng=lng)
+            if restaurant is None:
+                return None
+            distance = math.sqrt((float(restaurant.lat) - lat) ** 2 + (float(restaurant.lng) - lng) ** 2)
+            return restaurant, distance
+        
         # SQLAlchemyで距離計算（ユークリッド距離の近似）
-        distance_query = func.sqrt(
-            func.pow(Restaurant.lat - lat, 2) + 
-            func.pow(Restaurant.lng - lng, 2)
-        ).label('distance')
+        # lambda_stmt: クエリ構築・SQLコンパイルは初回のみ、以降は lat/lng をバインドし直すだけ
+        stmt = lambda_stmt(lambda: (
+            select(
+                Restaurant,
+                func.sqrt(
+                    func.pow(Restaurant.lat - lat, 2) + 
+                    func.pow(Restaurant.lng - lng, 2)
+                ).label('distance')
+            )
+            .order_by('distance')
+            .limit(1)
+        ))
         
-        result = (
-            self.db.query(Restaurant, distance_query)
-            .order_by(distance_query)
-            .first()
-        )
+        result = self.db.execute(stmt, execution_options={STATEMENT_NAME: 'find_nearest_restaurant'}).first()
         
         if result:
             restaurant, distance = result
             return restaurant, float(distance)
         return None
     
-    def find_restaurants_within_radius(self, lat: float, lng: float, radius_km: float = 1.0) -> List[Tuple[Restaurant, float]]:
+    def _find_nearest_by_voronoi(self, lat: float, lng: float) -> Optional[Tuple[Restaurant, float]]:
+        """
+        座標を含むボロノイセルの母点レストランを取得
+        セル境界上（等距離）や同一座標のレストランは restaurant_id の小さい方を返す
+        """
+        stmt = lambda_stmt(lambda: (
+            select(Restaurant)
+            .join(RestaurantVoronoiCell, RestaurantVoronoiCell.restaurant_id == Restaurant.id)
+            .where(ST_Intersects(RestaurantVoronoiCell.cell, func.ST_SetSRID(ST_Point(lng, lat), 4326)))
+            .order_by(RestaurantVoronoiCell.restaurant_id)
+            .limit(1)
+        ))
+        
+        restaurant = self.db.execute(stmt, execution_options={STATEMENT_NAME: 'find_nearest_by_voronoi'}).scalars().first()
+        if restaurant is None:
+            return None
+        
+        distance = math.sqrt((float(restaurant.lat) - lat) ** 2 + (float(restaurant.lng) - lng) ** 2)
+        return restaurant, distance
+    
+    def rebuild_voronoi_cells(self) -> int:
+        """
+        ボロノイセルを全件再構築（初期投入・大量更新後・整合性回復用）
+        Returns: 作成したセル数
+        """
+        cell_total = self.db.execute(text("SELECT restaurant_voronoi_rebuild()")).scalar()
+        self.db.commit()
+        return cell_total
+    
+    # --- 軽量読み取り経路（ORMエンティティを生成しない） ---
+    
+    def get_all_rows(self) -> List[RestaurantRow]:
+        """全レストランを行DTOで取得"""
+        stmt = select(*RESTAURANT_ROW_COLUMNS).order_by(Restaurant.rating.desc())
+        return [RestaurantRow._make(row) for row in self.db.execute(stmt)]
+    
+    def find_rows_within_radius(self, lat: float, lng: float, radius_km: float = 1.0) -> List[Tuple[RestaurantRow, float]]:
         """
-        指定座標から半径内のレストランを検索
+        指定座標から半径内のレストランを行DTOで検索
         """
-        # 1度の緯度経度は約111kmなので、km to degree conversion
         radius_deg = radius_km / 111.0
         
-        distance_query = func.sqrt(
+        distance_query = cast(func.sqrt(
             func.pow(Restaurant.lat - lat, 2) + 
             func.pow(Restaurant.lng - lng, 2)
-        ).label('distance')
+        ), Float).label('distance')
         
-        results = (
-            self.db.query(Restaurant, distance_query)
-            .filter(distance_query <= radius_deg)
+        stmt = (
+            select(*RESTAURANT_ROW_COLUMNS, distance_query)
+            .where(distance_query <= radius_deg)
             .order_by(distance_query)
-            .all()
         )
         
-        return [(restaurant, float(distance)) for restaurant, distance in results]
+        return [(RestaurantRow._make(row[:-1]), row[-1]) for row in self.db.execute(stmt)]
     
-    def search_by_name(self, name: str) -> List[Restaurant]:
-        """名前で部分一致検索"""
-        return (
-            self.db.query(Restaurant)
-            .filter(Restaurant.name.contains(name))
+    def search_rows_by_name(self, name: str) -> List[RestaurantRow]:
+        """名前で部分一致検索（行DTO）"""
+        stmt = (
+            select(*RESTAURANT_ROW_COLUMNS)
+            .where(Restaurant.name.contains(name))
             .order_by(Restaurant.rating.desc())
-            .all()
         )
+        return [RestaurantRow._make(row) for row in self.db.execute(stmt)]
+
+
+def region_cells_near_point(lat: float, lng: float, margin_degrees: float = 0.0) -> Optional[List[int]]:
+    """
+    osm_buildings のパーティションプルーニング用に、座標付近の建物が属し得る地域セルを返す
+    建物は代表点のセルに割り当てられるため、建物サイズ分（OSM_REGION_CELL_MARGIN）の余白を取る
+    Returns: 地域セル一覧、パーティション無効時・対象セルが多すぎる場合は None（条件を付けない）
+    """
+    return region_cells_near_bbox(lat, lng, lat, lng, margin_degrees)
+
+
+def region_cells_near_bbox(south: float, west: float, north: float, east: float,
+                           margin_degrees: float = 0.0) -> Optional[List[int]]:
+    """
+    region_cells_near_point の範囲版（bbox 内の建物が属し得る地域セル）
+    """
+    if not settings.OSM_BUILDINGS_PARTITIONED:
+        return None
+    
+    margin = settings.OSM_REGION_CELL_MARGIN + margin_degrees
+    cells = region_cells_for_bbox(south - margin, west - margin, north + margin, east + margin)
+    if len(cells) > settings.OSM_REGION_CELL_MAX_PER_QUERY:
+        return None
+    return cells
 
 
+@trace_methods('repository')
 class OSMBuildingRepository:
     """
     OSM建物データアクセス用リポジトリ with PostGIS Spatial Queries
+    パーティション化されている場合は地域セル条件を付けてプルーニングさせる
     """
     
     def __init__(self, db: Session):
         self.db = db
     
-    def get_all(self) -> List[OSMBuilding]:
-        """全OSM建物を取得"""
-        return self.db.query(OSMBuilding).all()
-    
     def get_by_osm_id(self, osm_id: str) -> Optional[OSMBuilding]:
-        """OSM IDで建物を取得"""
-        return self.db.query(OSMBuilding).filter(OSMBuilding.osm_id == osm_id).first()
+        """OSM IDで建物を取得（ホットパス: プリペアドステートメント / lambda_stmt）"""
+        if settings.PREPARED_STATEMENTS_ENABLED:
+            return execute_prepared(self.db, 'rs_building_by_osm_id', osm_id=osm_id)
+        
+        stmt = lambda_stmt(lambda: select(OSMBuilding).where(OSMBuilding.osm_id == osm_id).limit(1))
+        return self.db.execute(stmt, execution_options={STATEMENT_NAME: 'get_by_osm_id'}).scalars().first()
     
     def get_by_building_type(self, building_type: str) -> List[OSMBuilding]:
         """建物タイプで検索"""
@@ -102,48 +207,174 @@ class OSMBuildingRepository:
             .all()
         )
     
-    def get_commercial_buildings(self) -> List[OSMBuilding]:
-        """商業建物を取得"""
-        return (
-            self.db.query(OSMBuilding)
-            .filter(OSMBuilding.building_use == 'commercial')
-            .all()
-        )
+    def get_all_rows(self) -> List[BuildingRow]:
+        """全OSM建物を行DTOで取得"""
+        return [BuildingRow._make(row) for row in self.db.execute(select(*BUILDING_ROW_COLUMNS))]
+    
+    def get_commercial_building_rows(self) -> List[BuildingRow]:
+        """商業建物を行DTOで取得"""
+        stmt = select(*BUILDING_ROW_COLUMNS).where(OSMBuilding.building_use == 'commercial')
+        return [BuildingRow._make(row) for row in self.db.execute(stmt)]
     
     def find_building_by_point(self, lat: float, lng: float) -> Optional[OSMBuilding]:
         """
-        指定座標を含む建物をPostGISで検索（新機能）
+        指定座標を含む建物をPostGISで検索（ホットパス: プリペアドステートメント / lambda_stmt）
         Returns: OSMBuilding or None
         """
-        point = ST_Point(lng, lat)  # PostGIS Point (lng, lat order)
+        region_cells = region_cells_near_point(lat, lng)
         
-        return (
-            self.db.query(OSMBuilding)
-            .filter(ST_Contains(OSMBuilding.geometry, point))
-            .first()
-        )
+        if settings.PREPARED_STATEMENTS_ENABLED:
+            if region_cells is not None:
+                return execute_prepared(self.db, 'rs_building_by_point_in_cells', lat=lat, lng=lng, region_cells=region_cells)
+            return execute_prepared(self.db, 'rs_building_by_point', lat=lat, lng=lng)
+        
+        # PostGIS Point (lng, lat order)、geometry列と同じ SRID 4326
+        stmt = lambda_stmt(lambda: select(OSMBuilding).where(
+            ST_Contains(OSMBuilding.geometry, func.ST_SetSRID(ST_Point(lng, lat), 4326))
+        ))
+        
+        if region_cells is not None:
+            stmt += lambda s: s.where(OSMBuilding.region_cell.in_(region_cells))
+        
+        stmt += lambda s: s.limit(1)
+        
+        return self.db.execute(stmt, execution_options={STATEMENT_NAME: 'find_building_by_point'}).scalars().first()
     
     def find_buildings_near_point(self, lat: float, lng: float, distance_meters: float = 100) -> List[Tuple[OSMBuilding, float]]:
         """
         指定座標周辺の建物を距離付きで検索
         Returns: List[(OSMBuilding, distance_meters)]
         """
-        point = ST_Point(lng, lat)
+        point = func.ST_SetSRID(ST_Point(lng, lat), 4326)
+        point_geography = cast(point, Geography(srid=4326))
+        building_geography = cast(OSMBuilding.geometry, Geography(srid=4326))
+        lat_margin, lng_margin = degrees_for_meters(lat, distance_meters)
         
-        # PostGISのST_DWithinで範囲内検索 + ST_Distanceで距離計算
-        results = (
+        # 半径を含むbbox（&&）で idx_osm_buildings_geom を使って絞り込み、geography の ST_DWithin / ST_Distance でメートル判定
+        query = (
             self.db.query(
                 OSMBuilding,
-                ST_Distance(OSMBuilding.geometry, point).label('distance')
+                ST_Distance(building_geography, point_geography).label('distance')
             )
-            .filter(ST_DWithin(OSMBuilding.geometry, point, distance_meters))
-            .order_by('distance')
-            .all()
+            .filter(OSMBuilding.geometry.intersects(func.ST_Expand(point, lng_margin, lat_margin)))
+            .filter(ST_DWithin(building_geography, point_geography, distance_meters))
         )
         
+        region_cells = region_cells_near_bbox(lat - lat_margin, lng - lng_margin, lat + lat_margin, lng + lng_margin)
+        if region_cells is not None:
+            query = query.filter(OSMBuilding.region_cell.in_(region_cells))
+        
+        results = query.order_by('distance').all()
+        
         return [(building, float(distance)) for building, distance in results]
 
 
+@trace_methods('repository')
+class RestaurantClusterRepository:
+    """
+    マーカークラスタ用事前集計セルのリポジトリ
+    """
+    
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def get_cells_in_range(self, level: int, x_min: int, x_max: int, y_min: int, y_max: int) -> List[RestaurantClusterCell]:
+        """
+        指定レベルのセル範囲内にある集計セルを取得（主キー範囲検索のみ）
+        """
+        return (
+            self.db.query(RestaurantClusterCell)
+            .filter(
+                RestaurantClusterCell.level == level,
+                RestaurantClusterCell.cell_x.between(x_min, x_max),
+                RestaurantClusterCell.cell_y.between(y_min, y_max)
+            )
+            .all()
+        )
+    
+    def rebuild(self) -> int:
+        """
+        集計セルを全件再構築（初期投入・整合性回復用）
+        Returns: 作成したセル数
+        """
+        cell_total = self.db.execute(text("SELECT restaurant_cluster_rebuild()")).scalar()
+        self.db.commit()
+        return cell_total
+
+
+@trace_methods('repository')
+class RestaurantSearchPayloadRepository:
+    """
+    事前構築済み検索ペイロードのリポジトリ
+    """
+    
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def get_payload(self, restaurant_id: str) -> Optional[Dict[str, Any]]:
+        """
+        レストランIDでペイロードを取得（主キー検索1回）
+        """
+        return (
+            self.db.query(RestaurantSearchPayload.payload)
+            .filter(RestaurantSearchPayload.restaurant_id == restaurant_id)
+            .scalar()
+        )
+    
+    def find_nearest_payload(self, lat: float, lng: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        指定座標に最も近いレストランのペイロードを検索
+        Returns: (payload, distance) or None
+        """
+        distance_query = func.sqrt(
+            func.pow(Restaurant.lat - lat, 2) + 
+            func.pow(Restaurant.lng - lng, 2)
+        ).label('distance')
+        
+        result = (
+            self.db.query(RestaurantSearchPayload.payload, distance_query)
+            .join(Restaurant, Restaurant.id == RestaurantSearchPayload.restaurant_id)
+            .order_by(distance_query)
+            .first()
+        )
+        
+        if result:
+            payload, distance = result
+            return payload, float(distance)
+        return None
+    
+    def get_watermark(self):
+        """
+        反映済みの最新 updated_at（レストラン・建物の大きい方）
+        """
+        return self.db.query(
+            func.max(func.greatest(
+                RestaurantSearchPayload.restaurant_updated_at,
+                RestaurantSearchPayload.building_updated_at
+            ))
+        ).scalar()
+    
+    def refresh(self, full: bool = False, overlap_seconds: int = 300) -> int:
+        """
+        ペイロードを差分更新（full=True で全件再構築）
+        トランザクション開始時刻が updated_at になるため overlap_seconds 分さかのぼって再構築する
+        Returns: 更新したペイロード数
+        """
+        since = None
+        if not full:
+            watermark = self.get_watermark()
+            if watermark is not None:
+                since = watermark - timedelta(seconds=overlap_seconds)
+        
+        refreshed = self.db.execute(
+            text("SELECT restaurant_search_payload_refresh(:since)"),
+            {'since': since}
+        ).scalar()
+        self.db.commit()
+        return refreshed
+
+
+@trace_methods('repository')
 class RestaurantSearchRepository:
     """
     レストラン検索用複合リポジトリ
@@ -185,4 +416,189 @@ class RestaurantSearchRepository:
         if restaurant.osm_building_id:
             osm_building = self.osm_building_repo.get_by_osm_id(restaurant.osm_building_id)
         
-        return restaurant, osm_building
\ No newline at end of file
+        return restaurant, osm_building
+    
+    def get_buildings_with_restaurants(self, lat: Optional[float] = None, lng: Optional[float] = None,
+                                       osm_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        建物ごとに入居レストランをまとめて取得（1クエリ・1ラウンドトリップ）
+        座標指定時はその座標を含む建物、osm_ids指定時は該当建物を対象とする
+        restaurants.osm_building_id (idx_restaurants_osm_building) で結合し json_agg で集約
+        Returns: List[{osm_id, name, ..., coordinates, restaurants}]
+        """
+        if osm_ids:
+            predicate = "b.osm_id = ANY(:osm_ids)"
+            params = {'osm_ids': list(osm_ids)}
+        elif lat is not None and lng is not None:
+            predicate = "ST_Contains(b.geometry, ST_SetSRID(ST_Point(:lng, :lat), 4326))"
+            params = {'lat': lat, 'lng': lng}
+            
+            region_cells = region_cells_near_point(lat, lng)
+            if region_cells is not None:
+                predicate += " AND b.region_cell = ANY(:region_cells)"
+                params['region_cells'] = region_cells
+        else:
+            return []
+        
+        # 主キー（パーティション化後は (osm_id, region_cell)）で集約し、他の建物列は関数従属で選択する
+        group_by = "b.osm_id, b.region_cell" if settings.OSM_BUILDINGS_PARTITIONED else "b.osm_id"
+        
+        query = text(f"""
+            SELECT
+                b.osm_id,
+                b.name,
+                b.building_type,
+                b.building_levels,
+                b.building_material,
+                b.building_use,
+                ST_AsGeoJSON(b.geometry)::json -> 'coordinates' AS coordinates,
+                COALESCE(
+                    json_agg(
+                        json_build_object(
+                            'id', r.id,
+                            'name', r.name,
+                            'address', r.address,
+                            'openingHours', r.opening_hours,
+                            'rating', r.rating::float8,
+                            'lat', r.lat::float8,
+                            'lng', r.lng::float8,
+                            'osmBuildingId', r.osm_building_id
+                        ) ORDER BY r.rating DESC, r.id
+                    ) FILTER (WHERE r.id IS NOT NULL),
+                    '[]'::json
+                ) AS restaurants
+            FROM osm_buildings b
+            LEFT JOIN restaurants r ON r.osm_building_id = b.osm_id
+            WHERE {predicate}
+            GROUP BY {group_by}
+            ORDER BY b.osm_id
+        """)
+        
+        return [dict(row) for row in self.db.execute(query, params).mappings()]
+    
+    def find_restaurants_along_route(self, path: List[Tuple[float, float]], width_meters: float,
+                                     limit: int) -> List[Tuple[RestaurantRow, float, float, float]]:
+        """
+        ルート（折れ線）から width_meters 以内のレストランをルート上の位置順に取得
+        geography の式インデックス（database/restaurant_route_index.sql の idx_restaurants_geog）で1回の ST_DWithin
+        path: [(lat, lng), ...]
+        Returns: List[(RestaurantRow, ルートからの距離m, ルート始点からの距離m, ルート上の位置 0～1)]
+        """
+        route_wkt = 'LINESTRING(' + ', '.join(f'{lng!r} {lat!r}' for lat, lng in path) + ')'
+        
+        query = text("""
+            WITH route AS (
+                SELECT line, line::geography AS geog, ST_Length(line::geography) AS length
+                FROM (SELECT ST_GeomFromText(:route_wkt, 4326) AS line) l
+            )
+            SELECT
+                r.id,
+                r.name,
+                r.address,
+                r.opening_hours,
+                r.rating::float8,
+                r.lat::float8,
+                r.lng::float8,
+                r.osm_building_id,
+                ST_Distance(ST_SetSRID(ST_MakePoint(r.lng::float8, r.lat::float8), 4326)::geography, route.geog) AS distance_from_route,
+                ST_LineLocatePoint(route.line, ST_SetSRID(ST_MakePoint(r.lng::float8, r.lat::float8), 4326)) AS route_fraction,
+                route.length
+            FROM restaurants r, route
+            WHERE ST_DWithin(
+                ST_SetSRID(ST_MakePoint(r.lng::float8, r.lat::float8), 4326)::geography,
+                route.geog,
+                :width
+            )
+            ORDER BY route_fraction, distance_from_route, r.id
+            LIMIT :limit
+        """)
+        
+        rows = self.db.execute(query, {'route_wkt': route_wkt, 'width': width_meters, 'limit': limit})
+        
+        return [
+            (RestaurantRow._make(row[:8]), row[8], row[9] * row[10], row[9])
+            for row in rows
+        ]
+
+
+# bbox: (south, west, north, east)
+BBox = Tuple[float, float, float, float]
+
+
+def _building_envelope(bbox: BBox):
+    south, west, north, east = bbox
+    return func.ST_MakeEnvelope(west, south, east, north, 4326)
+
+
+def _restaurant_in_bbox(bbox: BBox):
+    south, west, north, east = bbox
+    return and_(Restaurant.lat.between(south, north), Restaurant.lng.between(west, east))
+
+
+@trace_methods('repository')
+class ViewportRepository:
+    """
+    地図表示範囲の差分取得用リポジトリ
+    建物は bbox の重なり（&&、GISTインデックス）、レストランは (lat, lng) の範囲検索で判定する
+    """
+    
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def get_database_time(self) -> datetime:
+        """DBの現在時刻（トランザクション開始時刻）"""
+        return self.db.execute(select(func.now())).scalar()
+    
+    def _building_filters(self, include: BBox, exclude: Optional[BBox]) -> List[Any]:
+        filters = [OSMBuilding.geometry.op('&&')(_building_envelope(include))]
+        if exclude is not None:
+            filters.append(not_(OSMBuilding.geometry.op('&&')(_building_envelope(exclude))))
+        
+        region_cells = region_cells_near_bbox(*include)
+        if region_cells is not None:
+            filters.append(OSMBuilding.region_cell.in_(region_cells))
+        return filters
+    
+    def _restaurant_filters(self, include: BBox, exclude: Optional[BBox]) -> List[Any]:
+        filters = [_restaurant_in_bbox(include)]
+        if exclude is not None:
+            filters.append(not_(_restaurant_in_bbox(exclude)))
+        return filters
+    
+    def find_buildings(self, include: BBox, exclude: Optional[BBox] = None) -> List[BuildingRow]:
+        """include と重なり、exclude と重ならない建物"""
+        stmt = select(*BUILDING_ROW_COLUMNS).where(*self._building_filters(include, exclude))
+        return [BuildingRow._make(row) for row in self.db.execute(stmt)]
+    
+    def find_building_ids(self, include: BBox, exclude: Optional[BBox] = None) -> List[str]:
+        """include と重なり、exclude と重ならない建物のOSM ID"""
+        stmt = select(OSMBuilding.osm_id).where(*self._building_filters(include, exclude))
+        return list(self.db.execute(stmt).scalars())
+    
+    def find_restaurants(self, include: BBox, exclude: Optional[BBox] = None) -> List[RestaurantRow]:
+        """include 内にあり、exclude 外にあるレストラン"""
+        stmt = select(*RESTAURANT_ROW_COLUMNS).where(*self._restaurant_filters(include, exclude))
+        return [RestaurantRow._make(row) for row in self.db.execute(stmt)]
+    
+    def find_restaurant_ids(self, include: BBox, exclude: Optional[BBox] = None) -> List[str]:
+        """include 内にあり、exclude 外にあるレストランのID"""
+        stmt = select(Restaurant.id).where(*self._restaurant_filters(include, exclude))
+        return list(self.db.execute(stmt).scalars())
+    
+    def find_buildings_updated_since(self, bbox: BBox, since: datetime) -> List[BuildingRow]:
+        """bbox と重なり、since 以降に更新された建物"""
+        stmt = (
+            select(*BUILDING_ROW_COLUMNS)
+            .where(*self._building_filters(bbox, None))
+            .where(OSMBuilding.updated_at >= since)
+        )
+        return [BuildingRow._make(row) for row in self.db.execute(stmt)]
+    
+    def find_restaurants_updated_since(self, bbox: BBox, since: datetime) -> List[RestaurantRow]:
+        """bbox 内にあり、since 以降に更新されたレストラン"""
+        stmt = (
+            select(*RESTAURANT_ROW_COLUMNS)
+            .where(_restaurant_in_bbox(bbox))
+            .where(Restaurant.updated_at >= since)
+        )
+        return [RestaurantRow._make(row) for row in self.db.execute(stmt)]
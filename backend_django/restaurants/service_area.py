@@ -0,0 +1,261 @@
+"""
+Precomputed service-area coverage
+データのある範囲（レストラン座標・建物bboxが重なるグリッドセル、geo_cells のレベル SERVICE_AREA_LEVEL）を
+python manage.py build_service_area で JSON に書き出し、各ワーカーで読み込んで
+範囲外の座標をセッションを開く前に判定する
+
+構築後の追加は変更通知（change_listener）で反映する（削除ではセルを減らさない＝判定は保守的）。
+通知を取りこぼした可能性がある場合（RESYNC）は、次にファイルが再構築されるまで判定に使わない。
+通知を受信していない場合は、構築から SERVICE_AREA_MAX_AGE 秒以内のみ判定に使う。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .building_coverage import BUILDING_BBOX_QUERY
+from .change_listener import RESYNC, ChangeEvent, get_change_listener, register_change_handler
+from .geo_cells import cell_for_point, cell_range_for_bbox, degrees_for_meters
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+RESTAURANT_POINT_QUERY = text("""
+    SELECT lat::float8, lng::float8
+    FROM restaurants
+    WHERE lat IS NOT NULL AND lng IS NOT NULL
+""")
+
+def _cell_key(cell_x: int, cell_y: int) -> int:
+    return (cell_y << 32) | cell_x
+
+
+def _bbox_cell_keys(south: float, west: float, north: float, east: float, level: int) -> Iterable[int]:
+    x_min, x_max, y_min, y_max = cell_range_for_bbox(south, west, north, east, level)
+    for cell_y in range(y_min, y_max + 1):
+        for cell_x in range(x_min, x_max + 1):
+            yield _cell_key(cell_x, cell_y)
+
+
+def bbox_around(lat: float, lng: float, radius_meters: float) -> Tuple[float, float, float, float]:
+    """座標を中心に半径 radius_meters を含むbbox (south, west, north, east)"""
+    lat_delta, lng_delta = degrees_for_meters(lat, radius_meters)
+    return lat - lat_delta, lng - lng_delta, lat + lat_delta, lng + lng_delta
+
+
+class ServiceArea:
+    """
+    データのあるセルの集合
+    セル番号はソート済みの int64 配列で保持し、点は二分探索、bboxはベクトル演算で判定する
+    """
+    
+    def __init__(self, level: int, cells: Iterable[int], built_at: float):
+        self.level = level
+        self.built_at = built_at
+        self.keys = np.unique(np.fromiter(cells, dtype=np.int64))
+        self.xs = self.keys & 0xFFFFFFFF
+        self.ys = self.keys >> 32
+    
+    @classmethod
+    def load(cls, path: str) -> 'ServiceArea':
+        with open(path) as handle:
+            data = json.load(handle)
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported service area format: {data.get('version')}")
+        return cls(data['level'], data['cells'], data['builtAt'])
+    
+    def contains_key(self, key: int) -> bool:
+        index = int(np.searchsorted(self.keys, key))
+        return index < len(self.keys) and int(self.keys[index]) == key
+    
+    def intersects_bbox(self, south: float, west: float, north: float, east: float) -> bool:
+        """bboxと交差するセルが1つでもあるか"""
+        x_min, x_max, y_min, y_max = cell_range_for_bbox(south, west, north, east, self.level)
+        return bool(np.any((self.xs >= x_min) & (self.xs <= x_max) & (self.ys >= y_min) & (self.ys <= y_max)))
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class _ServiceAreaState:
+    """プロセス内の範囲データ参照と、構築後に変更通知で追加されたセル"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.area: Optional[ServiceArea] = None
+        self.checked_at = float('-inf')
+        self.file_mtime = 0
+        self.resynced_at = 0.0
+        self.added: Dict[int, float] = {}  # セル番号 → 通知受信時刻
+        self.rejected = 0
+    
+    def _add_point(self, lat: float, lng: float, changed_at: float) -> None:
+        cell_x, cell_y = cell_for_point(lat, lng, settings.SERVICE_AREA_LEVEL)
+        self.added[_cell_key(cell_x, cell_y)] = changed_at
+    
+    def on_restaurant_change(self, event: ChangeEvent) -> None:
+        changed_at = time.time()
+        if event.op == RESYNC:
+            self.resynced_at = changed_at
+            return
+        
+        values = event.new
+        if values and values.get('lat') is not None and values.get('lng') is not None:
+            with self.lock:
+                self._add_point(values['lat'], values['lng'], changed_at)
+    
+    def on_building_change(self, event: ChangeEvent) -> None:
+        changed_at = time.time()
+        if event.op == RESYNC:
+            self.resynced_at = changed_at
+            return
+        
+        values = event.new
+        if values and values.get('bbox'):
+            with self.lock:
+                for key in _bbox_cell_keys(*values['bbox'], settings.SERVICE_AREA_LEVEL):
+                    self.added[key] = changed_at
+
+
+_state = _ServiceAreaState()
+register_change_handler('restaurants', _state.on_restaurant_change)
+register_change_handler('osm_buildings', _state.on_building_change)
+
+
+def get_service_area() -> Optional[ServiceArea]:
+    """
+    判定に使える範囲データ（SERVICE_AREA_PATH 未設定・未構築・RESYNC後の未再構築時、
+    変更通知を受信しておらず構築から SERVICE_AREA_MAX_AGE 秒を過ぎている場合はNone）
+    ファイルが置き換えられたら次回チェック時に読み直す
+    """
+    path = settings.SERVICE_AREA_PATH
+    if not path:
+        return None
+    
+    now = time.monotonic()
+    if now - _state.checked_at >= settings.SERVICE_AREA_RELOAD_CHECK_SECONDS:
+        with _state.lock:
+            _state.checked_at = now
+            try:
+                file_mtime = os.stat(path).st_mtime_ns
+                if _state.area is None or file_mtime != _state.file_mtime:
+                    _state.area = ServiceArea.load(path)
+                    _state.file_mtime = file_mtime
+                    _state.added = {
+                        key: changed_at for key, changed_at in _state.added.items()
+                        if changed_at > _state.area.built_at
+                    }
+                    logger.info(f"Service area loaded: {path} ({len(_state.area)} cells)")
+            except FileNotFoundError:
+                _state.area = None
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Service area load error: {str(e)}")
+                _state.area = None
+    
+    area = _state.area
+    if area is None or _state.resynced_at > area.built_at:
+        return None
+    
+    # 通知を受信していなければ構築後に増えたセルを把握できないため、古い範囲データでは判定しない
+    listener = get_change_listener()
+    if (listener is None or not listener.connected) and time.time() - area.built_at >= settings.SERVICE_AREA_MAX_AGE:
+        return None
+    return area
+
+
+def covers_point(lat: float, lng: float) -> bool:
+    """座標のセルにデータがあるか（範囲データがなければ常にTrue）"""
+    area = get_service_area()
+    if area is None:
+        return True
+    
+    cell_x, cell_y = cell_for_point(lat, lng, area.level)
+    key = _cell_key(cell_x, cell_y)
+    if area.contains_key(key) or key in _state.added:
+        return True
+    
+    _state.rejected += 1
+    return False
+
+
+def covers_bbox(south: float, west: float, north: float, east: float) -> bool:
+    """bboxと交差するセルにデータがあるか（範囲データがなければ常にTrue）"""
+    area = get_service_area()
+    if area is None:
+        return True
+    
+    if area.intersects_bbox(south, west, north, east):
+        return True
+    
+    x_min, x_max, y_min, y_max = cell_range_for_bbox(south, west, north, east, area.level)
+    with _state.lock:
+        added = list(_state.added)
+    for key in added:
+        if x_min <= (key & 0xFFFFFFFF) <= x_max and y_min <= (key >> 32) <= y_max:
+            return True
+    
+    _state.rejected += 1
+    return False
+
+
+def covers_radius(lat: float, lng: float, radius_meters: float) -> bool:
+    """座標から半径 radius_meters 以内にデータのあるセルがあるか（範囲データがなければ常にTrue）"""
+    return covers_bbox(*bbox_around(lat, lng, radius_meters))
+
+
+def get_service_area_status() -> Optional[Dict[str, Any]]:
+    """ヘルスチェック用（SERVICE_AREA_PATH 未設定時はNone）"""
+    if not settings.SERVICE_AREA_PATH:
+        return None
+    
+    area = get_service_area()
+    return {
+        'loaded': area is not None,
+        'level': area.level if area is not None else None,
+        'cells': len(area) if area is not None else 0,
+        'builtAt': area.built_at if area is not None else None,
+        'addedCells': len(_state.added),
+        'rejected': _state.rejected
+    }
+
+
+def build_service_area(db: Session, path: str, level: int) -> Dict[str, int]:
+    """
+    レストラン座標・建物bboxからデータのあるセルを集計して書き出す
+    ファイルは一時ファイル経由で置き換え、読み込み側が書きかけを読まないようにする
+    """
+    built_at = time.time()
+    cells = set()
+    restaurants = 0
+    buildings = 0
+    
+    for lat, lng in db.execute(RESTAURANT_POINT_QUERY, execution_options={'yield_per': 10000}):
+        cell_x, cell_y = cell_for_point(lat, lng, level)
+        cells.add(_cell_key(cell_x, cell_y))
+        restaurants += 1
+    
+    for south, west, north, east in db.execute(BUILDING_BBOX_QUERY, execution_options={'yield_per': 10000}):
+        if south is None:
+            continue
+        cells.update(_bbox_cell_keys(south, west, north, east, level))
+        buildings += 1
+    
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as handle:
+        json.dump({
+            'version': FORMAT_VERSION,
+            'level': level,
+            'builtAt': built_at,
+            'cells': sorted(cells)
+        }, handle)
+    os.replace(tmp_path, path)
+    
+    return {'restaurants': restaurants, 'buildings': buildings, 'cells': len(cells)}
@@ -1,12 +1,29 @@
 """
 Service layer for business logic
 """
-from typing import List, Optional, Dict, Any
+import contextvars
+import math
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Tuple, Callable, Sequence
+import numpy as np
 from sqlalchemy.orm import Session
-from .repositories import RestaurantRepository, OSMBuildingRepository, RestaurantSearchRepository
-from .models import Restaurant, OSMBuilding
+from django.conf import settings
+from django.core import signing
+from .repositories import (
+    RestaurantRepository, OSMBuildingRepository, RestaurantSearchRepository, RestaurantClusterRepository,
+    RestaurantSearchPayloadRepository, ViewportRepository
+)
+from .models import Restaurant, OSMBuilding, SessionLocal
+from .geo_cells import cell_range_for_bbox, degrees_for_meters, level_for_zoom
+from .spatial_snapshot import get_spatial_snapshot, snapshot_covers_point, snapshot_covers_restaurants
+from .coalescing import coalesce
+from .building_coverage import get_building_coverage
+from .service_area import covers_bbox, covers_point, covers_radius
+from .tracing import trace_methods
 
 
+@trace_methods('service')
 class SpatialSearchService:
     """
     PostGIS空間検索ビジネスロジック（新機能）
@@ -21,26 +38,55 @@ class SpatialSearchService:
         指定座標の建物を検索（メインの新機能）
         Returns: building info or None
         """
-        building = self.osm_building_repo.find_building_by_point(lat, lng)
+        # 建物が1つも重ならないセル（道路・公園など）はDBに問い合わせずに「建物なし」
+        coverage = get_building_coverage()
+        if coverage is not None and coverage.is_empty(lat, lng):
+            return None
+        
+        # 同一セルへの同時リクエストは1回の検索結果を共有
+        building = coalesce('building_at', lat, lng, lambda: self._lookup_building(lat, lng))
         
         if not building:
             return None
         
-        # レスポンス構築
-        response = {
-            'osmId': building.osm_id,
-            'name': building.name or '建物',
-            'buildingType': building.building_type,
-            'buildingLevels': building.building_levels,
-            'buildingUse': building.building_use,
-            'message': f'{building.name or "建物"}が見つかりました',
+        return self.build_building_response(building, lat, lng)
+    
+    @staticmethod
+    def build_building_response(building: Dict[str, Any], lat: float, lng: float) -> Dict[str, Any]:
+        """建物属性（osm_id, name, building_type, building_levels, building_use）からレスポンスを構築"""
+        return {
+            'osmId': building['osm_id'],
+            'name': building['name'] or '建物',
+            'buildingType': building['building_type'],
+            'buildingLevels': building['building_levels'],
+            'buildingUse': building['building_use'],
+            'message': f'{building["name"] or "建物"}が見つかりました',
             'coordinates': {
                 'lat': lat,
                 'lng': lng
             }
         }
+    
+    def _lookup_building(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        """
+        指定座標を含む建物の属性を取得（スナップショット優先、なければDB）
+        """
+        snapshot = get_spatial_snapshot()
+        if snapshot is not None and snapshot_covers_point(snapshot, lat, lng):
+            # 共有スナップショットで判定（DB非接続）
+            return snapshot.find_building_by_point(lat, lng)
         
-        return response
+        building = self.osm_building_repo.find_building_by_point(lat, lng)
+        if not building:
+            return None
+        
+        return {
+            'osm_id': building.osm_id,
+            'name': building.name,
+            'building_type': building.building_type,
+            'building_levels': building.building_levels,
+            'building_use': building.building_use
+        }
     
     def find_buildings_near_location(self, lat: float, lng: float, radius_meters: float = 100) -> List[Dict[str, Any]]:
         """
@@ -62,6 +108,7 @@ class SpatialSearchService:
         return response_list
 
 
+@trace_methods('service')
 class RestaurantSearchService:
     """
     レストラン検索ビジネスロジック
@@ -72,11 +119,31 @@ class RestaurantSearchService:
         self.search_repo = RestaurantSearchRepository(db)
         self.restaurant_repo = RestaurantRepository(db)
         self.osm_building_repo = OSMBuildingRepository(db)
+        self.payload_repo = RestaurantSearchPayloadRepository(db)
+        # 'materialized' の場合は事前構築済みペイロードを優先して返す
+        self.use_materialized_payloads = settings.SEARCH_PAYLOAD_MODE == 'materialized'
     
     def search_nearest_restaurant(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
         """
         最寄りレストラン検索（建物ポリゴン付き）
+        同一セルへの同時リクエストは1回の検索結果を共有
+        """
+        return coalesce('nearest_with_building', lat, lng, lambda: self._search_nearest_restaurant(lat, lng))
+    
+    def _search_nearest_restaurant(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        """
+        最寄りレストラン + 建物ポリゴンのレスポンス構築
         """
+        if self.use_materialized_payloads:
+            materialized = self.payload_repo.find_nearest_payload(lat, lng)
+            if materialized:
+                payload, distance = materialized
+                return {
+                    **payload,
+                    'message': f'{payload["restaurant"]["name"]}が見つかりました',
+                    'distance': distance
+                }
+        
         result = self.search_repo.search_restaurant_with_building(lat, lng)
         
         if not result:
@@ -98,7 +165,8 @@ class RestaurantSearchService:
         """
         最寄りレストラン検索（OSM ID最適化版）
         """
-        result = self.restaurant_repo.find_nearest_restaurant(lat, lng)
+        # 同一セルへの同時リクエストは1回の検索結果を共有
+        result = coalesce('nearest', lat, lng, lambda: self._lookup_nearest_restaurant(lat, lng))
         
         if not result:
             return None
@@ -107,25 +175,48 @@ class RestaurantSearchService:
         
         # OSM ID最適化版レスポンス
         response = {
-            'restaurant': restaurant.to_dict(),
-            'osmBuildingId': restaurant.osm_building_id,
-            'message': f'{restaurant.name}が見つかりました (OSM ID最適化)',
+            'restaurant': restaurant,
+            'osmBuildingId': restaurant['osmBuildingId'],
+            'message': f'{restaurant["name"]}が見つかりました (OSM ID最適化)',
             'distance': distance
         }
         
         return response
     
+    def _lookup_nearest_restaurant(self, lat: float, lng: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        最寄りレストランを取得（スナップショット優先、なければDB）
+        Returns: (restaurant dict, distance) or None
+        """
+        snapshot = get_spatial_snapshot()
+        if snapshot is not None and snapshot_covers_restaurants(snapshot):
+            # 共有スナップショットのR-treeで検索（DB非接続）
+            return snapshot.find_nearest_restaurant(lat, lng)
+        
+        result = self.restaurant_repo.find_nearest_restaurant(lat, lng)
+        if not result:
+            return None
+        
+        restaurant, distance = result
+        return restaurant.to_dict(), distance
+    
     def get_all_restaurants(self) -> List[Dict[str, Any]]:
         """
         全レストラン一覧取得
         """
-        restaurants = self.restaurant_repo.get_all()
+        restaurants = self.restaurant_repo.get_all_rows()
         return [restaurant.to_dict() for restaurant in restaurants]
     
     def get_restaurant_detail(self, restaurant_id: str) -> Optional[Dict[str, Any]]:
         """
         レストラン詳細情報取得
         """
+        if self.use_materialized_payloads:
+            # 主キー検索1回で事前構築済みJSONを返す（未反映の場合は通常経路）
+            payload = self.payload_repo.get_payload(restaurant_id)
+            if payload:
+                return payload
+        
         result = self.search_repo.get_restaurant_with_building(restaurant_id)
         
         if not result:
@@ -142,7 +233,7 @@ class RestaurantSearchService:
         """
         位置ベースレストラン検索（範囲指定）
         """
-        results = self.restaurant_repo.find_restaurants_within_radius(lat, lng, radius_km)
+        results = self.restaurant_repo.find_rows_within_radius(lat, lng, radius_km)
         
         response_list = []
         for restaurant, distance in results:
@@ -153,14 +244,61 @@ class RestaurantSearchService:
         
         return response_list
     
+    def search_restaurants_along_route(self, path: List[Tuple[float, float]], width_meters: float,
+                                       limit: int) -> List[Dict[str, Any]]:
+        """
+        ルート沿いレストラン検索（ルートからの距離 width_meters 以内、ルート上の位置順）
+        """
+        results = self.search_repo.find_restaurants_along_route(path, width_meters, limit)
+        
+        return [
+            {
+                'restaurant': restaurant.to_dict(),
+                'distanceFromRoute': distance_from_route,
+                'distanceAlongRoute': distance_along_route,
+                'routeFraction': route_fraction
+            }
+            for restaurant, distance_from_route, distance_along_route, route_fraction in results
+        ]
+    
+    def get_buildings_with_restaurants(self, lat: Optional[float] = None, lng: Optional[float] = None,
+                                       osm_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        建物ごとの入居レストラン一覧取得（ポリゴンタップ用・1クエリ）
+        """
+        rows = self.search_repo.get_buildings_with_restaurants(lat=lat, lng=lng, osm_ids=osm_ids)
+        
+        response_list = []
+        for row in rows:
+            restaurants = row['restaurants']
+            response_list.append({
+                'osmId': row['osm_id'],
+                'name': row['name'] or '建物',
+                'buildingPolygon': OSMBuilding.build_geojson_feature(
+                    osm_id=row['osm_id'],
+                    name=row['name'],
+                    building_type=row['building_type'],
+                    building_levels=row['building_levels'],
+                    building_material=row['building_material'],
+                    building_use=row['building_use'],
+                    coordinates=row['coordinates']
+                ),
+                'restaurants': restaurants,
+                'count': len(restaurants),
+                'message': f'{row["name"] or "建物"}に{len(restaurants)}件のレストランがあります'
+            })
+        
+        return response_list
+    
     def search_restaurants_by_name(self, name: str) -> List[Dict[str, Any]]:
         """
         名前検索
         """
-        restaurants = self.restaurant_repo.search_by_name(name)
+        restaurants = self.restaurant_repo.search_rows_by_name(name)
         return [restaurant.to_dict() for restaurant in restaurants]
 
 
+@trace_methods('service')
 class OSMBuildingService:
     """
     OSM建物データビジネスロジック
@@ -185,17 +323,220 @@ class OSMBuildingService:
         """
         全建物データ取得
         """
-        buildings = self.osm_repo.get_all()
+        buildings = self.osm_repo.get_all_rows()
         return [building.to_dict() for building in buildings]
     
     def get_commercial_buildings(self) -> List[Dict[str, Any]]:
         """
         商業建物一覧取得
         """
-        buildings = self.osm_repo.get_commercial_buildings()
+        buildings = self.osm_repo.get_commercial_building_rows()
         return [building.to_geojson_feature() for building in buildings]
 
 
+@trace_methods('service')
+class RestaurantClusterService:
+    """
+    マーカークラスタ（ズームレベル別集計）ビジネスロジック
+    """
+    
+    def __init__(self, db: Session):
+        self.db = db
+        self.cluster_repo = RestaurantClusterRepository(db)
+    
+    def get_clusters(self, south: float, west: float, north: float, east: float, zoom: int) -> Dict[str, Any]:
+        """
+        表示範囲内のクラスタ（重心・件数・代表レストラン）を取得
+        事前集計セルの参照のみでレストラン本体は読まない
+        """
+        level = level_for_zoom(zoom)
+        x_min, x_max, y_min, y_max = cell_range_for_bbox(south, west, north, east, level)
+        cells = self.cluster_repo.get_cells_in_range(level, x_min, x_max, y_min, y_max)
+        
+        return {
+            'clusters': [cell.to_dict() for cell in cells],
+            'level': level,
+            'total': sum(cell.restaurant_count for cell in cells)
+        }
+
+
+VIEWPORT_TOKEN_SALT = 'restaurants.viewport'
+
+
+@trace_methods('service')
+class ViewportService:
+    """
+    地図のパン・ズーム時の表示範囲差分ビジネスロジック
+    前回の表示範囲（またはトークン）と新しい表示範囲から、入ってくる地物・出ていく地物だけを返す
+    トークンには前回の表示範囲とDB時刻を署名付きで保持し、重なり部分で更新された地物も返す
+    （重なり部分内での削除・重なり部分から旧範囲のみへの移動は検出しない）
+    """
+    
+    def __init__(self, db: Session):
+        self.db = db
+        self.viewport_repo = ViewportRepository(db)
+    
+    @staticmethod
+    def make_token(bbox: Tuple[float, float, float, float], at: datetime) -> str:
+        return signing.dumps({'bbox': list(bbox), 'at': at.isoformat()}, salt=VIEWPORT_TOKEN_SALT)
+    
+    @staticmethod
+    def parse_token(token: str) -> Tuple[Tuple[float, float, float, float], datetime]:
+        """
+        Returns: (前回の表示範囲, 前回取得時のDB時刻)
+        Raises: ValueError（改ざん・期限切れ・形式不正）
+        """
+        try:
+            data = signing.loads(token, salt=VIEWPORT_TOKEN_SALT, max_age=settings.VIEWPORT_TOKEN_MAX_AGE)
+            south, west, north, east = (float(value) for value in data['bbox'])
+            return (south, west, north, east), datetime.fromisoformat(data['at'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid viewport token: {str(e)}")
+    
+    def get_viewport_diff(self, bbox: Tuple[float, float, float, float],
+                          previous_bbox: Optional[Tuple[float, float, float, float]] = None,
+                          since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        表示範囲の差分
+        - entering: 新しい範囲にあり前回の範囲になかった地物（前回なし・重なりなしの場合は範囲内すべて）
+        - leaving: 前回の範囲にあり新しい範囲にない地物のID
+        - updated: 重なり部分で since 以降に更新された地物（トークン指定時のみ）
+        """
+        at = self.viewport_repo.get_database_time()
+        
+        overlap = _bbox_intersection(bbox, previous_bbox) if previous_bbox else None
+        reset = overlap is None
+        exclude = None if reset else previous_bbox
+        
+        buildings = {
+            'entering': [row.to_geojson_feature() for row in self.viewport_repo.find_buildings(bbox, exclude)],
+            'leaving': [] if reset else self.viewport_repo.find_building_ids(previous_bbox, bbox),
+            'updated': []
+        }
+        restaurants = {
+            'entering': [row.to_dict() for row in self.viewport_repo.find_restaurants(bbox, exclude)],
+            'leaving': [] if reset else self.viewport_repo.find_restaurant_ids(previous_bbox, bbox),
+            'updated': []
+        }
+        
+        if since is not None and not reset:
+            # 取得中にコミットされた更新を取りこぼさないよう少し遡る
+            updated_since = since - timedelta(seconds=settings.VIEWPORT_UPDATE_OVERLAP_SECONDS)
+            buildings['updated'] = [
+                row.to_geojson_feature() for row in self.viewport_repo.find_buildings_updated_since(overlap, updated_since)
+            ]
+            restaurants['updated'] = [
+                row.to_dict() for row in self.viewport_repo.find_restaurants_updated_since(overlap, updated_since)
+            ]
+        
+        return {
+            'buildings': buildings,
+            'restaurants': restaurants,
+            # True の場合、クライアントは保持している地物を破棄して entering で置き換える
+            'reset': reset,
+            'token': self.make_token(bbox, at)
+        }
+
+
+def _bbox_intersection(a: Tuple[float, float, float, float],
+                       b: Tuple[float, float, float, float]) -> Optional[Tuple[float, float, float, float]]:
+    south, west = max(a[0], b[0]), max(a[1], b[1])
+    north, east = min(a[2], b[2]), min(a[3], b[3])
+    if south > north or west > east:
+        return None
+    return south, west, north, east
+
+
+# タップ検索のサブクエリ用スレッドプール（サブクエリごとに別セッション = 別のプール接続）
+_tap_executor = ThreadPoolExecutor(max_workers=settings.TAP_SEARCH_MAX_WORKERS, thread_name_prefix='tap-search')
+
+TAP_PARTS = ('building', 'restaurant', 'polygon')
+
+
+@trace_methods('service')
+class TapSearchService:
+    """
+    地図タップ1回分（座標の建物・最寄りレストラン・建物ポリゴン）をまとめて返すビジネスロジック
+    従来の search/spatial → search/optimized → buildings/<osm_id> の順次呼び出しを1往復にし、
+    互いに独立なサブクエリは別セッションで並行実行する
+    """
+    
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+    
+    def search(self, lat: float, lng: float, include: Sequence[str] = TAP_PARTS) -> Dict[str, Any]:
+        """
+        include: 'building'（座標を含む建物）/ 'restaurant'（最寄りレストラン）/ 'polygon'（建物ポリゴン）
+        ポリゴンは座標の建物、なければ最寄りレストランの建物のもの
+        """
+        want_building = 'building' in include
+        want_restaurant = 'restaurant' in include
+        want_polygon = 'polygon' in include
+        
+        building_future = None
+        restaurant_future = None
+        if want_building or want_polygon:
+            building_future = self._submit(self._find_building, lat, lng, want_polygon)
+        if want_restaurant:
+            restaurant_future = self._submit(self._find_nearest_restaurant, lat, lng)
+        
+        building, polygon = building_future.result() if building_future else (None, None)
+        restaurant = restaurant_future.result() if restaurant_future else None
+        
+        osm_building_id = None
+        if building:
+            osm_building_id = building['osmId']
+        elif restaurant:
+            osm_building_id = restaurant['osmBuildingId']
+        
+        # 座標に建物がない場合は最寄りレストランの建物ポリゴン（レストラン検索の結果に依存するため後続で取得）
+        if want_polygon and polygon is None and osm_building_id:
+            polygon = self._with_session(lambda db: OSMBuildingService(db).get_building_by_osm_id(osm_building_id))
+        
+        found = building or restaurant
+        
+        return {
+            'building': building if want_building else None,
+            'restaurant': restaurant,
+            'buildingPolygon': polygon,
+            'osmBuildingId': osm_building_id,
+            'message': found['message'] if found else None,
+            'coordinates': {
+                'lat': lat,
+                'lng': lng
+            }
+        }
+    
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        # トレースのスパン等のコンテキストを引き継いでスレッドプールで実行
+        return _tap_executor.submit(contextvars.copy_context().run, fn, *args)
+    
+    def _with_session(self, work: Callable[[Session], Any]) -> Any:
+        db = self.session_factory()
+        try:
+            return work(db)
+        finally:
+            db.close()
+    
+    def _find_building(self, lat: float, lng: float, with_polygon: bool) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        座標を含む建物（と、必要ならそのポリゴン）
+        Returns: (building response, GeoJSON feature)
+        """
+        def work(db: Session):
+            # 属性はスナップショット・空セル判定・同時リクエストの集約を経由して取得
+            building = SpatialSearchService(db).find_building_at_location(lat, lng)
+            if not building or not with_polygon:
+                return building, None
+            return building, OSMBuildingService(db).get_building_by_osm_id(building['osmId'])
+        
+        return self._with_session(work)
+    
+    def _find_nearest_restaurant(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        return self._with_session(lambda db: RestaurantSearchService(db).search_nearest_restaurant_optimized(lat, lng))
+
+
+@trace_methods('service')
 class ValidationService:
     """
     入力値検証サービス
@@ -206,6 +547,10 @@ class ValidationService:
         """
         座標の有効性検証
         """
+        # 大半のリクエストは日本の範囲内なので、エラー一覧を組み立てずに返す
+        if 24 <= lat <= 46 and 123 <= lng <= 146:
+            return {'is_valid': True, 'errors': []}
+        
         errors = []
         
         # 緯度の範囲チェック（-90 to 90）
@@ -225,6 +570,77 @@ class ValidationService:
             'errors': errors
         }
     
+    @staticmethod
+    def validate_coordinates_batch(lats: Sequence[float], lngs: Sequence[float]) -> Dict[str, Any]:
+        """
+        座標列の一括検証（NumPyでまとめて範囲判定し、最初の不正な座標のみエラー文言を組み立てる）
+        Returns: is_valid, errors, invalid_index（不正な座標の位置、全て有効ならNone）
+        """
+        lat_array = np.asarray(lats, dtype=np.float64)
+        lng_array = np.asarray(lngs, dtype=np.float64)
+        
+        # 日本の範囲内であれば緯度・経度の範囲も満たす
+        valid = (lat_array >= 24) & (lat_array <= 46) & (lng_array >= 123) & (lng_array <= 146)
+        if valid.all():
+            return {'is_valid': True, 'errors': [], 'invalid_index': None}
+        
+        invalid_index = int(np.argmin(valid))
+        validation = ValidationService.validate_coordinates(float(lat_array[invalid_index]), float(lng_array[invalid_index]))
+        return {**validation, 'invalid_index': invalid_index}
+    
+    @staticmethod
+    def is_in_service_area(lat: float, lng: float) -> bool:
+        """
+        座標がデータのある範囲内か（build_service_area の範囲データ、未構築時は常にTrue）
+        建物の包含判定など、範囲外では必ず結果が空になる検索の前にセッションを開かずに判定する
+        """
+        return covers_point(lat, lng)
+    
+    @staticmethod
+    def is_radius_in_service_area(lat: float, lng: float, radius_meters: float) -> bool:
+        """座標から半径 radius_meters 以内にデータのある範囲が含まれるか（未構築時は常にTrue）"""
+        return covers_radius(lat, lng, radius_meters)
+    
+    @staticmethod
+    def is_route_in_service_area(lats: Sequence[float], lngs: Sequence[float], width_meters: float) -> bool:
+        """ルート全体のbbox（幅 width_meters を含む）にデータのある範囲が含まれるか（未構築時は常にTrue）"""
+        lat_array = np.asarray(lats, dtype=np.float64)
+        lng_array = np.asarray(lngs, dtype=np.float64)
+        # 経度方向の幅は赤道から最も遠い点で最大になるため、その緯度で求めた余白をbbox全体に使う
+        lat_margin, lng_margin = degrees_for_meters(float(np.abs(lat_array).max()), width_meters)
+        return covers_bbox(
+            float(lat_array.min()) - lat_margin, float(lng_array.min()) - lng_margin,
+            float(lat_array.max()) + lat_margin, float(lng_array.max()) + lng_margin
+        )
+    
+    @staticmethod
+    def validate_bbox(south: float, west: float, north: float, east: float) -> Dict[str, Any]:
+        """
+        表示範囲（bbox）の有効性検証
+        """
+        # NaN・無限大は比較が常に偽になり後続の範囲・幅の判定をすり抜けるため先に弾く
+        if not all(math.isfinite(value) for value in (south, west, north, east)):
+            return {
+                'is_valid': False,
+                'errors': ["表示範囲は有限の数値で指定してください"]
+            }
+        
+        errors = []
+        
+        if not (-90 <= south <= 90) or not (-90 <= north <= 90):
+            errors.append("緯度は-90から90の範囲で指定してください")
+        
+        if not (-180 <= west <= 180) or not (-180 <= east <= 180):
+            errors.append("経度は-180から180の範囲で指定してください")
+        
+        if south > north or west > east:
+            errors.append("表示範囲の南西・北東の指定が不正です")
+        
+        return {
+            'is_valid': len(errors) == 0,
+            'errors': errors
+        }
+    
     @staticmethod
     def validate_search_radius(radius: float) -> Dict[str, Any]:
         """
@@ -0,0 +1,575 @@
+"""
+Memory-mapped spatial index snapshot shared by all workers on a host
+restaurants / osm_buildings を配列ベースのバイナリファイル（座標・ID・ポリゴン頂点・パックドR-tree）に
+コンパイルし、各ワーカーは mmap でゼロコピー参照する（ページはホスト内で共有される）
+
+ファイル構成（リトルエンディアン、各セクションは8バイト境界に配置）:
+    ヘッダー     magic, format_version, node_size, built_at, 件数
+    セクション表 (offset, length) × SECTIONS
+    セクション本体
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from heapq import heappop, heappush
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .change_listener import RESYNC, ChangeEvent, get_change_listener, register_change_handler
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RSSNAP01'
+FORMAT_VERSION = 1
+NODE_SIZE = 16
+
+# magic, format_version, node_size, built_at, n_restaurants, n_buildings, n_rings, n_vertices
+HEADER = struct.Struct('<8sIIdQQQQ')
+
+# (セクション名, array typecode)
+SECTIONS = (
+    ('r_coords', 'd'),         # [lat, lng] × n_restaurants
+    ('r_tree_boxes', 'd'),     # パックドR-tree ノードbbox [min_x, min_y, max_x, max_y]
+    ('r_tree_indices', 'I'),   # 葉: レストラン番号 / 内部ノード: 先頭の子ノード位置
+    ('r_tree_levels', 'I'),    # 各レベルの終端ノード位置
+    ('r_prop_offsets', 'Q'),   # r_props 内の各JSONの開始位置（n_restaurants + 1）
+    ('r_props', 'B'),          # Restaurant.to_dict() のJSON
+    ('b_tree_boxes', 'd'),
+    ('b_tree_indices', 'I'),
+    ('b_tree_levels', 'I'),
+    ('b_ring_index', 'I'),     # 建物ごとのリング範囲（n_buildings + 1）
+    ('b_vertex_index', 'I'),   # リングごとの頂点範囲（n_rings + 1）
+    ('b_vertices', 'd'),       # [lng, lat] × n_vertices
+    ('b_prop_offsets', 'Q'),
+    ('b_props', 'B'),          # 建物属性のJSON
+)
+SECTION_TABLE = struct.Struct('<' + 'QQ' * len(SECTIONS))
+
+# 変更通知で汚れた範囲を個別に保持する上限（超えたら全体を無効扱い）
+MAX_DIRTY_BBOXES = 10000
+
+
+class SnapshotFormatError(ValueError):
+    """スナップショットファイルの形式・バージョン不一致"""
+
+
+def _hilbert(x: int, y: int) -> int:
+    """16bitグリッド座標のヒルベルト曲線上の位置（葉の並び順に使用）"""
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+    
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+    
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C ^= (a & (c >> 2)) ^ (b & (d >> 2))
+    D ^= (b & (c >> 2)) ^ ((a ^ b) & (d >> 2))
+    
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C ^= (a & (c >> 4)) ^ (b & (d >> 4))
+    D ^= (b & (c >> 4)) ^ ((a ^ b) & (d >> 4))
+    
+    a, b, c, d = A, B, C, D
+    C ^= (a & (c >> 8)) ^ (b & (d >> 8))
+    D ^= (b & (c >> 8)) ^ ((a ^ b) & (d >> 8))
+    
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+    
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+    
+    i0 = (i0 | (i0 << 8)) & 0x00FF00FF
+    i0 = (i0 | (i0 << 4)) & 0x0F0F0F0F
+    i0 = (i0 | (i0 << 2)) & 0x33333333
+    i0 = (i0 | (i0 << 1)) & 0x55555555
+    
+    i1 = (i1 | (i1 << 8)) & 0x00FF00FF
+    i1 = (i1 | (i1 << 4)) & 0x0F0F0F0F
+    i1 = (i1 | (i1 << 2)) & 0x33333333
+    i1 = (i1 | (i1 << 1)) & 0x55555555
+    
+    return ((i1 << 1) | i0) & 0xFFFFFFFF
+
+
+class PackedRTree:
+    """
+    静的なパックドR-tree（葉をヒルベルト順に並べ、NODE_SIZE 件ずつ親ノードにまとめる）
+    boxes / indices はスナップショット上の memoryview をそのまま参照する
+    """
+    
+    def __init__(self, boxes: Sequence[float], indices: Sequence[int], level_bounds: Sequence[int],
+                 node_size: int = NODE_SIZE):
+        self.boxes = boxes
+        self.indices = indices
+        self.level_bounds = list(level_bounds)
+        self.node_size = node_size
+        self.num_items = self.level_bounds[0] if self.level_bounds else 0
+        self.num_nodes = self.level_bounds[-1] if self.level_bounds else 0
+    
+    @staticmethod
+    def build(item_boxes: List[Tuple[float, float, float, float]],
+              node_size: int = NODE_SIZE) -> Tuple[array, array, array]:
+        """
+        アイテムのbbox一覧からツリーを構築
+        Returns: (boxes, indices, level_bounds)
+        """
+        num_items = len(item_boxes)
+        if num_items == 0:
+            return array('d'), array('I'), array('I')
+        
+        level_bounds = [num_items]
+        count = num_items
+        num_nodes = num_items
+        while True:
+            count = math.ceil(count / node_size)
+            num_nodes += count
+            level_bounds.append(num_nodes)
+            if count == 1:
+                break
+        
+        # 葉をbbox中心のヒルベルト順に並べる
+        min_x = min(box[0] for box in item_boxes)
+        min_y = min(box[1] for box in item_boxes)
+        width = (max(box[2] for box in item_boxes) - min_x) or 1.0
+        height = (max(box[3] for box in item_boxes) - min_y) or 1.0
+        
+        def hilbert_key(item: int) -> int:
+            box = item_boxes[item]
+            hx = int(0xFFFF * ((box[0] + box[2]) / 2 - min_x) / width)
+            hy = int(0xFFFF * ((box[1] + box[3]) / 2 - min_y) / height)
+            return _hilbert(hx, hy)
+        
+        order = sorted(range(num_items), key=hilbert_key)
+        
+        boxes = array('d', bytes(8 * 4 * num_nodes))
+        indices = array('I', bytes(4 * num_nodes))
+        for pos, item in enumerate(order):
+            boxes[pos * 4:pos * 4 + 4] = array('d', item_boxes[item])
+            indices[pos] = item
+        
+        # 下位レベルから親ノードを作成
+        pos = 0
+        out = num_items
+        for end in level_bounds[:-1]:
+            while pos < end:
+                first_child = pos
+                node_min_x = node_min_y = math.inf
+                node_max_x = node_max_y = -math.inf
+                for _ in range(node_size):
+                    if pos >= end:
+                        break
+                    node_min_x = min(node_min_x, boxes[pos * 4])
+                    node_min_y = min(node_min_y, boxes[pos * 4 + 1])
+                    node_max_x = max(node_max_x, boxes[pos * 4 + 2])
+                    node_max_y = max(node_max_y, boxes[pos * 4 + 3])
+                    pos += 1
+                boxes[out * 4:out * 4 + 4] = array('d', (node_min_x, node_min_y, node_max_x, node_max_y))
+                indices[out] = first_child
+                out += 1
+        
+        return boxes, indices, array('I', level_bounds)
+    
+    def _group_end(self, node: int) -> int:
+        """兄弟ノード群の終端（同じレベルの終端を超えない）"""
+        return min(node + self.node_size, self.level_bounds[bisect_right(self.level_bounds, node)])
+    
+    def search(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[int]:
+        """bboxと交差するアイテム番号の一覧"""
+        if self.num_nodes == 0:
+            return []
+        
+        boxes = self.boxes
+        results = []
+        queue = []
+        node = self.num_nodes - 1
+        
+        while True:
+            for pos in range(node, self._group_end(node)):
+                b = pos * 4
+                if max_x < boxes[b] or max_y < boxes[b + 1] or min_x > boxes[b + 2] or min_y > boxes[b + 3]:
+                    continue
+                if node >= self.num_items:
+                    queue.append(self.indices[pos])
+                else:
+                    results.append(self.indices[pos])
+            
+            if not queue:
+                return results
+            node = queue.pop()
+    
+    def nearest(self, x: float, y: float, max_results: int = 1) -> List[Tuple[int, float]]:
+        """
+        点に近い順のアイテム（bbox距離、点アイテムでは厳密なユークリッド距離）
+        Returns: List[(item, distance)]
+        """
+        if self.num_nodes == 0:
+            return []
+        
+        boxes = self.boxes
+        results = []
+        heap = []
+        node = self.num_nodes - 1
+        
+        while True:
+            is_leaf_group = node < self.num_items
+            for pos in range(node, self._group_end(node)):
+                b = pos * 4
+                dx = boxes[b] - x if x < boxes[b] else (x - boxes[b + 2] if x > boxes[b + 2] else 0.0)
+                dy = boxes[b + 1] - y if y < boxes[b + 1] else (y - boxes[b + 3] if y > boxes[b + 3] else 0.0)
+                heappush(heap, (dx * dx + dy * dy, is_leaf_group, self.indices[pos]))
+            
+            while heap and heap[0][1]:
+                distance, _, item = heappop(heap)
+                results.append((item, math.sqrt(distance)))
+                if len(results) >= max_results:
+                    return results
+            
+            if not heap:
+                return results
+            node = heappop(heap)[2]
+
+
+class SpatialSnapshot:
+    """
+    mmapしたスナップショットファイル
+    配列は memoryview.cast で直接参照し、属性JSONはヒット時のみデコードする
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as snapshot_file:
+            stat = os.fstat(snapshot_file.fileno())
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        
+        buffer = memoryview(self._mmap)
+        (magic, format_version, node_size, self.built_at,
+         self.n_restaurants, self.n_buildings, n_rings, n_vertices) = HEADER.unpack_from(buffer, 0)
+        
+        if magic != MAGIC:
+            raise SnapshotFormatError(f"Not a spatial snapshot: {path}")
+        if format_version != FORMAT_VERSION:
+            raise SnapshotFormatError(f"Unsupported snapshot format version {format_version} (expected {FORMAT_VERSION})")
+        
+        table = SECTION_TABLE.unpack_from(buffer, HEADER.size)
+        sections = {}
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = table[i * 2], table[i * 2 + 1]
+            sections[name] = buffer[offset:offset + length].cast(typecode)
+        
+        self._r_coords = sections['r_coords']
+        self._r_prop_offsets = sections['r_prop_offsets']
+        self._r_props = sections['r_props']
+        self._b_ring_index = sections['b_ring_index']
+        self._b_vertex_index = sections['b_vertex_index']
+        self._b_vertices = sections['b_vertices']
+        self._b_prop_offsets = sections['b_prop_offsets']
+        self._b_props = sections['b_props']
+        
+        self.restaurant_tree = PackedRTree(
+            sections['r_tree_boxes'], sections['r_tree_indices'], sections['r_tree_levels'], node_size
+        )
+        self.building_tree = PackedRTree(
+            sections['b_tree_boxes'], sections['b_tree_indices'], sections['b_tree_levels'], node_size
+        )
+    
+    @staticmethod
+    def _decode(offsets, blob, index: int) -> Dict[str, Any]:
+        return json.loads(bytes(blob[offsets[index]:offsets[index + 1]]))
+    
+    def restaurant_props(self, index: int) -> Dict[str, Any]:
+        """Restaurant.to_dict() 形式の属性"""
+        return self._decode(self._r_prop_offsets, self._r_props, index)
+    
+    def building_props(self, index: int) -> Dict[str, Any]:
+        """建物属性（osm_id, name, building_type, building_levels, building_material, building_use）"""
+        return self._decode(self._b_prop_offsets, self._b_props, index)
+    
+    def _building_contains(self, building: int, x: float, y: float) -> bool:
+        """レイキャスティングによる点の内外判定（穴を含む全リングで偶奇判定）"""
+        vertices = self._b_vertices
+        inside = False
+        for ring in range(self._b_ring_index[building], self._b_ring_index[building + 1]):
+            start, end = self._b_vertex_index[ring], self._b_vertex_index[ring + 1]
+            j = end - 1
+            for i in range(start, end):
+                xi, yi = vertices[i * 2], vertices[i * 2 + 1]
+                xj, yj = vertices[j * 2], vertices[j * 2 + 1]
+                if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+                    inside = not inside
+                j = i
+        return inside
+    
+    def find_building_by_point(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        """指定座標を含む建物の属性"""
+        for building in self.building_tree.search(lng, lat, lng, lat):
+            if self._building_contains(building, lng, lat):
+                return self.building_props(building)
+        return None
+    
+    def find_nearest_restaurant(self, lat: float, lng: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        最寄りレストラン（RestaurantRepository と同じ緯度経度上のユークリッド距離）
+        Returns: (restaurant dict, distance) or None
+        """
+        nearest = self.restaurant_tree.nearest(lng, lat, max_results=1)
+        if not nearest:
+            return None
+        index, distance = nearest[0]
+        return self.restaurant_props(index), distance
+
+
+def _pad(handle, alignment: int = 8) -> None:
+    remainder = handle.tell() % alignment
+    if remainder:
+        handle.write(b'\0' * (alignment - remainder))
+
+
+def build_snapshot(db: Session, path: str) -> Dict[str, int]:
+    """
+    DBからスナップショットファイルを構築（一時ファイルに書き出してから置き換え）
+    built_at は最初のSELECTより前の時刻とする（読み取り中にコミットされた変更を、構築後の変更として扱うため）
+    Returns: 件数サマリー
+    """
+    built_at = time.time()
+    
+    restaurant_rows = db.execute(text("""
+        SELECT id, name, address, opening_hours, rating::float8 AS rating,
+               lat::float8 AS lat, lng::float8 AS lng, osm_building_id
+        FROM restaurants
+        ORDER BY id
+    """)).mappings().all()
+    
+    r_coords = array('d')
+    r_boxes = []
+    r_props = []
+    for row in restaurant_rows:
+        r_coords.extend((row['lat'], row['lng']))
+        r_boxes.append((row['lng'], row['lat'], row['lng'], row['lat']))
+        r_props.append({
+            'id': row['id'],
+            'name': row['name'],
+            'address': row['address'],
+            'openingHours': row['opening_hours'],
+            'rating': row['rating'],
+            'lat': row['lat'],
+            'lng': row['lng'],
+            'osmBuildingId': row['osm_building_id']
+        })
+    
+    building_rows = db.execute(text("""
+        SELECT osm_id, name, building_type, building_levels, building_material, building_use,
+               ST_AsGeoJSON(geometry)::json -> 'coordinates' AS coordinates
+        FROM osm_buildings
+        ORDER BY osm_id
+    """)).mappings()
+    
+    b_boxes = []
+    b_props = []
+    b_ring_index = array('I', [0])
+    b_vertex_index = array('I', [0])
+    b_vertices = array('d')
+    for row in building_rows:
+        rings = row['coordinates'] or []
+        xs = [point[0] for ring in rings for point in ring]
+        ys = [point[1] for ring in rings for point in ring]
+        if not xs:
+            continue
+        
+        for ring in rings:
+            for lng, lat in ring:
+                b_vertices.extend((lng, lat))
+            b_vertex_index.append(len(b_vertices) // 2)
+        b_ring_index.append(len(b_vertex_index) - 1)
+        b_boxes.append((min(xs), min(ys), max(xs), max(ys)))
+        b_props.append({
+            'osm_id': row['osm_id'],
+            'name': row['name'],
+            'building_type': row['building_type'],
+            'building_levels': row['building_levels'],
+            'building_material': row['building_material'],
+            'building_use': row['building_use']
+        })
+    
+    def string_table(items: List[Dict[str, Any]]) -> Tuple[array, bytes]:
+        offsets = array('Q', [0])
+        blob = bytearray()
+        for item in items:
+            blob += json.dumps(item, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            offsets.append(len(blob))
+        return offsets, bytes(blob)
+    
+    r_tree_boxes, r_tree_indices, r_tree_levels = PackedRTree.build(r_boxes)
+    b_tree_boxes, b_tree_indices, b_tree_levels = PackedRTree.build(b_boxes)
+    r_prop_offsets, r_prop_blob = string_table(r_props)
+    b_prop_offsets, b_prop_blob = string_table(b_props)
+    
+    payloads = {
+        'r_coords': r_coords,
+        'r_tree_boxes': r_tree_boxes,
+        'r_tree_indices': r_tree_indices,
+        'r_tree_levels': r_tree_levels,
+        'r_prop_offsets': r_prop_offsets,
+        'r_props': r_prop_blob,
+        'b_tree_boxes': b_tree_boxes,
+        'b_tree_indices': b_tree_indices,
+        'b_tree_levels': b_tree_levels,
+        'b_ring_index': b_ring_index,
+        'b_vertex_index': b_vertex_index,
+        'b_vertices': b_vertices,
+        'b_prop_offsets': b_prop_offsets,
+        'b_props': b_prop_blob,
+    }
+    
+    n_rings = len(b_vertex_index) - 1
+    n_vertices = len(b_vertices) // 2
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    
+    with open(tmp_path, 'wb') as handle:
+        handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, NODE_SIZE, built_at,
+                                 len(r_props), len(b_props), n_rings, n_vertices))
+        table_offset = handle.tell()
+        handle.write(bytes(SECTION_TABLE.size))
+        
+        table = []
+        for name, _ in SECTIONS:
+            _pad(handle)
+            offset = handle.tell()
+            data = payloads[name]
+            handle.write(data.tobytes() if isinstance(data, array) else data)
+            table.extend((offset, handle.tell() - offset))
+        
+        handle.seek(table_offset)
+        handle.write(SECTION_TABLE.pack(*table))
+    
+    os.replace(tmp_path, path)
+    
+    return {
+        'restaurants': len(r_props),
+        'buildings': len(b_props),
+        'rings': n_rings,
+        'vertices': n_vertices
+    }
+
+
+class _SnapshotState:
+    """
+    プロセス内のスナップショット参照と、構築後に変更された範囲の追跡
+    変更通知（change_listener）で汚れた範囲はDBへフォールバックさせる
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot: Optional[SpatialSnapshot] = None
+        self.checked_at = 0.0
+        self.restaurants_changed_at = 0.0
+        self.buildings_changed_at = 0.0  # RESYNC・上限超過時は全建物を汚れ扱い
+        self.dirty_bboxes: List[Tuple[float, float, float, float, float]] = []  # (changed_at, south, west, north, east)
+    
+    def on_restaurant_change(self, event: ChangeEvent) -> None:
+        self.restaurants_changed_at = time.time()
+    
+    def on_building_change(self, event: ChangeEvent) -> None:
+        changed_at = time.time()
+        if event.op == RESYNC:
+            self.buildings_changed_at = changed_at
+            return
+        
+        with self.lock:
+            for values in (event.old, event.new):
+                if values and values.get('bbox'):
+                    self.dirty_bboxes.append((changed_at, *values['bbox']))
+            if len(self.dirty_bboxes) > MAX_DIRTY_BBOXES:
+                self.dirty_bboxes = []
+                self.buildings_changed_at = changed_at
+
+
+_state = _SnapshotState()
+register_change_handler('restaurants', _state.on_restaurant_change)
+register_change_handler('osm_buildings', _state.on_building_change)
+
+
+def get_spatial_snapshot() -> Optional[SpatialSnapshot]:
+    """
+    現在のスナップショット（SPATIAL_SNAPSHOT_PATH 未設定・未構築時はNone）
+    ファイルが置き換えられたら次回チェック時に再mmapする
+    """
+    path = settings.SPATIAL_SNAPSHOT_PATH
+    if not path:
+        return None
+    
+    now = time.monotonic()
+    if _state.snapshot is not None and now - _state.checked_at < settings.SPATIAL_SNAPSHOT_RELOAD_CHECK_SECONDS:
+        return _state.snapshot
+    
+    with _state.lock:
+        _state.checked_at = now
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _state.snapshot = None
+            return None
+        
+        if _state.snapshot is None or _state.snapshot.file_id != (stat.st_ino, stat.st_mtime_ns):
+            try:
+                # 古いmmapは参照中のスレッドがなくなった時点で解放される
+                _state.snapshot = SpatialSnapshot(path)
+                _state.dirty_bboxes = [
+                    dirty for dirty in _state.dirty_bboxes if dirty[0] > _state.snapshot.built_at
+                ]
+                logger.info(f"Spatial snapshot loaded: {path}")
+            except (OSError, ValueError, struct.error) as e:
+                logger.error(f"Spatial snapshot load error: {str(e)}")
+                _state.snapshot = None
+        
+        return _state.snapshot
+
+
+def snapshot_is_tracked(snapshot: SpatialSnapshot) -> bool:
+    """
+    構築後の変更を把握できているか
+    変更通知を受信中なら汚れた範囲で判定でき、受信していない場合は構築から SPATIAL_SNAPSHOT_MAX_AGE 秒以内のみ
+    """
+    listener = get_change_listener()
+    if listener is not None and listener.connected:
+        return True
+    return time.time() - snapshot.built_at < settings.SPATIAL_SNAPSHOT_MAX_AGE
+
+
+def snapshot_covers_restaurants(snapshot: SpatialSnapshot) -> bool:
+    """スナップショット構築後にレストランの変更がないか"""
+    if not snapshot_is_tracked(snapshot):
+        return False
+    return _state.restaurants_changed_at <= snapshot.built_at
+
+
+def snapshot_covers_point(snapshot: SpatialSnapshot, lat: float, lng: float) -> bool:
+    """スナップショット構築後に指定座標付近の建物が変更されていないか"""
+    if not snapshot_is_tracked(snapshot):
+        return False
+    if _state.buildings_changed_at > snapshot.built_at:
+        return False
+    
+    for changed_at, south, west, north, east in _state.dirty_bboxes:
+        if changed_at > snapshot.built_at and south <= lat <= north and west <= lng <= east:
+            return False
+    return True
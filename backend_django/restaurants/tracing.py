@@ -0,0 +1,245 @@
+"""
+Span-based request tracing (OpenTelemetry API)
+view → *Service → *Repository → SQL の各層にスパンを作成し、どの層で時間を使っているかを可視化する
+TRACING_ENABLED が無効、または opentelemetry が未インストールの場合は何もしない
+"""
+import functools
+import inspect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # pragma: no cover - optional dependency
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = 'restaurants'
+
+# Session.info のキー（最初のSQL実行開始時刻）
+_CHECKOUT_STARTED = 'tracing_checkout_started_ns'
+
+
+def tracing_enabled() -> bool:
+    return bool(settings.TRACING_ENABLED) and trace is not None
+
+
+def get_tracer():
+    return trace.get_tracer(TRACER_NAME)
+
+
+def configure_tracing() -> None:
+    """
+    TracerProvider を設定（AppConfig.ready から呼ばれる）
+    TRACING_EXPORTER: 'console'（標準出力）/ 'file'（TRACING_FILE_PATH に1行1スパンのJSON）
+    TRACING_SAMPLE_RATE: ルートスパンのサンプリング率（0.0～1.0）
+    """
+    if not settings.TRACING_ENABLED:
+        return
+    
+    if trace is None:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing disabled")
+        return
+    
+    if settings.TRACING_EXPORTER == 'file':
+        exporter = ConsoleSpanExporter(
+            out=open(settings.TRACING_FILE_PATH, 'a', encoding='utf-8'),
+            formatter=lambda span: span.to_json(indent=None) + '\n'
+        )
+    else:
+        exporter = ConsoleSpanExporter()
+    
+    provider = TracerProvider(
+        resource=Resource.create({'service.name': settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE))
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    event.listen(Session, 'do_orm_execute', _before_session_execute)
+    event.listen(Session, 'do_orm_execute', _hydrate_with_span)
+    event.listen(Session, 'after_begin', _after_session_begin)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Any]]:
+    """任意の処理ブロックをスパンで囲む（無効時は何もしない）"""
+    if not tracing_enabled():
+        yield None
+        return
+    
+    with get_tracer().start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+def _wrap(func: Callable, name: str, layer: str) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with get_tracer().start_as_current_span(name, attributes={'app.layer': layer}):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def trace_methods(layer: str) -> Callable[[type], type]:
+    """
+    クラスデコレーター: 公開メソッドを '<Class>.<method>' スパンで囲む
+    インポート時に TRACING_ENABLED が無効ならクラスをそのまま返す（オーバーヘッドなし）
+    """
+    def decorate(cls: type) -> type:
+        if not tracing_enabled():
+            return cls
+        
+        for attr_name, attr in list(vars(cls).items()):
+            if attr_name.startswith('_'):
+                continue
+            
+            name = f'{cls.__name__}.{attr_name}'
+            if isinstance(attr, staticmethod):
+                setattr(cls, attr_name, staticmethod(_wrap(attr.__func__, name, layer)))
+            elif isinstance(attr, classmethod):
+                setattr(cls, attr_name, classmethod(_wrap(attr.__func__, name, layer)))
+            elif inspect.isfunction(attr):
+                setattr(cls, attr_name, _wrap(attr, name, layer))
+        return cls
+    
+    return decorate
+
+
+def traced(layer: str) -> Callable[[Callable], Callable]:
+    """関数デコレーター: 関数を '<qualname>' スパンで囲む"""
+    def decorate(func: Callable) -> Callable:
+        if not tracing_enabled():
+            return func
+        return _wrap(func, func.__qualname__, layer)
+    
+    return decorate
+
+
+# --- SQLAlchemy: セッションのコネクション取得・SQL実行 ---
+
+def _before_session_execute(orm_execute_state) -> None:
+    session = orm_execute_state.session
+    if not session.in_transaction():
+        session.info[_CHECKOUT_STARTED] = time.time_ns()
+
+
+def _hydrate_with_span(orm_execute_state):
+    """
+    SELECT結果の取得とORMエンティティ・行オブジェクトへの変換（hydration）を orm.hydrate スパンとして記録
+    結果を一度すべて取り出すため、yield_per / stream_results のストリーミング読み取りは対象外
+    """
+    options = orm_execute_state.execution_options
+    if not orm_execute_state.is_select or options.get('yield_per') or options.get('stream_results'):
+        return None
+    
+    result = orm_execute_state.invoke_statement()
+    with get_tracer().start_as_current_span('orm.hydrate', attributes={'app.layer': 'orm'}) as hydrate:
+        frozen = result.freeze()
+        hydrate.set_attribute('orm.rows', len(frozen.data))
+    return frozen()
+
+
+def _after_session_begin(session, transaction, connection) -> None:
+    """最初のSQL実行からコネクション取得・トランザクション開始までを db.checkout スパンとして記録"""
+    started = session.info.pop(_CHECKOUT_STARTED, None)
+    if started is None:
+        return
+    
+    checkout = get_tracer().start_span(
+        'db.checkout',
+        start_time=started,
+        attributes={'app.layer': 'database', 'db.host': str(connection.engine.url.host)}
+    )
+    checkout.end()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    query_span = get_tracer().start_span(
+        'db.query',
+        attributes={
+            'app.layer': 'database',
+            'db.system': conn.dialect.name,
+            'db.statement': statement[:2000],
+            'db.host': str(conn.engine.url.host)
+        }
+    )
+    conn.info.setdefault('tracing_spans', []).append(query_span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    spans = conn.info.get('tracing_spans')
+    if spans:
+        query_span = spans.pop()
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            query_span.set_attribute('db.rowcount', cursor.rowcount)
+        query_span.end()
+
+
+def _handle_error(context) -> None:
+    connection = context.connection
+    spans = connection.info.get('tracing_spans') if connection is not None else None
+    if spans:
+        query_span = spans.pop()
+        query_span.record_exception(context.original_exception)
+        query_span.set_status(Status(StatusCode.ERROR))
+        query_span.end()
+
+
+# --- Django / DRF ---
+
+class TracingMiddleware:
+    """
+    リクエストごとのルートスパン（'HTTP <method> <url_name>'）
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        if not tracing_enabled():
+            return self.get_response(request)
+        
+        try:
+            route = resolve(request.path_info).url_name or request.path_info
+        except Resolver404:
+            route = request.path_info
+        
+        attributes: Dict[str, Any] = {
+            'app.layer': 'view',
+            'http.method': request.method,
+            'http.route': route,
+            'http.target': request.path_info
+        }
+        
+        with get_tracer().start_as_current_span(f'HTTP {request.method} {route}', attributes=attributes) as root:
+            response = self.get_response(request)
+            root.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                root.set_status(Status(StatusCode.ERROR))
+            return response
+
+
+class TracedJSONRenderer(JSONRenderer):
+    """レスポンスのJSONレンダリングを 'render' スパンとして記録"""
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span('render', **{'app.layer': 'render'}):
+            return super().render(data, accepted_media_type, renderer_context)
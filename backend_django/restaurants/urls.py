@@ -11,10 +11,17 @@ urlpatterns = [
     # PostGIS空間検索（新機能）
     path('search/spatial/', views.search_building_by_location, name='search_building_by_location'),
     path('search/spatial/nearby/', views.search_buildings_near_location, name='search_buildings_near_location'),
+    path('search/buildings/', views.search_buildings_with_restaurants, name='search_buildings_with_restaurants'),
+    path('search/tap/', views.search_tap, name='search_tap'),
+    path('search/viewport/', views.search_viewport, name='search_viewport'),
     
     # レストラン検索（従来機能）
     path('search/optimized/', views.search_restaurant, name='search_restaurant'),
     path('search/location/', views.search_restaurants_by_location, name='search_by_location'),
+    path('search/route/', views.search_restaurants_along_route, name='search_restaurants_along_route'),
+    
+    # マーカークラスタ（ズームレベル別事前集計）
+    path('search/clusters/', views.search_restaurant_clusters, name='search_restaurant_clusters'),
     
     # レストラン情報
     path('restaurants/', views.get_restaurants, name='get_restaurants'),
@@ -4,17 +4,48 @@ API Views for Restaurant Search
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from .models import get_db_session
-from .services import RestaurantSearchService, OSMBuildingService, ValidationService, SpatialSearchService
+from sqlalchemy.exc import OperationalError
+from .models import get_db_session, replica_router
+from .change_listener import get_change_listener
+from .coalescing import spatial_flight
+from .middleware import get_admission_status
+from .prepared_statements import statement_stats
+from .building_coverage import get_building_coverage_status
+from .service_area import get_service_area_status
+from .query_deadlines import (
+    deadline_for, deadline_stats, is_query_canceled, resolve_timeout, stale_key, stale_results
+)
+from .services import (
+    RestaurantSearchService, OSMBuildingService, ValidationService, SpatialSearchService, RestaurantClusterService,
+    TapSearchService, TAP_PARTS, ViewportService
+)
 import json
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
 
+def _deadline_exceeded_response(url_name: str, cache_key) -> Response:
+    """
+    statement_timeout 超過時の応答
+    同じ条件の直近の結果があれば stale を付けて返し、なければ即座に 503 + Retry-After
+    """
+    result = resolve_timeout(url_name, cache_key)
+    if result is not None:
+        return Response(result, status=status.HTTP_200_OK)
+    
+    response = Response({
+        'error': '検索がタイムアウトしました。検索範囲を狭めて再度お試しください'
+    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = str(settings.QUERY_DEADLINE_RETRY_AFTER)
+    return response
+
+
 @api_view(['POST'])
 def search_restaurant(request):
     """
@@ -241,15 +272,29 @@ def search_restaurants_by_location(request):
                 'error': ', '.join(radius_validation['errors'])
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # データベースセッション取得
-        db = next(get_db_session())
+        # データのある範囲外では結果が空になるため、セッションを開かずに返す
+        if not ValidationService.is_radius_in_service_area(lat, lng, radius * 1000):
+            return Response({
+                'restaurants': [],
+                'count': 0,
+                'search_params': {
+                    'lat': lat,
+                    'lng': lng,
+                    'radius_km': radius
+                }
+            }, status=status.HTTP_200_OK)
+        
+        # データベースセッション取得（エンドポイント別の statement_timeout 付き）
+        timeout_ms = deadline_for('search_by_location')
+        cache_key = stale_key(lat, lng, radius)
+        db = next(get_db_session(statement_timeout_ms=timeout_ms))
         
         try:
             # サービス実行
             service = RestaurantSearchService(db)
             results = service.search_restaurants_by_location(lat, lng, radius)
             
-            return Response({
+            response_data = {
                 'restaurants': results,
                 'count': len(results),
                 'search_params': {
@@ -257,7 +302,16 @@ def search_restaurants_by_location(request):
                     'lng': lng,
                     'radius_km': radius
                 }
-            }, status=status.HTTP_200_OK)
+            }
+            if timeout_ms:
+                stale_results.put('search_by_location', cache_key, response_data)
+            
+            return Response(response_data, status=status.HTTP_200_OK)
+            
+        except OperationalError as e:
+            if not is_query_canceled(e):
+                raise
+            return _deadline_exceeded_response('search_by_location', cache_key)
             
         finally:
             db.close()
@@ -280,11 +334,39 @@ def health_check(request):
         db = next(get_db_session())
         db.close()
         
-        return Response({
+        response = {
             'status': 'OK',
             'message': 'Restaurant Search API Server is running',
             'version': '1.0.0'
-        }, status=status.HTTP_200_OK)
+        }
+        
+        if replica_router is not None:
+            response['readReplicas'] = replica_router.status()
+        
+        response['coalescing'] = spatial_flight.status()
+        response['statementCache'] = statement_stats.status()
+        response['queryDeadlines'] = deadline_stats.status()
+        
+        # 流入制御の飽和状態
+        admission = get_admission_status()
+        response['admission'] = admission
+        if any(limiter['saturated'] for limiter in admission.values()):
+            response['status'] = 'DEGRADED'
+            response['message'] = 'Restaurant Search API Server is saturated'
+        
+        change_listener = get_change_listener()
+        if change_listener is not None:
+            response['changeListener'] = change_listener.status()
+        
+        building_coverage = get_building_coverage_status()
+        if building_coverage is not None:
+            response['buildingCoverage'] = building_coverage
+        
+        service_area = get_service_area_status()
+        if service_area is not None:
+            response['serviceArea'] = service_area
+        
+        return Response(response, status=status.HTTP_200_OK)
         
     except Exception as e:
         logger.error(f"Health check error: {str(e)}")
@@ -329,6 +411,13 @@ def search_building_by_location(request):
                 'error': ', '.join(validation['errors'])
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        # データのある範囲外では建物が見つからないため、セッションを開かずに返す
+        if not ValidationService.is_in_service_area(lat, lng):
+            return Response({
+                'error': 'この座標には建物が見つかりませんでした',
+                'coordinates': {'lat': lat, 'lng': lng}
+            }, status=status.HTTP_404_NOT_FOUND)
+        
         # データベースセッション取得
         db = next(get_db_session())
         
@@ -398,15 +487,29 @@ def search_buildings_near_location(request):
                 'error': '半径は1～1000メートルの範囲で指定してください'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # データベースセッション取得
-        db = next(get_db_session())
+        # データのある範囲外では結果が空になるため、セッションを開かずに返す
+        if not ValidationService.is_radius_in_service_area(lat, lng, radius):
+            return Response({
+                'buildings': [],
+                'count': 0,
+                'search_params': {
+                    'lat': lat,
+                    'lng': lng,
+                    'radius_meters': radius
+                }
+            }, status=status.HTTP_200_OK)
+        
+        # データベースセッション取得（エンドポイント別の statement_timeout 付き）
+        timeout_ms = deadline_for('search_buildings_near_location')
+        cache_key = stale_key(lat, lng, radius)
+        db = next(get_db_session(statement_timeout_ms=timeout_ms))
         
         try:
             # 空間検索サービス実行
             service = SpatialSearchService(db)
             results = service.find_buildings_near_location(lat, lng, radius)
             
-            return Response({
+            response_data = {
                 'buildings': results,
                 'count': len(results),
                 'search_params': {
@@ -414,7 +517,16 @@ def search_buildings_near_location(request):
                     'lng': lng,
                     'radius_meters': radius
                 }
-            }, status=status.HTTP_200_OK)
+            }
+            if timeout_ms:
+                stale_results.put('search_buildings_near_location', cache_key, response_data)
+            
+            return Response(response_data, status=status.HTTP_200_OK)
+            
+        except OperationalError as e:
+            if not is_query_canceled(e):
+                raise
+            return _deadline_exceeded_response('search_buildings_near_location', cache_key)
             
         finally:
             db.close()
@@ -423,4 +535,412 @@ def search_buildings_near_location(request):
         logger.error(f"Nearby spatial search error: {str(e)}")
         return Response({
             'error': 'サーバー内部エラーが発生しました'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def search_buildings_with_restaurants(request):
+    """
+    建物別レストラン一括取得API
+    POST /api/search/buildings
+    座標（lat, lng）またはOSM IDリスト（osm_ids）から、建物と入居レストランをまとめて返す
+    """
+    try:
+        # リクエストデータ取得
+        data = request.data
+        lat = data.get('lat')
+        lng = data.get('lng')
+        osm_ids = data.get('osm_ids')
+        
+        if osm_ids is not None:
+            # OSM IDリスト指定
+            if not isinstance(osm_ids, list) or not osm_ids or not all(isinstance(osm_id, str) for osm_id in osm_ids):
+                return Response({
+                    'error': 'osm_idsは文字列のリストで指定してください'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            if len(osm_ids) > 100:
+                return Response({
+                    'error': 'osm_idsは100件以下で指定してください'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            lat = lng = None
+        else:
+            # 必須パラメータチェック
+            if lat is None or lng is None:
+                return Response({
+                    'error': '緯度(lat)と経度(lng)、またはosm_idsは必須です'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 型変換
+            try:
+                lat = float(lat)
+                lng = float(lng)
+            except (ValueError, TypeError):
+                return Response({
+                    'error': '緯度・経度は数値で入力してください'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            # 座標検証
+            validation = ValidationService.validate_coordinates(lat, lng)
+            if not validation['is_valid']:
+                return Response({
+                    'error': ', '.join(validation['errors'])
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # データベースセッション取得
+        db = next(get_db_session())
+        
+        try:
+            # サービス実行
+            service = RestaurantSearchService(db)
+            buildings = service.get_buildings_with_restaurants(lat=lat, lng=lng, osm_ids=osm_ids)
+            
+            if not buildings and osm_ids is None:
+                return Response({
+                    'error': 'この座標には建物が見つかりませんでした',
+                    'coordinates': {'lat': lat, 'lng': lng}
+                }, status=status.HTTP_404_NOT_FOUND)
+            
+            return Response({
+                'buildings': buildings,
+                'count': len(buildings)
+            }, status=status.HTTP_200_OK)
+            
+        finally:
+            db.close()
+            
+    except Exception as e:
+        logger.error(f"Buildings with restaurants search error: {str(e)}")
+        return Response({
+            'error': 'サーバー内部エラーが発生しました'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def search_restaurant_clusters(request):
+    """
+    マーカークラスタ取得API（ズームレベル別事前集計）
+    POST /api/search/clusters
+    表示範囲（south, west, north, east）とズームレベル（zoom）からクラスタの重心・件数・代表レストランを返す
+    """
+    try:
+        # リクエストデータ取得
+        data = request.data
+        bbox = [data.get(key) for key in ('south', 'west', 'north', 'east')]
+        zoom = data.get('zoom')
+        
+        # 必須パラメータチェック
+        if any(value is None for value in bbox) or zoom is None:
+            return Response({
+                'error': '表示範囲(south, west, north, east)とズームレベル(zoom)は必須です'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 型変換
+        try:
+            south, west, north, east = [float(value) for value in bbox]
+            zoom = int(zoom)
+        except (ValueError, TypeError):
+            return Response({
+                'error': '表示範囲・ズームレベルは数値で入力してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 範囲検証
+        validation = ValidationService.validate_bbox(south, west, north, east)
+        if not validation['is_valid']:
+            return Response({
+                'error': ', '.join(validation['errors'])
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not (0 <= zoom <= 22):
+            return Response({
+                'error': 'ズームレベルは0～22の範囲で指定してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # データベースセッション取得
+        db = next(get_db_session())
+        
+        try:
+            # サービス実行
+            service = RestaurantClusterService(db)
+            result = service.get_clusters(south, west, north, east, zoom)
+            
+            return Response({
+                **result,
+                'count': len(result['clusters']),
+                'search_params': {
+                    'south': south,
+                    'west': west,
+                    'north': north,
+                    'east': east,
+                    'zoom': zoom
+                }
+            }, status=status.HTTP_200_OK)
+            
+        finally:
+            db.close()
+            
+    except Exception as e:
+        logger.error(f"Cluster search error: {str(e)}")
+        return Response({
+            'error': 'サーバー内部エラーが発生しました'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def search_tap(request):
+    """
+    地図タップ検索API（建物・最寄りレストラン・建物ポリゴンを1往復で取得）
+    POST /api/search/tap
+    include（'building', 'restaurant', 'polygon' のリスト、省略時は全て）で取得対象を選択
+    """
+    try:
+        # リクエストデータ取得
+        data = request.data
+        lat = data.get('lat')
+        lng = data.get('lng')
+        include = data.get('include', list(TAP_PARTS))
+        
+        # 必須パラメータチェック
+        if lat is None or lng is None:
+            return Response({
+                'error': '緯度(lat)と経度(lng)は必須です'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 型変換
+        try:
+            lat = float(lat)
+            lng = float(lng)
+        except (ValueError, TypeError):
+            return Response({
+                'error': '緯度・経度は数値で入力してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if isinstance(include, str):
+            include = [part.strip() for part in include.split(',') if part.strip()]
+        
+        if not isinstance(include, list) or not include or any(part not in TAP_PARTS for part in include):
+            return Response({
+                'error': f"include は {', '.join(TAP_PARTS)} から1つ以上指定してください"
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 座標検証
+        validation = ValidationService.validate_coordinates(lat, lng)
+        if not validation['is_valid']:
+            return Response({
+                'error': ', '.join(validation['errors'])
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # サービス実行（サブクエリごとにセッションを取得）
+        service = TapSearchService()
+        result = service.search(lat, lng, include)
+        
+        if not (result['building'] or result['restaurant'] or result['buildingPolygon']):
+            return Response({
+                'error': 'この座標周辺には建物・レストランが見つかりませんでした',
+                'coordinates': {'lat': lat, 'lng': lng}
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response(result, status=status.HTTP_200_OK)
+        
+    except Exception as e:
+        logger.error(f"Tap search error: {str(e)}")
+        return Response({
+            'error': 'サーバー内部エラーが発生しました'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def search_viewport(request):
+    """
+    表示範囲差分API（パン・ズーム時の地物の増減）
+    POST /api/search/viewport
+    新しい表示範囲（south, west, north, east）と、前回の表示範囲（previous）または前回レスポンスの token から
+    入ってくる建物・レストラン（entering）と出ていくID（leaving）を返す
+    """
+    try:
+        # リクエストデータ取得
+        data = request.data
+        bbox = [data.get(key) for key in ('south', 'west', 'north', 'east')]
+        previous = data.get('previous')
+        token = data.get('token')
+        
+        # 必須パラメータチェック
+        if any(value is None for value in bbox):
+            return Response({
+                'error': '表示範囲(south, west, north, east)は必須です'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 型変換
+        try:
+            bbox = tuple(float(value) for value in bbox)
+            if previous is not None:
+                previous = tuple(float(previous[key]) for key in ('south', 'west', 'north', 'east'))
+        except (ValueError, TypeError, KeyError):
+            return Response({
+                'error': '表示範囲は数値で入力してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 範囲検証（前回の表示範囲も差分クエリの対象になるため同じ上限を適用）
+        for target in (bbox, previous):
+            if target is None:
+                continue
+            validation = ValidationService.validate_bbox(*target)
+            if not validation['is_valid']:
+                return Response({
+                    'error': ', '.join(validation['errors'])
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            target_south, target_west, target_north, target_east = target
+            if (target_north - target_south > settings.VIEWPORT_MAX_SPAN_DEGREES
+                    or target_east - target_west > settings.VIEWPORT_MAX_SPAN_DEGREES):
+                return Response({
+                    'error': f'表示範囲は{settings.VIEWPORT_MAX_SPAN_DEGREES}度以内で指定してください'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        south, west, north, east = bbox
+        
+        # トークン検証（前回の表示範囲と取得時刻）
+        since = None
+        if token:
+            try:
+                previous, since = ViewportService.parse_token(token)
+            except ValueError:
+                return Response({
+                    'error': 'トークンが無効または期限切れです。previous を指定するか、トークンなしで再取得してください'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # データベースセッション取得
+        db = next(get_db_session())
+        
+        try:
+            # サービス実行
+            service = ViewportService(db)
+            result = service.get_viewport_diff(bbox, previous, since)
+            
+            return Response({
+                **result,
+                'search_params': {
+                    'south': south,
+                    'west': west,
+                    'north': north,
+                    'east': east
+                }
+            }, status=status.HTTP_200_OK)
+            
+        finally:
+            db.close()
+            
+    except Exception as e:
+        logger.error(f"Viewport diff error: {str(e)}")
+        return Response({
+            'error': 'サーバー内部エラーが発生しました'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+def search_restaurants_along_route(request):
+    """
+    ルート沿いレストラン検索API
+    POST /api/search/route
+    折れ線（path: [{lat, lng}, ...]）から width メートル以内のレストランをルート上の位置順に返す
+    """
+    try:
+        # リクエストデータ取得
+        data = request.data
+        path = data.get('path')
+        width = data.get('width', 100)  # デフォルト100メートル
+        limit = data.get('limit', settings.ROUTE_SEARCH_MAX_RESULTS)
+        
+        # 必須パラメータチェック
+        if not isinstance(path, list) or len(path) < 2:
+            return Response({
+                'error': 'ルート(path)は2点以上の座標リストで指定してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if len(path) > settings.ROUTE_MAX_POINTS:
+            return Response({
+                'error': f'ルートの座標は{settings.ROUTE_MAX_POINTS}点以下で指定してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 型変換
+        try:
+            path = [(float(point['lat']), float(point['lng'])) for point in path]
+            width = float(width)
+            limit = int(limit)
+        except (ValueError, TypeError, KeyError):
+            return Response({
+                'error': 'ルートの緯度・経度、幅、件数は数値で入力してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 座標検証（全点を一括で判定）
+        lats = [lat for lat, _ in path]
+        lngs = [lng for _, lng in path]
+        validation = ValidationService.validate_coordinates_batch(lats, lngs)
+        if not validation['is_valid']:
+            lat, lng = path[validation['invalid_index']]
+            return Response({
+                'error': ', '.join(validation['errors']),
+                'coordinates': {'lat': lat, 'lng': lng}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 幅・件数検証
+        if not math.isfinite(width) or width <= 0 or width > 1000:
+            return Response({
+                'error': 'ルートからの幅は0より大きく1000メートル以下で指定してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not (1 <= limit <= settings.ROUTE_SEARCH_MAX_RESULTS):
+            return Response({
+                'error': f'件数は1～{settings.ROUTE_SEARCH_MAX_RESULTS}の範囲で指定してください'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # データのある範囲外では結果が空になるため、セッションを開かずに返す
+        if not ValidationService.is_route_in_service_area(lats, lngs, width):
+            return Response({
+                'results': [],
+                'count': 0,
+                'search_params': {
+                    'points': len(path),
+                    'width': width,
+                    'limit': limit
+                }
+            }, status=status.HTTP_200_OK)
+        
+        # データベースセッション取得（エンドポイント別の statement_timeout 付き）
+        timeout_ms = deadline_for('search_restaurants_along_route')
+        cache_key = (tuple(stale_key(lat, lng) for lat, lng in path), width, limit)
+        db = next(get_db_session(statement_timeout_ms=timeout_ms))
+        
+        try:
+            # サービス実行
+            service = RestaurantSearchService(db)
+            results = service.search_restaurants_along_route(path, width, limit)
+            
+            response_data = {
+                'results': results,
+                'count': len(results),
+                'search_params': {
+                    'points': len(path),
+                    'width': width,
+                    'limit': limit
+                }
+            }
+            if timeout_ms:
+                stale_results.put('search_restaurants_along_route', cache_key, response_data)
+            
+            return Response(response_data, status=status.HTTP_200_OK)
+            
+        except OperationalError as e:
+            if not is_query_canceled(e):
+                raise
+            return _deadline_exceeded_response('search_restaurants_along_route', cache_key)
+            
+        finally:
+            db.close()
+            
+    except Exception as e:
+        logger.error(f"Route search error: {str(e)}")
+        return Response({
+            'error': 'サーバー内部エラーが発生しました'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
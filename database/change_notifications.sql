@@ -0,0 +1,72 @@
+-- Change Notifications SQL
+-- restaurants / osm_buildings の INSERT・UPDATE・DELETE を NOTIFY で各ワーカーへ通知する
+-- postgis_migration.sql 実行後に適用してください
+-- 受信側: backend_django/restaurants/change_listener.py（チャンネル名を一致させること）
+--
+-- トリガーの引数に親テーブル名を渡す。パーティション化したテーブルでは行トリガーの TG_TABLE_NAME が
+-- パーティション名（osm_buildings_r<cell> など）になり、受信側のテーブル名と一致しなくなるため
+
+CREATE OR REPLACE FUNCTION notify_restaurant_search_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    table_name TEXT := COALESCE(TG_ARGV[0], TG_TABLE_NAME);
+    old_values JSON;
+    new_values JSON;
+    row_key VARCHAR;
+BEGIN
+    IF table_name = 'restaurants' THEN
+        IF TG_OP <> 'INSERT' THEN
+            row_key := OLD.id;
+            old_values := json_build_object(
+                'lat', OLD.lat::float8,
+                'lng', OLD.lng::float8,
+                'rating', OLD.rating::float8,
+                'osm_building_id', OLD.osm_building_id
+            );
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            row_key := NEW.id;
+            new_values := json_build_object(
+                'lat', NEW.lat::float8,
+                'lng', NEW.lng::float8,
+                'rating', NEW.rating::float8,
+                'osm_building_id', NEW.osm_building_id
+            );
+        END IF;
+    ELSE
+        -- osm_buildings: 差分更新に必要なbbox（south, west, north, east）を通知
+        IF TG_OP <> 'INSERT' THEN
+            row_key := OLD.osm_id;
+            old_values := json_build_object(
+                'bbox', json_build_array(ST_YMin(OLD.geometry), ST_XMin(OLD.geometry), ST_YMax(OLD.geometry), ST_XMax(OLD.geometry))
+            );
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            row_key := NEW.osm_id;
+            new_values := json_build_object(
+                'bbox', json_build_array(ST_YMin(NEW.geometry), ST_XMin(NEW.geometry), ST_YMax(NEW.geometry), ST_XMax(NEW.geometry))
+            );
+        END IF;
+    END IF;
+
+    PERFORM pg_notify('restaurant_search_changes', json_build_object(
+        'table', table_name,
+        'op', TG_OP,
+        'key', row_key,
+        'old', old_values,
+        'new', new_values
+    )::text);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_restaurants_notify_change ON restaurants;
+CREATE TRIGGER trg_restaurants_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON restaurants
+    FOR EACH ROW EXECUTE FUNCTION notify_restaurant_search_change('restaurants');
+
+DROP TRIGGER IF EXISTS trg_osm_buildings_notify_change ON osm_buildings;
+CREATE TRIGGER trg_osm_buildings_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON osm_buildings
+    FOR EACH ROW EXECUTE FUNCTION notify_restaurant_search_change('osm_buildings');
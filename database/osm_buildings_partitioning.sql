@@ -0,0 +1,116 @@
+-- OSM Buildings Partitioning SQL
+-- osm_buildings を地域セル（region_cell）でリストパーティション化する移行スクリプト
+-- postgis_migration.sql（および必要に応じて change_notifications.sql）適用済みの単一テーブルから移行する
+--
+-- 地域セル定義: レベル9グリッド（一辺 360 / 2^9 ≒ 0.70度）の (cell_y * 512 + cell_x)
+--   建物はポリゴン上の代表点（ST_PointOnSurface）が属するセルに割り当てる
+--   （backend_django/restaurants/geo_cells.py の region_cell_for_point と同じ定義）
+--
+-- 移行後のデータ投入では region_cell を明示的に指定すること:
+--   INSERT INTO osm_buildings (..., geometry, region_cell)
+--   VALUES (..., ST_GeomFromText('POLYGON(...)', 4326), osm_region_cell(ST_GeomFromText('POLYGON(...)', 4326)))
+--   ON CONFLICT (osm_id, region_cell) DO UPDATE ...
+
+-- 1. 地域セル算出関数
+CREATE OR REPLACE FUNCTION osm_region_cell(p_geometry GEOMETRY)
+RETURNS INTEGER AS $$
+    SELECT (floor((ST_Y(ST_PointOnSurface(p_geometry)) + 90) / (360.0 / 512))::int * 512
+            + floor((ST_X(ST_PointOnSurface(p_geometry)) + 180) / (360.0 / 512))::int)
+$$ LANGUAGE SQL IMMUTABLE STRICT;
+
+-- 2. デフォルトパーティションから1セル分を専用パーティションへ切り出す
+CREATE OR REPLACE FUNCTION split_osm_buildings_partition(p_cell INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    partition_name TEXT := 'osm_buildings_r' || p_cell;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE osm_buildings INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format('INSERT INTO %I SELECT * FROM osm_buildings_p_default WHERE region_cell = %s', partition_name, p_cell);
+    EXECUTE format('DELETE FROM osm_buildings_p_default WHERE region_cell = %s', p_cell);
+    EXECUTE format('ALTER TABLE osm_buildings ATTACH PARTITION %I FOR VALUES IN (%s)', partition_name, p_cell);
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. 単一テーブルからの移行
+BEGIN;
+
+ALTER TABLE osm_buildings RENAME TO osm_buildings_unpartitioned;
+ALTER INDEX IF EXISTS osm_buildings_pkey RENAME TO osm_buildings_unpartitioned_pkey;
+ALTER INDEX IF EXISTS idx_osm_buildings_geom RENAME TO idx_osm_buildings_unpartitioned_geom;
+ALTER INDEX IF EXISTS idx_osm_buildings_type RENAME TO idx_osm_buildings_unpartitioned_type;
+ALTER INDEX IF EXISTS idx_osm_buildings_use RENAME TO idx_osm_buildings_unpartitioned_use;
+ALTER INDEX IF EXISTS idx_osm_buildings_updated_at RENAME TO idx_osm_buildings_unpartitioned_updated_at;
+DROP TRIGGER IF EXISTS trg_osm_buildings_notify_change ON osm_buildings_unpartitioned;
+
+CREATE TABLE osm_buildings (
+    osm_id VARCHAR(50) NOT NULL,
+    name VARCHAR(200),
+    building_type VARCHAR(50),
+    building_levels INTEGER,
+    building_material VARCHAR(50),
+    building_use VARCHAR(50),
+    geometry GEOMETRY(POLYGON, 4326) NOT NULL,
+    geometry_coordinates TEXT,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    region_cell INTEGER NOT NULL,  -- パーティションキー（osm_region_cell(geometry)）
+    PRIMARY KEY (osm_id, region_cell)
+) PARTITION BY LIST (region_cell);
+
+CREATE TABLE osm_buildings_p_default PARTITION OF osm_buildings DEFAULT;
+
+-- 親テーブルに作成したインデックスは各パーティションへ自動作成される
+CREATE INDEX idx_osm_buildings_geom ON osm_buildings USING GIST(geometry);
+CREATE INDEX idx_osm_buildings_type ON osm_buildings (building_type);
+CREATE INDEX idx_osm_buildings_use ON osm_buildings (building_use);
+CREATE INDEX idx_osm_buildings_updated_at ON osm_buildings (updated_at);
+-- get_by_osm_id（セル不明）の検索用
+CREATE INDEX idx_osm_buildings_osm_id ON osm_buildings (osm_id);
+
+-- 既存データのセルごとにパーティションを作成
+DO $$
+DECLARE
+    cell INTEGER;
+BEGIN
+    FOR cell IN SELECT DISTINCT osm_region_cell(geometry) FROM osm_buildings_unpartitioned LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF osm_buildings FOR VALUES IN (%s)', 'osm_buildings_r' || cell, cell);
+    END LOOP;
+END;
+$$;
+
+INSERT INTO osm_buildings (
+    osm_id, name, building_type, building_levels, building_material, building_use,
+    geometry, geometry_coordinates, created_at, updated_at, region_cell
+)
+SELECT
+    osm_id, name, building_type, building_levels, building_material, building_use,
+    geometry, geometry_coordinates, created_at, updated_at, osm_region_cell(geometry)
+FROM osm_buildings_unpartitioned;
+
+-- 変更通知トリガー（change_notifications.sql 適用済みの場合）
+-- 行トリガーはパーティションごとに発火し TG_TABLE_NAME がパーティション名になるため、親テーブル名を引数で渡す
+DO $$
+BEGIN
+    IF to_regproc('notify_restaurant_search_change') IS NOT NULL THEN
+        CREATE TRIGGER trg_osm_buildings_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON osm_buildings
+            FOR EACH ROW EXECUTE FUNCTION notify_restaurant_search_change('osm_buildings');
+    END IF;
+END;
+$$;
+
+COMMIT;
+
+ANALYZE osm_buildings;
+
+-- 4. 確認後に旧テーブルを削除
+-- DROP TABLE osm_buildings_unpartitioned;
+
+-- パーティションプルーニングの確認（Append配下に対象セルのパーティションのみが現れること）
+-- EXPLAIN SELECT osm_id FROM osm_buildings
+-- WHERE region_cell = ANY(ARRAY[osm_region_cell(ST_SetSRID(ST_Point(139.6819, 35.6822), 4326))])
+--   AND ST_Contains(geometry, ST_SetSRID(ST_Point(139.6819, 35.6822), 4326));
@@ -0,0 +1,165 @@
+-- Restaurant Cluster Cells SQL
+-- ズームレベル別マーカークラスタ用の事前集計テーブル
+-- postgis_migration.sql 実行後に適用してください
+--
+-- グリッド定義: レベル L のセル一辺は 360 / 2^L 度
+--   cell_x = floor((lng + 180) / size), cell_y = floor((lat + 90) / size)
+-- （backend_django/restaurants/geo_cells.py と同じ定義。レベル範囲 2..18 も一致させること）
+
+-- 1. 集計テーブル
+CREATE TABLE IF NOT EXISTS restaurant_cluster_cells (
+    level SMALLINT NOT NULL,
+    cell_x INTEGER NOT NULL,
+    cell_y INTEGER NOT NULL,
+    restaurant_count INTEGER NOT NULL DEFAULT 0,
+    lat_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    lng_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    top_restaurants JSONB NOT NULL DEFAULT '[]'::jsonb,  -- 評価上位の代表レストラン
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (level, cell_x, cell_y)
+);
+
+-- 2. セル内の代表レストラン（評価上位5件）を再計算
+--    idx_restaurants_location (lat, lng) の範囲検索で対象を絞り込む
+CREATE OR REPLACE FUNCTION restaurant_cluster_refresh_top(p_level INTEGER, p_cell_x INTEGER, p_cell_y INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    cell_size DOUBLE PRECISION := 360.0 / (2 ^ p_level);
+    west DOUBLE PRECISION := p_cell_x * cell_size - 180;
+    south DOUBLE PRECISION := p_cell_y * cell_size - 90;
+BEGIN
+    UPDATE restaurant_cluster_cells
+    SET top_restaurants = COALESCE((
+        SELECT jsonb_agg(top ORDER BY (top->>'rating')::numeric DESC, top->>'id')
+        FROM (
+            SELECT jsonb_build_object(
+                'id', r.id,
+                'name', r.name,
+                'rating', r.rating::float8,
+                'lat', r.lat::float8,
+                'lng', r.lng::float8
+            ) AS top
+            FROM restaurants r
+            WHERE r.lat >= south AND r.lat < south + cell_size
+              AND r.lng >= west AND r.lng < west + cell_size
+            ORDER BY r.rating DESC, r.id
+            LIMIT 5
+        ) ranked
+    ), '[]'::jsonb)
+    WHERE level = p_level AND cell_x = p_cell_x AND cell_y = p_cell_y;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. 1件のレストラン追加(+1)/削除(-1)を全レベルのセルに反映
+CREATE OR REPLACE FUNCTION restaurant_cluster_apply(p_id VARCHAR, p_lat NUMERIC, p_lng NUMERIC, p_rating NUMERIC, p_delta INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    lvl INTEGER;
+    cell_size DOUBLE PRECISION;
+    cx INTEGER;
+    cy INTEGER;
+    new_count INTEGER;
+    top JSONB;
+BEGIN
+    FOR lvl IN 2..18 LOOP
+        cell_size := 360.0 / (2 ^ lvl);
+        cx := floor((p_lng + 180) / cell_size);
+        cy := floor((p_lat + 90) / cell_size);
+
+        INSERT INTO restaurant_cluster_cells AS c (level, cell_x, cell_y, restaurant_count, lat_sum, lng_sum)
+        VALUES (lvl, cx, cy, p_delta, p_delta * p_lat, p_delta * p_lng)
+        ON CONFLICT (level, cell_x, cell_y) DO UPDATE SET
+            restaurant_count = c.restaurant_count + EXCLUDED.restaurant_count,
+            lat_sum = c.lat_sum + EXCLUDED.lat_sum,
+            lng_sum = c.lng_sum + EXCLUDED.lng_sum,
+            updated_at = NOW()
+        RETURNING c.restaurant_count, c.top_restaurants INTO new_count, top;
+
+        IF new_count <= 0 THEN
+            DELETE FROM restaurant_cluster_cells WHERE level = lvl AND cell_x = cx AND cell_y = cy;
+            CONTINUE;
+        END IF;
+
+        -- 代表レストランが変わり得る場合のみ再計算
+        IF (p_delta > 0 AND (jsonb_array_length(top) < 5 OR p_rating >= (top->-1->>'rating')::numeric))
+           OR (p_delta < 0 AND top @> jsonb_build_array(jsonb_build_object('id', p_id))) THEN
+            PERFORM restaurant_cluster_refresh_top(lvl, cx, cy);
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. restaurants テーブルの書き込みを差分反映するトリガー
+CREATE OR REPLACE FUNCTION restaurant_cluster_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM restaurant_cluster_apply(OLD.id, OLD.lat, OLD.lng, OLD.rating, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM restaurant_cluster_apply(NEW.id, NEW.lat, NEW.lng, NEW.rating, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_restaurant_cluster_insert_delete ON restaurants;
+CREATE TRIGGER trg_restaurant_cluster_insert_delete
+    AFTER INSERT OR DELETE ON restaurants
+    FOR EACH ROW EXECUTE FUNCTION restaurant_cluster_trigger();
+
+DROP TRIGGER IF EXISTS trg_restaurant_cluster_update ON restaurants;
+CREATE TRIGGER trg_restaurant_cluster_update
+    AFTER UPDATE ON restaurants
+    FOR EACH ROW
+    WHEN (OLD.lat IS DISTINCT FROM NEW.lat
+          OR OLD.lng IS DISTINCT FROM NEW.lng
+          OR OLD.rating IS DISTINCT FROM NEW.rating
+          OR OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION restaurant_cluster_trigger();
+
+-- 5. 全件再構築（初期投入・整合性回復用）
+--    python manage.py rebuild_cluster_cells から呼び出される
+CREATE OR REPLACE FUNCTION restaurant_cluster_rebuild()
+RETURNS INTEGER AS $$
+DECLARE
+    cell_total INTEGER;
+BEGIN
+    DELETE FROM restaurant_cluster_cells;
+
+    WITH cells AS (
+        SELECT
+            lvl AS level,
+            floor((r.lng + 180) / (360.0 / (2 ^ lvl)))::int AS cell_x,
+            floor((r.lat + 90) / (360.0 / (2 ^ lvl)))::int AS cell_y,
+            r.id, r.name, r.rating, r.lat, r.lng
+        FROM restaurants r
+        CROSS JOIN generate_series(2, 18) AS lvl
+    ),
+    ranked AS (
+        SELECT cells.*,
+               row_number() OVER (PARTITION BY level, cell_x, cell_y ORDER BY rating DESC, id) AS rank
+        FROM cells
+    )
+    INSERT INTO restaurant_cluster_cells (level, cell_x, cell_y, restaurant_count, lat_sum, lng_sum, top_restaurants)
+    SELECT
+        level, cell_x, cell_y,
+        count(*),
+        sum(lat),
+        sum(lng),
+        COALESCE(
+            jsonb_agg(
+                jsonb_build_object('id', id, 'name', name, 'rating', rating::float8, 'lat', lat::float8, 'lng', lng::float8)
+                ORDER BY rating DESC, id
+            ) FILTER (WHERE rank <= 5),
+            '[]'::jsonb
+        )
+    FROM ranked
+    GROUP BY level, cell_x, cell_y;
+
+    GET DIAGNOSTICS cell_total = ROW_COUNT;
+    RETURN cell_total;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT restaurant_cluster_rebuild();
@@ -0,0 +1,13 @@
+-- Restaurant Route Corridor Index SQL
+-- ルート沿いのレストラン検索（POST /api/search/route/）用の式インデックス
+-- postgis_migration.sql 実行後に適用してください
+--
+-- restaurants は lat / lng の数値列のみのため、geography の点を式インデックスにする。
+-- RestaurantSearchRepository.find_restaurants_along_route の ST_DWithin は
+-- 下記と完全に同じ式を使うこと（式が異なるとインデックスが使われない）。
+
+CREATE INDEX IF NOT EXISTS idx_restaurants_geog
+    ON restaurants
+    USING GIST ((ST_SetSRID(ST_MakePoint(lng::float8, lat::float8), 4326)::geography));
+
+ANALYZE restaurants;
@@ -0,0 +1,99 @@
+-- Restaurant Search Payloads SQL
+-- 検索・詳細APIのレスポンスJSON（レストラン + 建物ポリゴン）を事前構築して保持するテーブル
+-- postgis_migration.sql 実行後に適用してください
+-- 更新は python manage.py refresh_search_payloads（updated_at をキーにした差分更新）
+
+-- 1. 事前構築済みペイロードテーブル
+CREATE TABLE IF NOT EXISTS restaurant_search_payloads (
+    restaurant_id VARCHAR(50) PRIMARY KEY,
+    osm_building_id VARCHAR(50),
+    payload JSON NOT NULL,  -- {"restaurant": {...}, "buildingPolygon": {...} | null}
+    restaurant_updated_at TIMESTAMP,
+    building_updated_at TIMESTAMP,
+    refreshed_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_search_payloads_building ON restaurant_search_payloads (osm_building_id);
+
+-- 差分抽出用インデックス
+CREATE INDEX IF NOT EXISTS idx_restaurants_updated_at ON restaurants (updated_at);
+CREATE INDEX IF NOT EXISTS idx_osm_buildings_updated_at ON osm_buildings (updated_at);
+
+-- 2. 差分更新: p_since 以降に更新されたレストラン・建物に関係する行だけを再構築
+--    p_since が NULL の場合は全件再構築
+--    ペイロード形式は Restaurant.to_dict() / OSMBuilding.to_geojson_feature() と一致させること
+CREATE OR REPLACE FUNCTION restaurant_search_payload_refresh(p_since TIMESTAMP)
+RETURNS INTEGER AS $$
+DECLARE
+    refreshed INTEGER;
+BEGIN
+    WITH changed AS (
+        SELECT r.id FROM restaurants r
+        WHERE p_since IS NULL OR r.updated_at > p_since
+        UNION
+        SELECT r.id FROM osm_buildings b
+        JOIN restaurants r ON r.osm_building_id = b.osm_id
+        WHERE p_since IS NOT NULL AND b.updated_at > p_since
+        UNION
+        -- 建物が削除されたレストラン（ポリゴンを外す）
+        SELECT p.restaurant_id FROM restaurant_search_payloads p
+        WHERE p_since IS NOT NULL AND p.building_updated_at IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM osm_buildings b WHERE b.osm_id = p.osm_building_id)
+    )
+    INSERT INTO restaurant_search_payloads AS p
+        (restaurant_id, osm_building_id, payload, restaurant_updated_at, building_updated_at, refreshed_at)
+    SELECT
+        r.id,
+        r.osm_building_id,
+        json_build_object(
+            'restaurant', json_build_object(
+                'id', r.id,
+                'name', r.name,
+                'address', r.address,
+                'openingHours', r.opening_hours,
+                'rating', r.rating::float8,
+                'lat', r.lat::float8,
+                'lng', r.lng::float8,
+                'osmBuildingId', r.osm_building_id
+            ),
+            'buildingPolygon', CASE WHEN b.osm_id IS NULL THEN NULL ELSE json_build_object(
+                'type', 'Feature',
+                'properties', json_build_object(
+                    'building', COALESCE(b.building_type, 'yes'),
+                    'osm_id', b.osm_id,
+                    'name', b.name,
+                    'building:levels', CASE WHEN b.building_levels <> 0 THEN b.building_levels::text END,
+                    'building:material', b.building_material,
+                    'building:use', b.building_use
+                ),
+                'geometry', json_build_object(
+                    'type', 'Polygon',
+                    'coordinates', COALESCE(ST_AsGeoJSON(b.geometry)::json -> 'coordinates', b.geometry_coordinates::json, '[]'::json)
+                )
+            ) END
+        ),
+        r.updated_at,
+        b.updated_at,
+        NOW()
+    FROM changed
+    JOIN restaurants r ON r.id = changed.id
+    LEFT JOIN osm_buildings b ON b.osm_id = r.osm_building_id
+    ON CONFLICT (restaurant_id) DO UPDATE SET
+        osm_building_id = EXCLUDED.osm_building_id,
+        payload = EXCLUDED.payload,
+        restaurant_updated_at = EXCLUDED.restaurant_updated_at,
+        building_updated_at = EXCLUDED.building_updated_at,
+        refreshed_at = EXCLUDED.refreshed_at;
+
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+    -- 削除されたレストランのペイロードを除去
+    DELETE FROM restaurant_search_payloads p
+    WHERE NOT EXISTS (SELECT 1 FROM restaurants r WHERE r.id = p.restaurant_id);
+
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. 初期構築
+SELECT restaurant_search_payload_refresh(NULL);
@@ -0,0 +1,214 @@
+-- Restaurant Voronoi Cells SQL
+-- 最寄りレストラン検索用のボロノイ図（レストラン位置を母点とする領域分割）
+-- postgis_migration.sql 実行後に適用してください（PostGIS 2.3+ / GEOS 3.5+）
+--
+-- 距離は既存の find_nearest_restaurant と同じ緯度経度平面上のユークリッド距離。
+-- 「座標を含むセルの母点 = 最寄りレストラン」となるため、検索は GIST インデックスによる
+-- 点包含判定1回で済む（NEAREST_RESTAURANT_MODE=voronoi）。
+-- セルはサービス提供範囲（ValidationService の日本の範囲と同じ矩形）で切り取る。
+-- 同一座標のレストランは同じセルを共有し、検索時は restaurant_id の小さい方を返す。
+
+-- 1. セルテーブル
+CREATE TABLE IF NOT EXISTS restaurant_voronoi_cells (
+    restaurant_id VARCHAR(50) PRIMARY KEY,
+    lat DOUBLE PRECISION NOT NULL,  -- 母点（restaurants.lat / lng）
+    lng DOUBLE PRECISION NOT NULL,
+    cell GEOMETRY(GEOMETRY, 4326) NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_restaurant_voronoi_cells_cell ON restaurant_voronoi_cells USING GIST (cell);
+CREATE INDEX IF NOT EXISTS idx_restaurant_voronoi_cells_location ON restaurant_voronoi_cells (lat, lng);
+
+-- 2. サービス提供範囲（セルの切り取り範囲）
+CREATE OR REPLACE FUNCTION restaurant_voronoi_service_area()
+RETURNS GEOMETRY AS $$
+    SELECT ST_MakeEnvelope(123, 24, 146, 46, 4326);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- 3. 1件の母点を追加
+--    新しいセル V は「既存の最寄り母点より p が近い領域」なので、V と重なる既存セルの母点だけで
+--    局所的にボロノイ図を作れば正確に求まる。V が候補セルで覆われるまで候補を広げ、
+--    最後に既存セルから V を差し引く。
+CREATE OR REPLACE FUNCTION restaurant_voronoi_insert(p_id VARCHAR, p_lat DOUBLE PRECISION, p_lng DOUBLE PRECISION)
+RETURNS VOID AS $$
+DECLARE
+    area GEOMETRY := restaurant_voronoi_service_area();
+    p GEOMETRY := ST_SetSRID(ST_Point(p_lng, p_lat), 4326);
+    region GEOMETRY := p;
+    generators GEOMETRY;
+    covered GEOMETRY;
+    new_cell GEOMETRY;
+    generator_count INTEGER;
+    previous_count INTEGER := -1;
+BEGIN
+    IF NOT ST_Intersects(area, p) THEN
+        RETURN;
+    END IF;
+
+    -- 同一座標の母点がある場合はそのセルを共有
+    INSERT INTO restaurant_voronoi_cells (restaurant_id, lat, lng, cell)
+    SELECT p_id, p_lat, p_lng, cell
+    FROM restaurant_voronoi_cells
+    WHERE lat = p_lat AND lng = p_lng
+    LIMIT 1;
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    LOOP
+        SELECT ST_Collect(ST_SetSRID(ST_Point(g.lng, g.lat), 4326)), ST_Union(g.cell), count(*)
+        INTO generators, covered, generator_count
+        FROM (
+            SELECT DISTINCT ON (lat, lng) lat, lng, cell
+            FROM restaurant_voronoi_cells
+            WHERE ST_Intersects(cell, region)
+        ) g;
+
+        IF generator_count = 0 THEN
+            -- 最初の1件はサービス提供範囲全体
+            new_cell := area;
+            EXIT;
+        END IF;
+
+        SELECT ST_Intersection(v.geom, area) INTO new_cell
+        FROM ST_Dump(ST_VoronoiPolygons(ST_Collect(generators, p), 0.0, area)) v
+        WHERE ST_Contains(v.geom, p)
+        LIMIT 1;
+
+        EXIT WHEN ST_Covers(covered, new_cell) OR generator_count = previous_count;
+
+        previous_count := generator_count;
+        region := new_cell;
+    END LOOP;
+
+    UPDATE restaurant_voronoi_cells
+    SET cell = ST_Difference(cell, new_cell),
+        updated_at = NOW()
+    WHERE ST_Intersects(cell, new_cell);
+
+    INSERT INTO restaurant_voronoi_cells (restaurant_id, lat, lng, cell)
+    VALUES (p_id, p_lat, p_lng, new_cell);
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. 1件の母点を削除
+--    削除したセル内の各点の新しい最寄り母点は、そのセルに接するセルの母点のいずれかなので、
+--    隣接母点だけのボロノイ図で削除セルを分割して各隣接セルに併合する。
+CREATE OR REPLACE FUNCTION restaurant_voronoi_delete(p_id VARCHAR)
+RETURNS VOID AS $$
+DECLARE
+    area GEOMETRY := restaurant_voronoi_service_area();
+    old_cell GEOMETRY;
+    old_lat DOUBLE PRECISION;
+    old_lng DOUBLE PRECISION;
+    neighbors GEOMETRY;
+BEGIN
+    DELETE FROM restaurant_voronoi_cells
+    WHERE restaurant_id = p_id
+    RETURNING cell, lat, lng INTO old_cell, old_lat, old_lng;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    -- 同一座標のレストランが残っていればセルはそのまま
+    IF EXISTS (SELECT 1 FROM restaurant_voronoi_cells WHERE lat = old_lat AND lng = old_lng) THEN
+        RETURN;
+    END IF;
+
+    SELECT ST_Collect(ST_SetSRID(ST_Point(g.lng, g.lat), 4326)) INTO neighbors
+    FROM (
+        SELECT DISTINCT lat, lng
+        FROM restaurant_voronoi_cells
+        WHERE ST_Intersects(cell, old_cell)
+    ) g;
+
+    IF neighbors IS NULL THEN
+        RETURN;
+    END IF;
+
+    UPDATE restaurant_voronoi_cells c
+    SET cell = ST_Union(c.cell, ST_Intersection(v.geom, old_cell)),
+        updated_at = NOW()
+    FROM ST_Dump(ST_VoronoiPolygons(neighbors, 0.0, area)) v
+    WHERE ST_Intersects(c.cell, old_cell)
+      AND ST_Contains(v.geom, ST_SetSRID(ST_Point(c.lng, c.lat), 4326));
+END;
+$$ LANGUAGE plpgsql;
+
+-- 5. restaurants テーブルの書き込みを差分反映するトリガー
+--    局所的な再計算同士が競合しないよう、セルの更新はトランザクション単位で直列化する
+--    （大量投入後は restaurant_voronoi_rebuild() で作り直す方が速い）
+CREATE OR REPLACE FUNCTION restaurant_voronoi_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('restaurant_voronoi_cells'));
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM restaurant_voronoi_delete(OLD.id);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM restaurant_voronoi_insert(NEW.id, NEW.lat::float8, NEW.lng::float8);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_restaurant_voronoi_insert_delete ON restaurants;
+CREATE TRIGGER trg_restaurant_voronoi_insert_delete
+    AFTER INSERT OR DELETE ON restaurants
+    FOR EACH ROW EXECUTE FUNCTION restaurant_voronoi_trigger();
+
+DROP TRIGGER IF EXISTS trg_restaurant_voronoi_update ON restaurants;
+CREATE TRIGGER trg_restaurant_voronoi_update
+    AFTER UPDATE ON restaurants
+    FOR EACH ROW
+    WHEN (OLD.id IS DISTINCT FROM NEW.id
+          OR OLD.lat IS DISTINCT FROM NEW.lat
+          OR OLD.lng IS DISTINCT FROM NEW.lng)
+    EXECUTE FUNCTION restaurant_voronoi_trigger();
+
+-- 6. 全件再構築（初期投入・大量更新後・整合性回復用）
+--    python manage.py rebuild_voronoi_cells から呼び出される
+CREATE OR REPLACE FUNCTION restaurant_voronoi_rebuild()
+RETURNS INTEGER AS $$
+DECLARE
+    area GEOMETRY := restaurant_voronoi_service_area();
+    cell_total INTEGER;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('restaurant_voronoi_cells'));
+
+    DELETE FROM restaurant_voronoi_cells;
+
+    WITH generators AS (
+        SELECT DISTINCT r.lat::float8 AS lat, r.lng::float8 AS lng
+        FROM restaurants r
+        WHERE ST_Intersects(area, ST_SetSRID(ST_Point(r.lng::float8, r.lat::float8), 4326))
+    ),
+    voronoi AS (
+        SELECT (ST_Dump(ST_VoronoiPolygons(ST_Collect(ST_SetSRID(ST_Point(lng, lat), 4326)), 0.0, area))).geom AS geom
+        FROM generators
+        HAVING count(*) > 1
+    ),
+    cells AS (
+        SELECT g.lat, g.lng, ST_Intersection(v.geom, area) AS cell
+        FROM voronoi v
+        JOIN generators g ON ST_Contains(v.geom, ST_SetSRID(ST_Point(g.lng, g.lat), 4326))
+        UNION ALL
+        -- 母点が1か所だけの場合は範囲全体
+        SELECT g.lat, g.lng, area
+        FROM generators g
+        WHERE (SELECT count(*) FROM generators) = 1
+    )
+    INSERT INTO restaurant_voronoi_cells (restaurant_id, lat, lng, cell)
+    SELECT r.id, c.lat, c.lng, c.cell
+    FROM cells c
+    JOIN restaurants r ON r.lat::float8 = c.lat AND r.lng::float8 = c.lng;
+
+    GET DIAGNOSTICS cell_total = ROW_COUNT;
+    RETURN cell_total;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT restaurant_voronoi_rebuild();